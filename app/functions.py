@@ -7,174 +7,289 @@ import os
 from dotenv import load_dotenv
 from google.cloud import bigquery
 import datetime
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import yfinance as yf
 
+from src.local_store import sync_replica, read_replica, read_cached_json, write_cached_json
+from src.market_data import read_benchmark, BENCHMARK_TABLE_ID, BENCHMARK_COLUMNS
+from src.preprocessing import DATASET_ID, RAW_TABLE_ID, ENRICHED_TABLE_ID, ENRICHED_COLUMNS, WARMUP_DAYS
+from src.fundamentals import read_latest_snapshots, SUMMARY_COLUMNS
+from src.trading_calendar import closures_between
+from src.resampling import choose_resolution, resample_ohlc, downsample
+from src.schema import compact_dtypes, memory_per_symbol_year
+from src.indicators import BENCHMARK_SYMBOL, add_metrics, calculate_beta
+from profiler import profiled, profiled_cache, timed
+
+PRICE_COLUMNS = ['adjClose', 'change', 'changePercent', 'close', 'date', 'high', 'low', 'open', 'symbol', 'volume']
+
+# The longest bounded range of the page_1 pills. Every bounded range is sliced from one base holding
+# these days, read with WARMUP_DAYS before them so the indicators inside match the full history
+# (see src/preprocessing.py for the tolerance). Unbounded views load the full history instead.
+BOUNDED_RANGE_DAYS = 365
+
+# The base dataset is reloaded at least once per ingestion interval, and sooner when
+# current_watermark sees a new ingestion run; the watermark is checked every WATERMARK_TTL.
+INGESTION_INTERVAL = datetime.timedelta(hours=float(os.getenv('INGESTION_INTERVAL_HOURS', 24)))
+WATERMARK_TTL = datetime.timedelta(minutes=float(os.getenv('WATERMARK_TTL_MINUTES', 15)))
+
+def data_source():
+	# 'raw' computes the indicators from raw_stock_data on every load;
+	# 'enriched' reads them from the enriched_stock_data table built at ingestion time.
+	load_dotenv()
+	if os.getenv('DASHBOARD_DATA_SOURCE', 'raw') == 'enriched':
+		return ENRICHED_TABLE_ID, ENRICHED_COLUMNS
+	return RAW_TABLE_ID, PRICE_COLUMNS + ['timestamp']
 
-@st.cache_data
-def load_data(unit=None):
+# Snapshots are written once a day at ingestion, so the latest ones are re-read at most once per SNAPSHOT_TTL.
+SNAPSHOT_TTL = datetime.timedelta(minutes=float(os.getenv('SNAPSHOT_TTL_MINUTES', 60)))
 
-	load_dotenv()
+# Ticker info is cached per symbol on disk for SUMMARY_TTL and fetched by up to SUMMARY_WORKERS threads.
+SUMMARY_TTL = datetime.timedelta(hours=float(os.getenv('SUMMARY_TTL_HOURS', 12)))
+SUMMARY_WORKERS = 8
+
+# The most points a chart sends to the browser. Longer candle ranges switch to weekly or
+# monthly bars and longer line and area series are downsampled with LTTB.
+CHART_POINT_BUDGET = int(os.getenv('CHART_POINT_BUDGET', 500))
+
+# Charts rendered per page of the page_1 grid; "Load more" adds another page.
+CHART_PAGE_SIZE = int(os.getenv('CHART_PAGE_SIZE', 10))
+
+# Cached candle figures: one per symbol and range for the current and the previous data version.
+FIGURE_CACHE_ENTRIES = int(os.getenv('FIGURE_CACHE_ENTRIES', 1000))
 
+_prefetch_executor = ThreadPoolExecutor(max_workers=SUMMARY_WORKERS)
+_prefetch_lock = threading.Lock()
+_prefetching = set()
+
+@profiled_cache(st.cache_data(ttl=WATERMARK_TTL))
+def current_watermark():
+	"""
+	Syncs the local replicas of the dashboard's source table and of benchmark_data and returns their ingestion watermark.
+
+	Cached for WATERMARK_TTL, so BigQuery is asked for new rows at most that often.
+
+	Returns:
+		str: The latest ingestion timestamp in the replica. It changes whenever a new ingestion run lands.
+	"""
 	project_id = os.getenv('GCP_PROJECT_ID')
+	table_id, columns = data_source()
 
 	# Create the client to interface with BigQuery.
 	client = bigquery.Client(project=project_id)
-	dataset_id = 'stock_data'
-	target_table_id = 'raw_stock_data'
-	target_table_ref = f"{project_id}.{dataset_id}.{target_table_id}"
-
-	query_string = f"""
-		SELECT `adjClose`, `change`, `changePercent`, `close`, `date`, `high`, `low`, `open`, `symbol`, `volume`
-		FROM `{target_table_ref}`
-		"""
-
-	query_job = client.query(query_string)
-	results = query_job.result()
-	df = pd.DataFrame([dict(row) for row in results])
-	start_date = df['date'].min()
-	end_date = df['date'].max() + datetime.timedelta(days=1)
-	print(f"start_date: {start_date}\nend_date: {end_date}")
-	sp = get_sp500_historical_prices(start_date, end_date)
-	df = pd.concat([df, sp])
+	sync_replica(client, f"{project_id}.{DATASET_ID}.{table_id}", table_id, columns)
+	sync_replica(client, f"{project_id}.{DATASET_ID}.{BENCHMARK_TABLE_ID}", BENCHMARK_TABLE_ID, BENCHMARK_COLUMNS)
 
-	df = add_metrics(df)
-	df = calculate_beta(df)
-	df['date'] = pd.to_datetime(df['date'])
+	watermarks = [read_replica(name, columns=['timestamp'])['timestamp'].max() for name in [table_id, BENCHMARK_TABLE_ID]]
+	return '|'.join(str(watermark) for watermark in watermarks)
 
-	vix_df = get_historical_vix(start_date, end_date)
+@profiled_cache(st.cache_resource(ttl=INGESTION_INTERVAL, max_entries=4))
+def load_base_data(watermark, window_days=None):
+	"""
+	Loads the history shared by every page and range: the full history, or its last window_days.
 
-	if unit:
-		df = df.loc[df['date'] > df['date'].max() - datetime.timedelta(unit)]
-		vix_df = vix_df.loc[vix_df['date'] > vix_df['date'].max() - datetime.timedelta(unit)]
+	With window_days, only that window plus the indicator warm-up is read from the replica, so the
+	cost follows the window rather than the length of the history.
+	Keyed by the ingestion watermark, so a new ingestion run invalidates it. The same objects are
+	returned to every session without copying; treat them as read-only and use load_data for views.
+	Both frames use the compact dtypes of src/schema.py: a categorical symbol, datetime64 dates,
+	integer volumes and PRICE_FLOAT_DTYPE prices and indicators.
+
+	Args:
+		watermark (str): The value returned by current_watermark.
+		window_days (int, optional): The number of days to load. None loads the full history.
+
+	Returns:
+		tuple: The price DataFrame with all indicator columns, and the VIX DataFrame.
+	"""
+	table_id, _ = data_source()
+
+	if table_id == ENRICHED_TABLE_ID:
+		df = read_enriched_data(window_days)
+	else:
+		df = compute_enriched_data(window_days)
+
+	original_size = memory_per_symbol_year(df)
+	df = compact_dtypes(df)
+	logging.info(
+		f"(load_base_data) {len(df):,} rows of {df['symbol'].nunique()} symbols in "
+		f"{df.memory_usage(deep=True).sum() / 2**20:.1f} MiB: {memory_per_symbol_year(df) / 1024:.1f} KiB "
+		f"per symbol-year, down from {original_size / 1024:.1f} KiB"
+	)
+
+	start_date = df['date'].min()
+	end_date = df['date'].max() + datetime.timedelta(days=1)
+	vix_df = compact_dtypes(read_benchmark('^VIX', start_date, end_date)[['date', 'open', 'high', 'low', 'close']])
 
 	return df, vix_df
 
-def get_sp500_historical_prices(start_date, end_date):
+@profiled
+def load_data(unit=None, watermark=None):
 	"""
-	Fetch historical S&P 500 prices using yfinance.
-	
+	Returns the price and VIX data for the last unit days.
+
 	Args:
-		start_date (str): Start date in the format 'YYYY-MM-DD'.
-		end_date (str): End date in the format 'YYYY-MM-DD'.
-	
+		unit (int, optional): The number of days to keep. None keeps the full history.
+		watermark (str, optional): The data version to load, as returned by current_watermark.
+								   Defaults to the current one.
+
 	Returns:
-		pd.DataFrame: Historical price data for the S&P 500.
+		tuple: The price DataFrame and the VIX DataFrame. With unit=None these are the shared base
+			   objects of load_base_data and must not be modified in place.
 	"""
-	# Define the S&P 500 ticker
-	sp500_ticker = "^GSPC"
-	
-	# Fetch the data
-	sp500_data = yf.download(sp500_ticker, start=start_date, end=end_date)
-	sp500_data['symbol'] = sp500_ticker
+	# Bounded ranges share the BOUNDED_RANGE_DAYS base; only unbounded views need the full history.
+	window_days = BOUNDED_RANGE_DAYS if unit and unit <= BOUNDED_RANGE_DAYS else None
+	df, vix_df = load_base_data(watermark or current_watermark(), window_days)
 
-	if isinstance(sp500_data.columns, pd.MultiIndex):
-		sp500_data.columns = sp500_data.columns.get_level_values(0)
-	
-	sp500_data = sp500_data.reset_index()
-	sp500_data.columns = sp500_data.columns.str.lower()
-	sp500_data = sp500_data.rename(columns={'adj close': 'adjClose'})
-	sp500_data['change'] = sp500_data['close'].diff().bfill()
-	sp500_data['date'] = sp500_data['date'].dt.strftime('%Y-%m-%d')
-	
-	return sp500_data
-
-def get_historical_vix(start_date, end_date):
-	ticker = yf.Ticker('^VIX')
-	vix_df = pd.DataFrame(ticker.history(start=start_date, end=end_date)).reset_index()
-	vix_df = vix_df.drop(columns=['Volume', 'Dividends', 'Stock Splits'])
-	vix_df.columns = vix_df.columns.str.lower()
-	return vix_df
+	if unit:
+		df = df.loc[df['date'] > df['date'].max() - datetime.timedelta(unit)]
+		vix_df = vix_df.loc[vix_df['date'] > vix_df['date'].max() - datetime.timedelta(unit)]
 
-@st.cache_data
-def get_ticker_summary(symbols):
+	return df, vix_df
 
-	cols_to_keep = [
-		'symbol', 'shortName', 'beta', 'trailingPE', 'forwardPE', 'fiftyTwoWeekLow', 'fiftyTwoWeekHigh', 'priceToSalesTrailing12Months', 'profitMargins',
-		'trailingEps', 'forwardEps', 'currentPrice', 'targetHighPrice', 'targetLowPrice', 'targetMeanPrice', 'targetMedianPrice',
-		'recommendationKey', 'earningsGrowth', 'revenueGrowth'
-	]
+def compute_enriched_data(window_days=None):
+	# Compute the indicators and betas from the raw_stock_data and benchmark_data replicas.
+	# With window_days, only the window plus WARMUP_DAYS is read and the warm-up rows are dropped after.
+	start = window_start(RAW_TABLE_ID, window_days)
+	filters = [('date', '>', start - datetime.timedelta(WARMUP_DAYS))] if start else None
+	with timed('read_replica'):
+		df = read_replica(RAW_TABLE_ID, columns=PRICE_COLUMNS, filters=filters)
 
-	summary_list = []
+	start_date = df['date'].min()
+	end_date = df['date'].max() + datetime.timedelta(days=1)
+	print(f"start_date: {start_date}\nend_date: {end_date}")
+	sp = read_benchmark(BENCHMARK_SYMBOL, start_date, end_date)
+	df = pd.concat([df, sp])
 
-	for symbol in symbols:
-		ticker = yf.Ticker(symbol)
-		summary_list.append(ticker.info)
-	df = pd.DataFrame(summary_list)[cols_to_keep]
-	#df['impliedReturn'] = round((df['targetMeanPrice'] - df['currentPrice']) / df['currentPrice'], 2)
-	df['impliedReturn'] = (df['targetMeanPrice'] - df['currentPrice']) / df['currentPrice']
-	
-	return df
+	with timed('add_metrics'):
+		df = add_metrics(df)
+	with timed('calculate_beta'):
+		df = calculate_beta(df)
 
-def add_metrics(df):
+	if start:
+		df = df.loc[df['date'] > pd.Timestamp(start)]
 
-	metrics_list = []
-	groups = df.groupby('symbol')
+	return df
 
-	# Iterate through each symbol and calculate metrics.
-	for _, group in groups:
+def read_enriched_data(window_days=None):
+	# Read the indicators and betas precomputed by src/preprocessing.py; no warm-up is needed.
+	start = window_start(ENRICHED_TABLE_ID, window_days)
+	filters = [('date', '>', start)] if start else None
+	df = read_replica(ENRICHED_TABLE_ID, filters=filters)
 
-		group = group.sort_values(by='date')#.copy()
+	return df.drop(columns=['timestamp'])
 
-		# Add gain, loss and changePercent.
-		g1 = calculate_gain_loss(group)
+def window_start(replica_name, window_days=None):
+	# The date before the last window_days of the replica, or None for the full history.
+	if not window_days:
+		return None
+	last_date = read_replica(replica_name, columns=['date'])['date'].max()
+	return pd.Timestamp(last_date).date() - datetime.timedelta(window_days)
 
-		# Add RSI
-		g2 = calculate_rsi(g1)
+@profiled_cache(st.cache_data(ttl=SNAPSHOT_TTL))
+def load_snapshots():
+	"""
+	Loads the latest ticker info and recommendation snapshot of every symbol from BigQuery.
 
-		# Add MACD
-		g3 = calculate_macd(g2)
+	Returns:
+		pd.DataFrame: One row per symbol with the SUMMARY_COLUMNS, impliedReturn and a 'recommendations' column.
+					  Empty if the snapshot tables cannot be read.
+	"""
+	load_dotenv()
+	project_id = os.getenv('GCP_PROJECT_ID')
 
-		# Append the enriched dataframe to the metrics_list.
-		metrics_list.append(g3)
+	try:
+		client = bigquery.Client(project=project_id)
+		df = read_latest_snapshots(client, project_id, DATASET_ID)
+	except Exception as e:
+		logging.warning(f"Could not read the ticker snapshots: {e}")
+		df = pd.DataFrame(columns=SUMMARY_COLUMNS + ['recommendations'])
 
-	return pd.concat(metrics_list)
+	df['impliedReturn'] = (df['targetMeanPrice'] - df['currentPrice']) / df['currentPrice']
 
-def calculate_gain_loss(df):
-	df['gain'] = np.where(df['change'] > 0, df['change'], 0)
-	df['loss'] = np.abs(np.where(df['change'] < 0, df['change'], 0))
-	df['changePercent'] = df['close'].pct_change().fillna(0)
 	return df
 
-def calculate_rsi(df):
-
-	average_gain = df['gain'].ewm(span=14, adjust=False).mean()
-	average_loss = df['loss'].ewm(span=14, adjust=False).mean()
-	rs = average_gain / (average_loss + 1e-10)
-	rsi = 100 - (100 / (1 + rs))
-	df['rsi'] = rsi
-	return df
+def get_ticker_info(symbol):
+	"""
+	Returns yfinance's info for one symbol from its own cache entry, refreshing it once it is older than SUMMARY_TTL.
 
-def calculate_macd(df):
+	If the refresh fails, the stale entry is used when there is one.
+	"""
+	name = f"ticker_info/{symbol}"
+	info = read_cached_json(name, SUMMARY_TTL)
+	if info is not None:
+		return info
+
+	try:
+		info = yf.Ticker(symbol).info
+		info.setdefault('symbol', symbol)
+		write_cached_json(name, info)
+	except Exception as e:
+		logging.warning(f"Could not retrieve ticker info for {symbol}: {e}")
+		info = read_cached_json(name) or {'symbol': symbol}
+
+	return info
+
+@profiled
+def get_ticker_summary(symbols):
+	# Look the symbols up in parallel; cached symbols cost a local file read.
+	with ThreadPoolExecutor(max_workers=max(1, min(SUMMARY_WORKERS, len(symbols)))) as executor:
+		summary_list = list(executor.map(get_ticker_info, symbols))
 
-	fast = df['close'].ewm(span=12, adjust=False).mean()
-	slow = df['close'].ewm(span=26, adjust=False).mean()
-	df['macd'] = fast - slow
-	df['signal'] = df['macd'].ewm(span=9, adjust=False).mean()
-	df['macdHist'] = df['macd'] - df['signal']
+	df = pd.DataFrame(summary_list).reindex(columns=SUMMARY_COLUMNS)
+	#df['impliedReturn'] = round((df['targetMeanPrice'] - df['currentPrice']) / df['currentPrice'], 2)
+	df['impliedReturn'] = (df['targetMeanPrice'] - df['currentPrice']) / df['currentPrice']
+	
 	return df
 
-def calculate_beta(df):
-	df['date'] = pd.to_datetime(df['date'])
-	groups = df.groupby('symbol')
-	sp_data = groups.get_group('^GSPC')[['date', 'changePercent']].set_index('date')
+def prefetch_ticker_summaries(symbols):
+	# Warm the cache entries of the other symbols in the background, without blocking the page.
+	with _prefetch_lock:
+		for symbol in symbols:
+			if symbol not in _prefetching:
+				_prefetching.add(symbol)
+				future = _prefetch_executor.submit(get_ticker_info, symbol)
+				future.add_done_callback(lambda _, symbol=symbol: _prefetching.discard(symbol))
+
+@profiled_cache(st.cache_resource(ttl=INGESTION_INTERVAL, max_entries=FIGURE_CACHE_ENTRIES))
+def candle_figure(symbol, unit, watermark, _groups, _sp_growth):
+	"""
+	Returns the plot_candles figure of one symbol, built once per symbol, range and data version.
 
-	results = []
-	for _, group in groups:
+	Reruns that don't change the data reuse the cached figure, so they only pay for serialising it.
+	The underscored arguments are not hashed; they must be the data load_data returned for unit
+	at this watermark.
 
-		symbol_data = group[['date', 'changePercent']].set_index('date')
-		joined = symbol_data.join(sp_data, rsuffix='_sp')
-		sevenDayBeta = (joined['changePercent'].rolling(window=7).cov(joined['changePercent_sp']) / joined['changePercent_sp'].rolling(window=7).var()).bfill()
-		group['sevenDayBeta'] = sevenDayBeta.values
-		#group['sevenDayBetaCentered'] = group['sevenDayBeta'] - group['sevenDayBeta'].mean()
-		results.append(group)
-	
-	return pd.concat(results)
+	Args:
+		symbol (str): The stock symbol.
+		unit (int): The range passed to load_data.
+		watermark (str): The value returned by current_watermark.
+		_groups (DataFrameGroupBy): The range's price data grouped by symbol.
+		_sp_growth (pd.DataFrame): The range's S&P 500 'date' and 'changePercent' columns.
 
-def plot_candles(df, symbol, sp_growth):
+	Returns:
+		go.Figure: The shared figure. Do not modify it.
+	"""
+	return plot_candles(_groups.get_group(symbol), symbol, _sp_growth)
+
+def session_rangebreaks(dates):
+	# Hide weekends and exchange closures so a date axis runs from one session to the next.
+	if dates.empty:
+		return []
+	closures = closures_between(dates.min(), dates.max())
+	return [
+		dict(bounds=['sat', 'mon']),
+		dict(values=[day.isoformat() for day in closures])
+	]
+
+@profiled
+def plot_candles(df, symbol, sp_growth, budget=CHART_POINT_BUDGET):
 
-	df['date'] = df['date'].dt.strftime('%Y-%m-%d')
-	sp_growth['date'] = pd.to_datetime(sp_growth['date'])
-	sp_growth['date'] = sp_growth['date'].dt.strftime('%Y-%m-%d')
+	# Resample long ranges to weekly or monthly bars, the S&P 500 line with them.
+	rule = choose_resolution(len(df), budget)
+	df = resample_ohlc(df, rule)
+	sp_growth = resample_ohlc(sp_growth, rule)
 
 	fig = make_subplots(
 		rows=4,
@@ -264,12 +379,8 @@ def plot_candles(df, symbol, sp_growth):
 		)
 	
 	fig.update_xaxes(
-		rangebreaks=[
-			dict(
-				bounds=['sat', 'mon']
-			)
-		],
-		type='category',
+		rangebreaks=session_rangebreaks(df['date']),
+		type='date',
 		tickangle=-45,
 		tickformat='%Y-%m-%d'
 	)
@@ -347,18 +458,21 @@ def plot_candles(df, symbol, sp_growth):
 
 	return fig
 
-def plot_vs_sp(df, symbols=None):
+@profiled
+def plot_vs_sp(df, symbols=None, budget=CHART_POINT_BUDGET):
 
 	#df = df.loc[df['symbol'] == '^GSPC']
 
 	fig = go.Figure()
 
-	for symbol, group in df.groupby('symbol'):
+	for symbol, group in df.groupby('symbol', observed=True):
+
+		growth = downsample(group[['date']].assign(growth=group['changePercent'].cumsum()), 'growth', budget)
 
 		fig.add_trace(
 			go.Scatter(
-				x=group['date'],
-				y=group['changePercent'].cumsum(),
+				x=growth['date'],
+				y=growth['growth'],
 				name=symbol
 			)
 		)
@@ -389,6 +503,7 @@ def plot_vs_sp(df, symbols=None):
 
 	return fig
 
+@profiled
 def plot_target_price(keys, values):
 	fig = go.Figure()
 	fig.add_trace(
@@ -429,7 +544,9 @@ def plot_target_price(keys, values):
 
 	return fig
 
-def plot_vix(vix_df):
+@profiled
+def plot_vix(vix_df, budget=CHART_POINT_BUDGET):
+	vix_df = downsample(vix_df, 'close', budget)
 	fig = go.Figure()
 	fig.add_trace(go.Scatter(
 		x=vix_df['date'],
@@ -439,6 +556,7 @@ def plot_vix(vix_df):
 	))
 	return fig
 
+@profiled
 def plot_recommendations(df):
 
 	fig = go.Figure()
@@ -463,10 +581,12 @@ def plot_recommendations(df):
 
 	return fig
 
-def plot_centered_scatter(df, column):
+@profiled
+def plot_centered_scatter(df, column, budget=CHART_POINT_BUDGET):
 	
 	df = df.copy()
 	df[f"{column}Centered"] = df[column] - df[column].mean()
+	df = downsample(df, f"{column}Centered", budget)
 
 	df_above = df.copy()
 	df_above[f"{column}Centered"] = df_above[f"{column}Centered"].clip(lower=0)
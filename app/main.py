@@ -1,8 +1,11 @@
 import streamlit as st
 
+from profiler import start_profile, render_profile
+
 
 def main():
     st.set_page_config(page_title="Stock Portfolio Dashboard", layout="wide")
+    start_profile()
 
     st.title('Stock Portfolio Dashboard')
 
@@ -13,5 +16,7 @@ def main():
 
     pg.run()
 
+    render_profile()
+
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -32,14 +32,30 @@ elif selected_unit == '1 Year':
 else:
 	unit = None
 
-df, vix_df = load_data(unit)
-sp_growth = df.loc[df['symbol'] == '^GSPC'][['date', 'changePercent']].copy()
+watermark = current_watermark()
+df, vix_df = load_data(unit, watermark)
+sp_growth = df.loc[df['symbol'] == '^GSPC', ['date', 'changePercent']]
 
-groups = df.groupby('symbol')
+groups = df.groupby('symbol', observed=True)
 
 symbols_list = df['symbol'].unique()
 
-num_rows = math.ceil(len(symbols_list) / 2)
+# Only the visible pages of the grid are built; each "Load more" click adds CHART_PAGE_SIZE charts.
+if 'charts_shown' not in st.session_state:
+	st.session_state['charts_shown'] = CHART_PAGE_SIZE
+
+def load_more():
+	st.session_state['charts_shown'] += CHART_PAGE_SIZE
+
+visible_symbols = symbols_list[:st.session_state['charts_shown']]
+
+# Each chart is its own fragment, so interacting with one only reruns that chart.
+@st.fragment
+def candle_chart(symbol):
+	with st.container(border=True):
+		st.plotly_chart(candle_figure(symbol, unit, watermark, groups, sp_growth), key=f"candles_{symbol}")
+
+num_rows = math.ceil(len(visible_symbols) / 2)
 
 # Create grid
 for row in range(num_rows):
@@ -48,18 +64,16 @@ for row in range(num_rows):
 	
 	# First item in row
 	with col1:
-		with st.container(border=True):
-			if row * 2 < len(symbols_list):
-				symbol = symbols_list[row * 2]
-				group = groups.get_group(symbol).copy()
-				st.plotly_chart(plot_candles(group, symbol, sp_growth))
+		if row * 2 < len(visible_symbols):
+			candle_chart(visible_symbols[row * 2])
 	
 	# Second item in row (if exists)
 	with col2:
-		with st.container(border=True):
-			if row * 2 + 1 < len(symbols_list):
-				symbol = symbols_list[row * 2 + 1]
-				group = groups.get_group(symbol).copy()
-				st.plotly_chart(plot_candles(group, symbol, sp_growth))
+		if row * 2 + 1 < len(visible_symbols):
+			candle_chart(visible_symbols[row * 2 + 1])
+
+st.caption(f"Showing {len(visible_symbols)} of {len(symbols_list)} symbols")
+if len(visible_symbols) < len(symbols_list):
+	st.button('Load more', on_click=load_more)
 
 st.table(df.head())
@@ -21,9 +21,6 @@ symbols = price_df['symbol'].unique().tolist()
 symbols.remove('^GSPC')
 selected_symbol = st.selectbox(label='Select a stock symbol', options=symbols)
 
-# Retrieve stock summary info from Yahoo Finance (yfinance)
-ticker = yf.Ticker(selected_symbol)
-
 # Create a layout for the top row.
 r1c1, r1c2, r1c3, r1c4, r1c5 = st.columns([.3, .15, .15, .15, .15,])
 
@@ -31,9 +28,14 @@ r1c1, r1c2, r1c3, r1c4, r1c5 = st.columns([.3, .15, .15, .15, .15,])
 selected_symbols = [selected_symbol, '^GSPC']
 df_filtered = price_df.loc[price_df['symbol'].isin(selected_symbols)].copy()
 
-# Load stock summary data into a dataframe.
-summary_df = get_ticker_summary(symbols)
-summary_df_filtered = summary_df.loc[summary_df['symbol'] == selected_symbol]
+# Load the stock summary from the daily snapshots. Symbols without one yet fall back to
+# Yahoo Finance (yfinance), warming the cache of the other missing symbols in the background.
+snapshots_df = load_snapshots()
+summary_df_filtered = snapshots_df.loc[snapshots_df['symbol'] == selected_symbol]
+if summary_df_filtered.empty:
+	summary_df = get_ticker_summary([selected_symbol])
+	summary_df_filtered = summary_df.loc[summary_df['symbol'] == selected_symbol]
+	prefetch_ticker_summaries([symbol for symbol in symbols if symbol not in set(snapshots_df['symbol'])])
 
 # Add metrics across the top of the dashboard.
 with r1c1:
@@ -74,7 +76,11 @@ with r2c1:
 
 with r2c2:
 	with st.container(border=True):
-		reco_df = pd.DataFrame(ticker.recommendations)
+		recommendations = summary_df_filtered['recommendations'].values[0] if 'recommendations' in summary_df_filtered else None
+		if recommendations is not None and len(recommendations) > 0:
+			reco_df = pd.DataFrame(list(recommendations))
+		else:
+			reco_df = pd.DataFrame(yf.Ticker(selected_symbol).recommendations)
 		reco_df_pivot = reco_df.set_index('period').T.iloc[:, 0]
 		st.plotly_chart(plot_recommendations(reco_df_pivot))
 
@@ -0,0 +1,127 @@
+import streamlit as st
+import pandas as pd
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+import datetime
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+# Opt-in timing of the dashboard's hot path: set DASHBOARD_PROFILE=1 or open a page with ?profile=1.
+# Every rerun's timings are shown in a sidebar panel and appended to PROFILE_LOG as one JSON line.
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+# Imported before any src module, so the .env file is loaded here too.
+load_dotenv()
+PROFILE_LOG = os.getenv('DASHBOARD_PROFILE_LOG', os.path.join(project_root, 'data', 'profile', 'dashboard.jsonl'))
+
+# The records of the calls in progress; a cached function's body marks its record as a miss.
+_open = threading.local()
+
+
+def profiling():
+	# Only the script thread of a session with profiling switched on records anything.
+	if get_script_run_ctx(suppress_warning=True) is None:
+		return False
+	return st.session_state.get('_profile_enabled', False)
+
+
+def start_profile():
+	# Called at the top of every full rerun: decides whether this rerun is profiled and resets its records.
+	enabled = os.getenv('DASHBOARD_PROFILE', '').lower() not in ('', '0', 'false') or st.query_params.get('profile') == '1'
+	st.session_state['_profile_enabled'] = enabled
+	st.session_state['_profile_records'] = []
+	st.session_state['_profile_started'] = time.perf_counter()
+
+
+@contextmanager
+def timed(name, cached=False):
+	# Times a block of the current rerun. Records are kept in call order, nested calls indented by depth.
+	if not profiling():
+		yield None
+		return
+
+	if not hasattr(_open, 'stack'):
+		_open.stack = []
+	record = {'step': name, 'ms': None, 'cache': 'hit' if cached else None, 'depth': len(_open.stack)}
+	st.session_state.setdefault('_profile_records', []).append(record)
+	_open.stack.append(record)
+	start = time.perf_counter()
+	try:
+		yield record
+	finally:
+		record['ms'] = (time.perf_counter() - start) * 1000
+		_open.stack.pop()
+
+
+def profiled(fn):
+	# Times every call of fn in the current rerun.
+	@functools.wraps(fn)
+	def wrapper(*args, **kwargs):
+		with timed(fn.__name__):
+			return fn(*args, **kwargs)
+
+	return wrapper
+
+
+def profiled_cache(cache):
+	"""
+	Applies a Streamlit cache decorator and records whether each call was a cache hit or miss.
+
+	Use it in place of the cache decorator:
+
+		@profiled_cache(st.cache_data(ttl=WATERMARK_TTL))
+		def current_watermark(): ...
+
+	Args:
+		cache (callable): The decorator returned by st.cache_data(...) or st.cache_resource(...).
+
+	Returns:
+		callable: A decorator producing the cached function, timed when profiling is on.
+	"""
+	def decorator(fn):
+		@functools.wraps(fn)
+		def body(*args, **kwargs):
+			# Only runs on a cache miss.
+			stack = getattr(_open, 'stack', None)
+			if stack and stack[-1]['step'] == fn.__name__:
+				stack[-1]['cache'] = 'miss'
+			return fn(*args, **kwargs)
+
+		cached = cache(body)
+
+		@functools.wraps(fn)
+		def wrapper(*args, **kwargs):
+			with timed(fn.__name__, cached=True):
+				return cached(*args, **kwargs)
+
+		wrapper.clear = cached.clear
+		return wrapper
+
+	return decorator
+
+
+def render_profile():
+	# Called at the end of every full rerun: shows the rerun's records in the sidebar and logs them.
+	if not profiling():
+		return
+
+	records = st.session_state.get('_profile_records', [])
+	total = time.perf_counter() - st.session_state.get('_profile_started', time.perf_counter())
+
+	df = pd.DataFrame(records, columns=['step', 'ms', 'cache', 'depth'])
+	df['step'] = ['\u2003' * depth + step for step, depth in zip(df['step'], df['depth'])]
+
+	with st.sidebar.expander('Profile', expanded=True):
+		st.metric('Rerun', f"{total * 1000:,.0f} ms")
+		st.dataframe(df.drop(columns=['depth']), hide_index=True, width='stretch')
+
+	os.makedirs(os.path.dirname(PROFILE_LOG), exist_ok=True)
+	with open(PROFILE_LOG, 'a') as f:
+		f.write(json.dumps({
+			'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+			'rerun_ms': total * 1000,
+			'records': records,
+		}) + '\n')
@@ -0,0 +1,52 @@
+"""
+Reports the memory of the dashboard's cached price frame per symbol-year, before and after compact_dtypes.
+
+	python -m benchmarks.bench_dtypes --symbols 50 500 --days 1250
+
+The frame is built the way load_base_data builds it: synthetic prices plus ^GSPC, with add_metrics
+and calculate_beta applied. Also times compact_dtypes and checks the largest absolute float32
+error on the price and indicator columns.
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.bench_indicators import price_frame
+from benchmarks.common import measure, format_row
+from src.indicators import BENCHMARK_SYMBOL, add_metrics, calculate_beta
+from src.schema import compact_dtypes, memory_per_symbol_year
+
+
+def enriched_frame(symbols, days):
+	df = price_frame(symbols, days)
+	benchmark = price_frame(1, days)
+	benchmark['symbol'] = BENCHMARK_SYMBOL
+	df = pd.concat([df, benchmark], ignore_index=True)
+	return calculate_beta(add_metrics(df))
+
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument('--symbols', type=int, nargs='+', default=[50, 500])
+	parser.add_argument('--days', type=int, default=1250)
+	parser.add_argument('--repeat', type=int, default=3)
+	args = parser.parse_args()
+
+	for symbols in args.symbols:
+		df = enriched_frame(symbols, args.days)
+		rows = len(df)
+
+		print(f"{symbols:,} symbols x {args.days} days ({rows:,} rows)")
+		print(f"  {'as loaded':<26} {memory_per_symbol_year(df) / 1024:>8.1f} KiB per symbol-year")
+		for float_dtype in ['float64', 'float32']:
+			stats = measure(lambda frame: compact_dtypes(frame, float_dtype), repeat=args.repeat, setup=df.copy)
+			compact = stats['result']
+			floats = df.select_dtypes('float').columns
+			error = np.nanmax(np.abs(compact[floats].to_numpy(dtype=float) - df[floats].to_numpy(dtype=float)))
+			print(f"  {float_dtype:<26} {memory_per_symbol_year(compact) / 1024:>8.1f} KiB per symbol-year, max error {error:.2e}")
+			print(format_row(f"  compact_dtypes {float_dtype}", rows, stats))
+
+
+if __name__ == '__main__':
+	main()
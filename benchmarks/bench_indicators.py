@@ -0,0 +1,62 @@
+"""
+Compares the vectorised add_metrics with the per-symbol loop it replaced.
+
+	python -m benchmarks.bench_indicators --symbols 10 500 5000 --days 250
+"""
+import argparse
+
+import pandas as pd
+
+from benchmarks.common import measure, format_row
+from benchmarks.synthetic import historical_rows
+from src.indicators import add_metrics, calculate_gain_loss, calculate_rsi, calculate_macd
+
+INDICATOR_COLUMNS = ['gain', 'loss', 'changePercent', 'rsi', 'macd', 'signal', 'macdHist']
+
+
+def add_metrics_loop(df):
+	# The previous implementation: one sort and three indicator calls per symbol.
+	metrics_list = []
+	for _, group in df.groupby('symbol'):
+		group = group.sort_values(by='date')
+		metrics_list.append(calculate_macd(calculate_rsi(calculate_gain_loss(group))))
+	return pd.concat(metrics_list)
+
+
+def price_frame(symbols, days):
+	frames = []
+	for i in range(symbols):
+		frame = pd.DataFrame(historical_rows(f"SYM{i}", days=days))
+		frame['symbol'] = f"SYM{i}"
+		frames.append(frame)
+	df = pd.concat(frames, ignore_index=True)
+	df['date'] = pd.to_datetime(df['date']).dt.date
+	return df
+
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument('--symbols', type=int, nargs='+', default=[10, 500, 5000])
+	parser.add_argument('--days', type=int, default=250)
+	parser.add_argument('--repeat', type=int, default=3)
+	args = parser.parse_args()
+
+	for symbols in args.symbols:
+		df = price_frame(symbols, args.days)
+		rows = len(df)
+
+		loop = measure(add_metrics_loop, repeat=args.repeat, setup=df.copy)
+		vectorised = measure(add_metrics, repeat=args.repeat, setup=df.copy)
+
+		pd.testing.assert_frame_equal(
+			loop['result'].sort_index()[INDICATOR_COLUMNS],
+			vectorised['result'].sort_index()[INDICATOR_COLUMNS],
+		)
+
+		print(f"{symbols:,} symbols x {args.days} days ({rows:,} rows)")
+		print(format_row('  per-symbol loop', rows, loop))
+		print(format_row('  vectorised', rows, vectorised, f"{loop['median'] / vectorised['median']:>6.1f}x faster"))
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,54 @@
+"""
+Compares the JSON and Parquet staging paths of process_data_batch, without uploading anything.
+
+	python -m benchmarks.bench_load_formats --symbols 500 --days 250
+"""
+import argparse
+import copy
+import io
+import json
+from datetime import datetime, timezone
+
+import pyarrow.parquet as pq
+
+from benchmarks.common import measure, format_row
+from benchmarks.synthetic import historical_payload
+from src.data_ingestion import build_arrow_table
+
+
+def json_payload(responses, timestamp):
+	# What stage_json and load_table_from_json do before the upload.
+	rows = []
+	for response in responses:
+		for data in response['historical']:
+			data['symbol'] = response['symbol']
+			data['timestamp'] = timestamp.isoformat()
+		rows.extend(response['historical'])
+	return '\n'.join(json.dumps(row, ensure_ascii=False) for row in rows).encode()
+
+
+def parquet_payload(responses, timestamp):
+	# What stage_parquet does before the upload.
+	buffer = io.BytesIO()
+	pq.write_table(build_arrow_table(responses, timestamp), buffer, compression='snappy')
+	return buffer.getvalue()
+
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument('--symbols', type=int, default=500)
+	parser.add_argument('--days', type=int, default=250)
+	parser.add_argument('--repeat', type=int, default=5)
+	args = parser.parse_args()
+
+	responses = [historical_payload(f"SYM{i}", days=args.days) for i in range(args.symbols)]
+	rows = args.symbols * args.days
+	timestamp = datetime.now(timezone.utc)
+
+	for label, fn in [('json (load_table_from_json)', json_payload), ('parquet (arrow)', parquet_payload)]:
+		stats = measure(lambda data: fn(data, timestamp), repeat=args.repeat, setup=lambda: copy.deepcopy(responses))
+		print(format_row(label, rows, stats, f"{len(stats['result']) / 2**20:>8.1f} MiB upload"))
+
+
+if __name__ == '__main__':
+	main()
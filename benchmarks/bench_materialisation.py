@@ -0,0 +1,182 @@
+"""
+Times query_to_dataframe over a recorded query result, through the Storage Read API and through its REST fallback.
+
+	python -m benchmarks.bench_materialisation --record               # record raw_stock_data once
+	python -m benchmarks.bench_materialisation
+	python -m benchmarks.bench_materialisation --synthetic --rows 500000
+
+The fixture is an Arrow IPC stream of raw_stock_data rows under benchmarks/fixtures, recorded from
+BigQuery with --record. --synthetic writes a generated one of --rows rows instead. query_to_dataframe
+runs against FixtureClient, whose result iterator serves the fixture the way BigQuery would:
+
+- storage: to_arrow(create_bqstorage_client=True) decodes the serialized Arrow record batches the
+  Storage Read API streams.
+- rest: the Storage Read API is unavailable, so query_to_dataframe falls back to
+  to_arrow(create_bqstorage_client=False). The result is paged as tabledata.list JSON through a real
+  RowIterator, so the timing covers JSON decoding and the client library's row-to-Arrow conversion.
+- rows: bigquery.Row objects turned into dicts and then a DataFrame, as load_data did before
+  query_to_dataframe existed. For reference.
+"""
+import argparse
+import json
+import logging
+import os
+
+import pandas as pd
+import pyarrow as pa
+from google.cloud import bigquery
+from google.cloud.bigquery.table import Row, RowIterator
+
+from benchmarks.common import measure, format_row
+from benchmarks.synthetic import historical_rows
+from src.utils import query_to_dataframe
+
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+COLUMNS = ['adjClose', 'change', 'changePercent', 'close', 'date', 'high', 'low', 'open', 'symbol', 'volume']
+SCHEMA = [
+	bigquery.SchemaField(column, 'DATE' if column == 'date' else 'STRING' if column == 'symbol' else 'INTEGER' if column == 'volume' else 'FLOAT')
+	for column in COLUMNS
+]
+
+# Rows per tabledata.list page; BigQuery caps a page at about 10 MB of JSON.
+PAGE_ROWS = 40_000
+
+
+def fixture_path(name):
+	return os.path.join(FIXTURE_DIR, f"{name}.arrows")
+
+
+def write_fixture(name, table):
+	os.makedirs(FIXTURE_DIR, exist_ok=True)
+	with pa.OSFile(fixture_path(name), 'wb') as sink:
+		with pa.ipc.new_stream(sink, table.schema) as writer:
+			writer.write_table(table, max_chunksize=100_000)
+
+
+def read_fixture_bytes(name):
+	with open(fixture_path(name), 'rb') as f:
+		return f.read()
+
+
+def record_from_bigquery(name):
+	from dotenv import load_dotenv
+
+	load_dotenv()
+	project_id = os.getenv('GCP_PROJECT_ID')
+	client = bigquery.Client(project=project_id)
+	select = ', '.join(f"`{column}`" for column in COLUMNS)
+	df = query_to_dataframe(client, f"SELECT {select} FROM `{project_id}.stock_data.raw_stock_data`")
+	write_fixture(name, pa.Table.from_pandas(df, preserve_index=False))
+
+
+def record_synthetic(name, rows, days=1000):
+	frames = []
+	for i in range(max(1, rows // days)):
+		frame = pd.DataFrame(historical_rows(f"SYM{i}", start='2021-01-04', days=days))
+		frame['symbol'] = f"SYM{i}"
+		frame['date'] = pd.to_datetime(frame['date']).dt.date
+		frames.append(frame[COLUMNS])
+	write_fixture(name, pa.Table.from_pandas(pd.concat(frames, ignore_index=True), preserve_index=False))
+
+
+def rest_pages(table):
+	# The fixture as tabledata.list response bodies: every value a string, one JSON document per page.
+	pages = []
+	rows = table.select(COLUMNS).to_pylist()
+	for start in range(0, len(rows), PAGE_ROWS):
+		page = {'rows': [
+			{'f': [{'v': None if row[column] is None else str(row[column])} for column in COLUMNS]}
+			for row in rows[start:start + PAGE_ROWS]
+		]}
+		if start + PAGE_ROWS < len(rows):
+			page['pageToken'] = str(start + PAGE_ROWS)
+		pages.append(json.dumps(page))
+	return pages
+
+
+class FixtureRowIterator:
+	# Stands in for the RowIterator of a finished query job, serving the fixture through either API.
+	def __init__(self, payload, pages, storage=True):
+		self.payload = payload
+		self.pages = pages
+		self.storage = storage
+
+	def api_request(self, method, path, query_params=None, **kwargs):
+		token = (query_params or {}).get('pageToken')
+		return json.loads(self.pages[int(token) // PAGE_ROWS if token else 0])
+
+	def to_arrow(self, create_bqstorage_client=True):
+		if create_bqstorage_client:
+			if not self.storage:
+				raise RuntimeError('google-cloud-bigquery-storage is not installed')
+			return pa.ipc.open_stream(self.payload).read_all()
+
+		rows = RowIterator(None, self.api_request, '/fixture', SCHEMA, total_rows=None)
+		return rows.to_arrow(create_bqstorage_client=False)
+
+
+class FixtureJob:
+	def __init__(self, rows):
+		self.rows = rows
+
+	def result(self):
+		return self.rows
+
+
+class FixtureClient:
+	# Answers every query with the fixture.
+	def __init__(self, payload, pages, storage=True):
+		self.payload = payload
+		self.pages = pages
+		self.storage = storage
+
+	def query(self, query_string, job_config=None):
+		return FixtureJob(FixtureRowIterator(self.payload, self.pages, self.storage))
+
+
+def rows_path(rows):
+	return pd.DataFrame([dict(row) for row in rows])
+
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument('--rows', type=int, default=500_000)
+	parser.add_argument('--repeat', type=int, default=3)
+	parser.add_argument('--name', default='raw_stock_data')
+	parser.add_argument('--record', action='store_true', help='Record the fixture from BigQuery.')
+	parser.add_argument('--synthetic', action='store_true', help='Write a generated fixture of --rows rows.')
+	args = parser.parse_args()
+
+	if args.record:
+		record_from_bigquery(args.name)
+	elif args.synthetic:
+		record_synthetic(args.name, args.rows)
+	elif not os.path.exists(fixture_path(args.name)):
+		parser.error(f"{fixture_path(args.name)} does not exist; record it with --record or generate one with --synthetic.")
+
+	payload = read_fixture_bytes(args.name)
+	table = pa.ipc.open_stream(payload).read_all()
+	pages = rest_pages(table)
+	query_string = 'SELECT * FROM `fixture`'
+
+	# Rows as the REST path yields them; building them is not part of the timing.
+	field_to_index = {name: i for i, name in enumerate(table.column_names)}
+	rows = [Row(tuple(values.values()), field_to_index) for values in table.to_pylist()]
+
+	# query_to_dataframe warns on every fallback.
+	logging.disable(logging.WARNING)
+	storage = measure(lambda: query_to_dataframe(FixtureClient(payload, pages), query_string), repeat=args.repeat)
+	rest = measure(lambda: query_to_dataframe(FixtureClient(payload, pages, storage=False), query_string), repeat=args.repeat)
+	logging.disable(logging.NOTSET)
+	reference = measure(lambda: rows_path(rows), repeat=args.repeat)
+
+	pd.testing.assert_frame_equal(storage['result'], rest['result'], check_dtype=False)
+
+	print(f"{table.num_rows:,} rows from {fixture_path(args.name)}")
+	print(format_row('storage (query_to_dataframe)', table.num_rows, storage))
+	print(format_row('rest (query_to_dataframe)', table.num_rows, rest, f"{rest['median'] / storage['median']:>6.1f}x slower"))
+	print(format_row('rows (dict per row)', table.num_rows, reference))
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,98 @@
+import statistics
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+import pyarrow as pa
+
+
+class ArrowPeakSampler:
+	# tracemalloc only sees the Python allocator, so Arrow's memory pool is sampled separately.
+	def __init__(self, interval=0.001):
+		self.interval = interval
+		self.baseline = pa.total_allocated_bytes()
+		self.peak = 0
+		self.running = True
+		self.thread = threading.Thread(target=self._run, daemon=True)
+
+	def _run(self):
+		while self.running:
+			self.peak = max(self.peak, pa.total_allocated_bytes() - self.baseline)
+			time.sleep(self.interval)
+
+	def __enter__(self):
+		self.thread.start()
+		return self
+
+	def __exit__(self, *exc):
+		self.running = False
+		self.thread.join()
+		self.peak = max(self.peak, pa.total_allocated_bytes() - self.baseline)
+
+
+def measure(fn, repeat=5, setup=None):
+	"""
+	Times fn over several runs, then records the peak memory it allocates in one extra traced run.
+
+	Args:
+		fn (callable): The function to time. It receives the result of setup, if given.
+		repeat (int): The number of timed runs.
+		setup (callable, optional): Builds fresh input for every run, outside the timed section.
+
+	Returns:
+		dict: The run times in seconds, their median and the peak Python heap plus Arrow pool memory in bytes.
+	"""
+	seconds = []
+	result = None
+
+	for _ in range(repeat):
+		args = (setup(),) if setup is not None else ()
+		start = time.perf_counter()
+		result = fn(*args)
+		seconds.append(time.perf_counter() - start)
+
+	# Tracing slows allocation-heavy code down, so peak memory comes from a separate run.
+	args = (setup(),) if setup is not None else ()
+	with ArrowPeakSampler() as sampler:
+		tracemalloc.start()
+		fn(*args)
+		peak = tracemalloc.get_traced_memory()[1]
+		tracemalloc.stop()
+	peak += sampler.peak
+
+	return {
+		'seconds': seconds,
+		'median': statistics.median(seconds),
+		'peak_bytes': peak,
+		'result': result,
+	}
+
+
+def format_row(label, rows, stats, extra=''):
+	return (f"{label:<28} {rows / stats['median']:>14,.0f} rows/s "
+			f"{stats['median'] * 1000:>10.1f} ms {stats['peak_bytes'] / 2**20:>9.1f} MiB peak {extra}")
+
+
+def percentiles(samples, quantiles=(50, 95, 99)):
+	# Linear-interpolated percentiles, keyed 'p50', 'p95', ...
+	return {f"p{q}": float(np.percentile(samples, q)) for q in quantiles}
+
+
+def summarise(stats, items):
+	"""
+	Reduces the output of measure to the figures saved with each benchmark result.
+
+	Args:
+		stats (dict): The output of measure.
+		items (int): The number of items (rows, symbols) processed per run.
+
+	Returns:
+		dict: Items per second at the median, the p50/p95/p99 run time in seconds and the peak memory in bytes.
+	"""
+	return {
+		'items': items,
+		'throughput': items / stats['median'],
+		**percentiles(stats['seconds']),
+		'peak_bytes': stats['peak_bytes'],
+	}
@@ -0,0 +1,112 @@
+"""
+An in-memory stand-in for the bigquery.Client calls made by the ingestion path.
+
+Tables are pandas DataFrames keyed by their fully qualified reference. Only the statements the
+ingestion code issues are understood: the query_bq watermark scans and the MERGE upserts of
+merge_table and merge_rows. Anything else raises NotImplementedError, so a benchmark never
+silently measures a query the fake didn't run.
+"""
+import io
+import json
+import re
+import threading
+
+import pandas as pd
+import pyarrow.parquet as pq
+from google.cloud import bigquery
+
+MERGE_PATTERN = re.compile(r"MERGE INTO `([^`]+)` AS target\s+USING `([^`]+)` AS source", re.IGNORECASE)
+MERGE_KEY_PATTERN = re.compile(r"target\.`([^`]+)` = source\.`\1`")
+WATERMARK_PATTERN = re.compile(r"FROM UNNEST\(@symbols\) AS symbol.*?FROM `([^`]+)`", re.IGNORECASE | re.DOTALL)
+
+
+class FakeJob:
+	# Mimics the job objects returned by query and load_table_*: result() blocks and returns rows.
+	def __init__(self, rows=None, num_dml_affected_rows=None):
+		self.rows = rows or []
+		self.num_dml_affected_rows = num_dml_affected_rows
+
+	def result(self):
+		return self.rows
+
+
+class FakeBigQueryClient:
+	"""
+	Keeps tables in memory and counts the jobs run against them.
+
+	Args:
+		tables (dict, optional): Initial tables, mapping a fully qualified reference to a DataFrame.
+	"""
+
+	def __init__(self, tables=None):
+		self.tables = dict(tables or {})
+		self.jobs = {'query': 0, 'merge': 0, 'load': 0, 'delete': 0}
+		self.loaded_bytes = 0
+		self.lock = threading.Lock()
+
+	def _store(self, table_ref, df, job_config):
+		disposition = getattr(job_config, 'write_disposition', None) or 'WRITE_APPEND'
+		with self.lock:
+			self.jobs['load'] += 1
+			if disposition == 'WRITE_APPEND' and table_ref in self.tables:
+				df = pd.concat([self.tables[table_ref], df], ignore_index=True)
+			self.tables[table_ref] = df
+		return FakeJob()
+
+	def load_table_from_json(self, rows, table_ref, job_config=None):
+		rows = list(rows)
+		self.loaded_bytes += sum(len(json.dumps(row)) for row in rows)
+		return self._store(str(table_ref), pd.DataFrame(rows), job_config)
+
+	def load_table_from_file(self, file_obj, table_ref, job_config=None):
+		data = file_obj.read()
+		self.loaded_bytes += len(data)
+		if getattr(job_config, 'source_format', None) == bigquery.SourceFormat.PARQUET:
+			df = pq.read_table(io.BytesIO(data)).to_pandas()
+		else:
+			df = pd.read_json(io.BytesIO(data), lines=True)
+		return self._store(str(table_ref), df, job_config)
+
+	def create_table(self, table, exists_ok=False):
+		return table
+
+	def delete_table(self, table_ref, not_found_ok=False):
+		with self.lock:
+			self.jobs['delete'] += 1
+			if self.tables.pop(str(table_ref), None) is None and not not_found_ok:
+				raise KeyError(f"Table {table_ref} not found")
+
+	def query(self, query_string, job_config=None):
+		parameters = {parameter.name: getattr(parameter, 'values', None) or getattr(parameter, 'value', None)
+					  for parameter in getattr(job_config, 'query_parameters', None) or []}
+
+		merge = MERGE_PATTERN.search(query_string)
+		if merge:
+			keys = MERGE_KEY_PATTERN.findall(query_string[merge.end():query_string.upper().find('WHEN')])
+			return self._merge(*merge.groups(), keys or ['symbol', 'date'])
+
+		watermark = WATERMARK_PATTERN.search(query_string)
+		if watermark:
+			return self._watermarks(watermark.group(1), parameters['symbols'], parameters.get('since'))
+
+		raise NotImplementedError(f"FakeBigQueryClient can't run: {query_string.strip()[:80]}")
+
+	def _merge(self, target_ref, source_ref, keys):
+		# Upsert by the ON clause's key columns: source rows replace matching target rows.
+		with self.lock:
+			self.jobs['merge'] += 1
+			source = self.tables[source_ref]
+			target = self.tables.get(target_ref)
+			merged = source if target is None else pd.concat([target, source], ignore_index=True)
+			self.tables[target_ref] = merged.drop_duplicates(subset=keys, keep='last').reset_index(drop=True)
+		return FakeJob(num_dml_affected_rows=len(source))
+
+	def _watermarks(self, table_ref, symbols, since=None):
+		# What query_last_dates returns: each symbol with the last date stored for it on or after since, or None.
+		with self.lock:
+			self.jobs['query'] += 1
+			table = self.tables.get(table_ref)
+		if table is not None and since is not None:
+			table = table.loc[pd.to_datetime(table['date']) >= pd.Timestamp(since)]
+		last_dates = table.groupby('symbol')['date'].max().to_dict() if table is not None else {}
+		return FakeJob([{'symbol': symbol, 'date': last_dates.get(symbol)} for symbol in symbols])
@@ -0,0 +1,192 @@
+"""
+Runs the offline benchmark suite over the ingestion and dashboard data paths and saves the results.
+
+	python -m benchmarks.run_suite --symbols 5 50 500 5000
+	python -m benchmarks.run_suite --replay --compare benchmarks/results/20250101_120000.json
+
+Nothing leaves the machine: FMP is served by StubFMPServer (synthetic or, with --replay, recorded
+payloads) and BigQuery by FakeBigQueryClient. Each stage reports items per second, p50/p95/p99 run
+times over --repeat runs and peak memory. fetch also reports per-request latency percentiles.
+Results are written as JSON under benchmarks/results, one file per run.
+
+Stages:
+- fetch: fetch_all against the stub.
+- ingest: process_data_batch end to end (fetch, Parquet staging, MERGE, cleanup) into the fake.
+- replica_read: read_replica of the raw price history, as current_watermark leaves it on disk.
+- indicators: add_metrics over every symbol.
+- beta: calculate_beta over every symbol against ^GSPC.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import pandas as pd
+
+import src.data_ingestion as data_ingestion
+import src.local_store as local_store
+from benchmarks.bench_indicators import price_frame
+from benchmarks.common import measure, percentiles, summarise
+from benchmarks.fake_bigquery import FakeBigQueryClient
+from benchmarks.stub_fmp_server import StubFMPServer, load_payloads, replay_payloads
+from benchmarks.synthetic import start_for
+from src.indicators import BENCHMARK_SYMBOL, add_metrics, calculate_beta
+from src.trading_calendar import last_completed_session
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+TARGET_TABLE_REF = 'bench.stock_data.raw_stock_data'
+
+
+def timed_retrieve_data(latencies):
+	# Wraps retrieve_data so fetch_all's per-request latencies can be collected.
+	retrieve_data = data_ingestion.retrieve_data
+
+	def wrapper(*args, **kwargs):
+		start = time.perf_counter()
+		try:
+			return retrieve_data(*args, **kwargs)
+		finally:
+			latencies.append(time.perf_counter() - start)
+
+	return wrapper
+
+
+def bench_fetch(server, api_lookup, args):
+	latencies = []
+	original = data_ingestion.retrieve_data
+	data_ingestion.retrieve_data = timed_retrieve_data(latencies)
+	try:
+		stats = measure(
+			lambda: data_ingestion.fetch_all('stub', api_lookup, max_workers=args.workers, requests_per_minute=args.rpm, base_url=server.base_url),
+			repeat=args.repeat
+		)
+	finally:
+		data_ingestion.retrieve_data = original
+
+	result = summarise(stats, len(api_lookup))
+	result.update({f"request_{key}": value for key, value in percentiles(latencies).items()})
+	return result
+
+
+def bench_ingest(server, api_lookup, rows, args):
+	def ingest(client):
+		return data_ingestion.process_data_batch(
+			'stub', api_lookup, client, 'bench', TARGET_TABLE_REF,
+			base_url=server.base_url, requests_per_minute=args.rpm
+		)
+
+	stats = measure(ingest, repeat=args.repeat, setup=FakeBigQueryClient)
+	return summarise(stats, rows)
+
+
+def bench_frames(symbols, args):
+	# The dashboard's in-memory stages over the same universe, with ^GSPC as the benchmark.
+	df = price_frame(symbols, args.days)
+	benchmark = price_frame(1, args.days)
+	benchmark['symbol'] = BENCHMARK_SYMBOL
+	df = pd.concat([df, benchmark], ignore_index=True)
+	df['date'] = pd.to_datetime(df['date'])
+	rows = len(df)
+
+	results = {}
+	cache_dir = local_store.CACHE_DIR
+	with tempfile.TemporaryDirectory() as temp_dir:
+		local_store.CACHE_DIR = temp_dir
+		try:
+			local_store.write_replica('raw_stock_data', df)
+			results['replica_read'] = summarise(measure(lambda: local_store.read_replica('raw_stock_data'), repeat=args.repeat), rows)
+		finally:
+			local_store.CACHE_DIR = cache_dir
+
+	results['indicators'] = summarise(measure(add_metrics, repeat=args.repeat, setup=df.copy), rows)
+	with_metrics = add_metrics(df)
+	results['beta'] = summarise(measure(calculate_beta, repeat=args.repeat, setup=with_metrics.copy), rows)
+	return results
+
+
+def git_commit():
+	try:
+		return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+	except (OSError, subprocess.CalledProcessError):
+		return None
+
+
+def format_result(symbols, stage, result):
+	line = (f"{symbols:>6,} {stage:<13} {result['throughput']:>14,.0f} items/s "
+			f"p50 {result['p50'] * 1000:>9.1f} ms  p95 {result['p95'] * 1000:>9.1f} ms  p99 {result['p99'] * 1000:>9.1f} ms  "
+			f"{result['peak_bytes'] / 2**20:>8.1f} MiB peak")
+	if 'request_p50' in result:
+		line += f"  request p50/p99 {result['request_p50'] * 1000:.1f}/{result['request_p99'] * 1000:.1f} ms"
+	return line
+
+
+def compare(results, baseline_path):
+	# Prints the p50 of every stage relative to a previously saved run.
+	with open(baseline_path) as f:
+		baseline = {(entry['symbols'], entry['stage']): entry for entry in json.load(f)['results']}
+
+	print(f"\nCompared with {baseline_path} (p50, lower is better):")
+	for entry in results:
+		previous = baseline.get((entry['symbols'], entry['stage']))
+		if previous:
+			print(f"{entry['symbols']:>6,} {entry['stage']:<13} {entry['p50'] / previous['p50']:>6.2f}x")
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser()
+	parser.add_argument('--symbols', type=int, nargs='+', default=[5, 50, 500])
+	parser.add_argument('--days', type=int, default=250)
+	parser.add_argument('--repeat', type=int, default=5)
+	parser.add_argument('--workers', type=int, default=8)
+	parser.add_argument('--rpm', type=int, default=1_000_000, help='FMP rate limit; high by default so the stub is not throttled.')
+	parser.add_argument('--latency', type=float, default=0.0, help='Simulated FMP round trip in seconds.')
+	parser.add_argument('--replay', action='store_true', help='Serve the recorded payloads in benchmarks/fixtures/fmp.')
+	parser.add_argument('--output', default=RESULTS_DIR)
+	parser.add_argument('--compare', help='A saved results file to compare against.')
+	args = parser.parse_args(argv)
+
+	# The synthetic histories end on the last completed session, so process_data_batch finds every
+	# session it expects and keeps every row.
+	from_date = start_for(args.days, last_completed_session())
+
+	results = []
+	for symbols in args.symbols:
+		api_lookup = [[f"SYM{i}", from_date] for i in range(symbols)]
+		payloads = replay_payloads(load_payloads(), [symbol for symbol, _ in api_lookup]) if args.replay else None
+		rows = sum(len(payload['historical']) for payload in payloads.values()) if payloads else symbols * args.days
+
+		with StubFMPServer(latency=args.latency, days=args.days, payloads=payloads) as server:
+			stages = {
+				'fetch': bench_fetch(server, api_lookup, args),
+				'ingest': bench_ingest(server, api_lookup, rows, args),
+			}
+		stages.update(bench_frames(symbols, args))
+
+		for stage, result in stages.items():
+			results.append({'symbols': symbols, 'stage': stage, **result})
+			print(format_result(symbols, stage, result))
+
+	os.makedirs(args.output, exist_ok=True)
+	path = os.path.join(args.output, f"{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+	with open(path, 'w') as f:
+		json.dump({
+			'created': datetime.now().isoformat(),
+			'commit': git_commit(),
+			'python': sys.version.split()[0],
+			'platform': platform.platform(),
+			'args': vars(args),
+			'results': results,
+		}, f, indent=2)
+	print(f"\nSaved {path}")
+
+	if args.compare:
+		compare(results, args.compare)
+
+
+if __name__ == '__main__':
+	main()
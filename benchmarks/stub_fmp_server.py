@@ -0,0 +1,174 @@
+"""
+A local stand-in for the FMP historical-price-full endpoint.
+
+Run directly to time fetch_all against it:
+
+	python -m benchmarks.stub_fmp_server --symbols 200 --rpm 3000 --latency 0.05
+	python -m benchmarks.stub_fmp_server --record AAPL MSFT GOOG   # record real payloads (needs FMP_API_KEY)
+
+Recorded payloads are stored under benchmarks/fixtures/fmp and replayed with --replay.
+"""
+import argparse
+import json
+import os
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks.synthetic import historical_payload
+
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), 'fixtures', 'fmp')
+
+
+def record_payloads(symbols, directory=FIXTURE_DIR):
+	# Saves the full historical-price-full response of each symbol as <symbol>.json.
+	from dotenv import load_dotenv
+	from src.data_ingestion import retrieve_data
+
+	load_dotenv()
+	apikey = os.getenv('FMP_API_KEY')
+	os.makedirs(directory, exist_ok=True)
+	for symbol in symbols:
+		payload = retrieve_data(apikey, symbol, None)
+		with open(os.path.join(directory, f"{symbol}.json"), 'w') as f:
+			json.dump(payload, f)
+
+
+def load_payloads(directory=FIXTURE_DIR):
+	# The recorded responses keyed by symbol; empty when nothing has been recorded.
+	if not os.path.isdir(directory):
+		return {}
+	payloads = {}
+	for name in sorted(os.listdir(directory)):
+		if name.endswith('.json'):
+			with open(os.path.join(directory, name)) as f:
+				payloads[name[:-len('.json')]] = json.load(f)
+	return payloads
+
+
+def replay_payloads(payloads, symbols):
+	# Assigns the recorded responses to symbols in turn, so a few recordings cover any universe size.
+	recorded = list(payloads.values())
+	if not recorded:
+		raise ValueError(f"No recorded payloads in {FIXTURE_DIR}; record some with --record first.")
+	return {symbol: {**recorded[i % len(recorded)], 'symbol': symbol} for i, symbol in enumerate(symbols)}
+
+
+class StubFMPServer:
+	"""
+	Serves synthetic historical-price-full payloads on localhost.
+
+	Args:
+		latency (float): Seconds to sleep before answering each request, to mimic a network round trip.
+		throttle_every (int): Answer every n-th request with a 429 and a Retry-After header. 0 disables it.
+		retry_after (int): The Retry-After value sent with throttled responses.
+		days (int): The number of rows returned per symbol.
+		payloads (dict, optional): Recorded responses keyed by symbol, replayed instead of synthetic data.
+		errors (dict, optional): Maps a symbol to the HTTP status it is always answered with, e.g. {'BAD': 401}.
+	"""
+
+	def __init__(self, latency=0.0, throttle_every=0, retry_after=1, days=250, payloads=None, errors=None):
+		self.latency = latency
+		self.throttle_every = throttle_every
+		self.retry_after = retry_after
+		self.days = days
+		self.payloads = payloads or {}
+		self.errors = errors or {}
+		self.request_count = 0
+		self.lock = threading.Lock()
+		self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+		self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+	@property
+	def base_url(self):
+		host, port = self.httpd.server_address
+		return f"http://{host}:{port}/api/v3"
+
+	def _handler(self):
+		server = self
+
+		class Handler(BaseHTTPRequestHandler):
+			protocol_version = 'HTTP/1.1'
+
+			def log_message(self, *args):
+				pass
+
+			def do_GET(self):
+				with server.lock:
+					server.request_count += 1
+					count = server.request_count
+
+				time.sleep(server.latency)
+
+				if server.throttle_every and count % server.throttle_every == 0:
+					self._send(429, b'{}', {'Retry-After': str(server.retry_after)})
+					return
+
+				parsed = urllib.parse.urlparse(self.path)
+				symbol = parsed.path.rsplit('/', 1)[-1]
+				if symbol in server.errors:
+					self._send(server.errors[symbol], b'{}')
+					return
+
+				if symbol in server.payloads:
+					payload = server.payloads[symbol]
+				else:
+					params = urllib.parse.parse_qs(parsed.query)
+					start = params.get('from', ['2024-01-02'])[0]
+					payload = historical_payload(symbol, start=start, days=server.days)
+
+				self._send(200, json.dumps(payload).encode())
+
+			def _send(self, status, body, headers=None):
+				self.send_response(status)
+				self.send_header('Content-Type', 'application/json')
+				self.send_header('Content-Length', str(len(body)))
+				for key, value in (headers or {}).items():
+					self.send_header(key, value)
+				self.end_headers()
+				self.wfile.write(body)
+
+		return Handler
+
+	def __enter__(self):
+		self.thread.start()
+		return self
+
+	def __exit__(self, *exc):
+		self.httpd.shutdown()
+		self.httpd.server_close()
+
+
+def main():
+	from src.data_ingestion import fetch_all
+
+	parser = argparse.ArgumentParser()
+	parser.add_argument('--symbols', type=int, default=100)
+	parser.add_argument('--workers', type=int, default=8)
+	parser.add_argument('--rpm', type=int, default=3000)
+	parser.add_argument('--latency', type=float, default=0.05)
+	parser.add_argument('--throttle-every', type=int, default=0)
+	parser.add_argument('--replay', action='store_true', help='Serve the recorded payloads instead of synthetic ones.')
+	parser.add_argument('--record', nargs='+', metavar='SYMBOL', help='Record real payloads for these symbols and exit.')
+	args = parser.parse_args()
+
+	if args.record:
+		record_payloads(args.record)
+		return
+
+	api_lookup = [[f"SYM{i}", '2024-01-02'] for i in range(args.symbols)]
+	payloads = replay_payloads(load_payloads(), [symbol for symbol, _ in api_lookup]) if args.replay else None
+
+	with StubFMPServer(latency=args.latency, throttle_every=args.throttle_every, payloads=payloads) as server:
+		start = time.perf_counter()
+		results = fetch_all('stub', api_lookup, max_workers=args.workers, requests_per_minute=args.rpm, base_url=server.base_url)
+		elapsed = time.perf_counter() - start
+
+	failed = [symbol for symbol, result in results.items() if isinstance(result, Exception)]
+	print(f"Fetched {len(results) - len(failed)}/{len(results)} symbols in {elapsed:.2f}s "
+		  f"({server.request_count} requests, sequential estimate {args.symbols * args.latency:.2f}s)")
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,72 @@
+import random
+from datetime import datetime, timedelta
+
+
+def trading_days(start, days):
+	# Weekdays only; close enough to a trading calendar for synthetic data.
+	current = datetime.strptime(start, '%Y-%m-%d').date() if isinstance(start, str) else start
+	result = []
+	while len(result) < days:
+		if current.weekday() < 5:
+			result.append(current)
+		current += timedelta(days=1)
+	return result
+
+
+def start_for(days, end):
+	# The first date of the `days` weekdays ending on end, so trading_days(start_for(days, end), days) ends there.
+	current = end
+	for _ in range(days - 1):
+		current -= timedelta(days=3 if current.weekday() == 0 else 1)
+	return current.strftime('%Y-%m-%d')
+
+
+def historical_rows(symbol, start='2024-01-02', days=250, seed=None):
+	"""
+	Generates a random walk of daily prices in the shape of the FMP historical-price-full response.
+
+	Args:
+		symbol (str): The ticker symbol; also seeds the generator when seed is None.
+		start (str): The first date in 'YYYY-MM-DD' format.
+		days (int): The number of trading days to generate.
+		seed (int, optional): Seed for the random generator.
+
+	Returns:
+		list: One dict per day, newest first, as returned by the API.
+	"""
+	rng = random.Random(seed if seed is not None else symbol)
+	price = rng.uniform(20, 500)
+	first_close = None
+	rows = []
+
+	for day in trading_days(start, days):
+		open_ = price
+		close = max(1.0, open_ * (1 + rng.gauss(0, 0.02)))
+		high = max(open_, close) * (1 + abs(rng.gauss(0, 0.005)))
+		low = min(open_, close) * (1 - abs(rng.gauss(0, 0.005)))
+		volume = rng.randint(100_000, 50_000_000)
+		first_close = first_close or close
+
+		rows.append({
+			'date': day.strftime('%Y-%m-%d'),
+			'open': round(open_, 4),
+			'high': round(high, 4),
+			'low': round(low, 4),
+			'close': round(close, 4),
+			'adjClose': round(close, 4),
+			'volume': volume,
+			'unadjustedVolume': volume,
+			'change': round(close - open_, 4),
+			'changePercent': round((close - open_) / open_ * 100, 4),
+			'vwap': round((high + low + close) / 3, 4),
+			'label': day.strftime('%B %d, %y'),
+			'changeOverTime': round((close - first_close) / first_close, 6),
+		})
+		price = close
+
+	rows.reverse()
+	return rows
+
+
+def historical_payload(symbol, start='2024-01-02', days=250, seed=None):
+	return {'symbol': symbol, 'historical': historical_rows(symbol, start, days, seed)}
@@ -0,0 +1,5 @@
+from dotenv import load_dotenv
+
+# Load the environment variables from the .env file (development only) before any module reads its
+# settings at import time. Variables set on the system, as in production, take precedence.
+load_dotenv()
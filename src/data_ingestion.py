@@ -1,63 +1,214 @@
 from google.cloud import bigquery
-import urllib.request
+from google.api_core.exceptions import NotFound
+import pyarrow as pa
+import pyarrow.parquet as pq
+import requests
+from requests.adapters import HTTPAdapter
 import urllib.parse
-import urllib.error
-import json
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 from dotenv import load_dotenv
 import os
-from datetime import datetime, timedelta
+import sys
+from datetime import date, datetime, timedelta, timezone
+import argparse
+import io
 import time
+import uuid
+import zlib
 import logging
 
+# Add the project root to the system path
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+if project_root not in sys.path:
+	sys.path.append(project_root)
+
+from src.utils import RateLimiter, arrow_schema, backoff_delay, parse_retry_after, run_dml
+from src.preprocessing import run_preprocessing
+from src.market_data import ingest_benchmarks
+from src.fundamentals import ingest_snapshots
+from src.trading_calendar import last_completed_session, next_session, session_count
+from src.telemetry import Telemetry
+from src.run_journal import RunJournal, JOURNAL_PATH, FETCHED, LOADED, MERGED, ENRICHED, EMPTY, FAILED
+
 #logger = logging.getLogger(__name__)
 
-def query_bq(client, table_id, symbols):
-	# Query BigQuery to list the symbol and corresponding last date in the table.
-	# This will be used to generate the from_date parameter for the API call.
+DATASET_ID = 'stock_data'
+
+FMP_BASE_URL = os.getenv('FMP_BASE_URL', 'https://financialmodelingprep.com/api/v3')
+FMP_REQUESTS_PER_MINUTE = int(os.getenv('FMP_REQUESTS_PER_MINUTE', 300))
+FMP_MAX_WORKERS = int(os.getenv('FMP_MAX_WORKERS', 8))
+FMP_TIMEOUT = 30
+
+# The symbols to ingest, one per line; see load_universe.
+SYMBOLS_FILE = os.getenv('SYMBOLS_FILE', os.path.join(project_root, 'config', 'universe.txt'))
+
+# 'parquet' or 'json'; see stage_parquet and stage_json.
+LOAD_FORMAT = os.getenv('LOAD_FORMAT', 'parquet')
+
+# Schema shared by the staging tables and raw_stock_data.
+RAW_STOCK_SCHEMA = [
+	bigquery.SchemaField('symbol', 'STRING'),
+	bigquery.SchemaField('date', 'DATE'),
+	bigquery.SchemaField('open', 'FLOAT'),
+	bigquery.SchemaField('high', 'FLOAT'),
+	bigquery.SchemaField('low', 'FLOAT'),
+	bigquery.SchemaField('close', 'FLOAT'),
+	bigquery.SchemaField('adjClose', 'FLOAT'),
+	bigquery.SchemaField('volume', 'INTEGER'),
+	bigquery.SchemaField('unadjustedVolume', 'INTEGER'),
+	bigquery.SchemaField('change', 'FLOAT'),
+	bigquery.SchemaField('changePercent', 'FLOAT'),
+	bigquery.SchemaField('vwap', 'FLOAT'),
+	bigquery.SchemaField('label', 'STRING'),
+	bigquery.SchemaField('changeOverTime', 'FLOAT'),
+	bigquery.SchemaField('timestamp', 'TIMESTAMP'),
+]
+
+# Days of history query_bq scans for each symbol's last date. Symbols without rows in that
+# window are looked up again over the full history.
+WATERMARK_LOOKBACK_DAYS = int(os.getenv('WATERMARK_LOOKBACK_DAYS', 30))
+
+
+def get_table(client, table_ref):
+	try:
+		return client.get_table(table_ref)
+	except NotFound:
+		return None
+
+
+def is_partitioned(table):
+	# The layout ensure_raw_table provisions: partitioned on date and clustered by symbol.
+	partitioning = table.time_partitioning
+	return partitioning is not None and partitioning.field == 'date' and table.clustering_fields == ['symbol']
+
+
+def ensure_raw_table(client, table_ref, migrate=True):
+	"""
+	Makes sure raw_stock_data exists, partitioned by month of date and clustered by symbol.
+
+	With that layout the watermark scan of query_bq and the MERGE of merge_table only read the
+	partitions of the dates being ingested and the blocks of the symbols involved, so their cost
+	follows the new data rather than the stored history. Monthly partitions keep a decade of daily
+	prices far below BigQuery's partition limits.
+
+	A missing table is created. An existing table without the layout is copied into
+	<table>__migrating with CREATE TABLE ... AS SELECT, renamed to <table>__unpartitioned, and the
+	copy is renamed into its place. The old table is kept for manual deletion. Every step can be
+	re-run: a migration interrupted between the two renames is completed by the next call.
+
+	Args:
+		client (bigquery.Client): The client used to run the BigQuery jobs.
+		table_ref (str): The fully qualified reference of raw_stock_data.
+		migrate (bool, optional): False only warns about an existing table without the layout. Migrate
+								  while no other process writes to the table, or its rows are lost.
+
+	Returns:
+		str: 'ready', 'created', 'migrated', or 'unpartitioned' when migrate is False.
+	"""
+	dataset_ref, table_id = table_ref.rsplit('.', 1)
+	migrating_ref = f"{table_ref}__migrating"
+	backup_id = f"{table_id}__unpartitioned"
+
+	table = get_table(client, table_ref)
+	if table is not None and is_partitioned(table):
+		return 'ready'
+
+	if table is None:
+		if get_table(client, migrating_ref) is not None:
+			logging.info(f"(ensure_raw_table) Completing the interrupted migration of {table_ref}")
+			client.query(f"ALTER TABLE `{migrating_ref}` RENAME TO `{table_id}`").result()
+			return 'migrated'
+
+		table = bigquery.Table(table_ref, schema=RAW_STOCK_SCHEMA)
+		table.time_partitioning = bigquery.TimePartitioning(type_=bigquery.TimePartitioningType.MONTH, field='date')
+		table.clustering_fields = ['symbol']
+		client.create_table(table, exists_ok=True)
+		return 'created'
+
+	if not migrate:
+		logging.warning(f"(ensure_raw_table) {table_ref} is not partitioned by date; run a single shard or --migrate to migrate it.")
+		return 'unpartitioned'
+
+	logging.info(f"(ensure_raw_table) Migrating {table_ref} to a date-partitioned, symbol-clustered table")
+	client.query(f"""
+		CREATE OR REPLACE TABLE `{migrating_ref}`
+		PARTITION BY DATE_TRUNC(`date`, MONTH)
+		CLUSTER BY `symbol`
+		AS SELECT * FROM `{table_ref}`
+	""").result()
+	client.query(f"DROP TABLE IF EXISTS `{dataset_ref}.{backup_id}`").result()
+	client.query(f"ALTER TABLE `{table_ref}` RENAME TO `{backup_id}`").result()
+	client.query(f"ALTER TABLE `{migrating_ref}` RENAME TO `{table_id}`").result()
+	logging.info(f"(ensure_raw_table) Migrated {table_ref}; the original is kept as {dataset_ref}.{backup_id}")
+	return 'migrated'
+
+
+def query_last_dates(client, table_id, symbols, since=None):
+	# Each symbol with the last date stored for it on or after since, or None.
+	since_filter = "AND `date` >= @since" if since is not None else ""
 	query_string = f"""
 		WITH symbol_list AS (
 			SELECT symbol
 			FROM UNNEST(@symbols) AS symbol
+		),
+		stock_data AS (
+			SELECT `symbol`, `date`
+			FROM `{table_id}`
+			WHERE `symbol` IN UNNEST(@symbols) {since_filter}
 		)
 		SELECT symbol_list.symbol, MAX(stock_data.`date`) AS `date`
 		FROM symbol_list
-		LEFT JOIN `{table_id}` AS stock_data
+		LEFT JOIN stock_data
 		ON symbol_list.symbol = stock_data.`symbol`
 		GROUP BY symbol_list.symbol
 	"""
 
-	job_config = bigquery.QueryJobConfig(
-			query_parameters=[
-				bigquery.ArrayQueryParameter('symbols', 'STRING', symbols)
-			]
-		)
-	query_job = client.query(query_string, job_config=job_config)
-	results = query_job.result()
+	query_parameters = [bigquery.ArrayQueryParameter('symbols', 'STRING', symbols)]
+	if since is not None:
+		query_parameters.append(bigquery.ScalarQueryParameter('since', 'DATE', since))
+
+	query_job = client.query(query_string, job_config=bigquery.QueryJobConfig(query_parameters=query_parameters))
+	return list(query_job.result())
+
+
+def query_bq(client, table_id, symbols, lookback_days=WATERMARK_LOOKBACK_DAYS):
+	# Query BigQuery to list the symbol and corresponding last date in the table.
+	# This will be used to generate the from_date parameter for the API call.
+	# Only the last lookback_days of partitions are scanned; symbols with no rows there (new, delisted
+	# or long stale) are looked up again over the full history, which clustering limits to their blocks.
+	since = date.today() - timedelta(days=lookback_days) if lookback_days else None
+	results = query_last_dates(client, table_id, symbols, since)
+
+	missing = [row['symbol'] for row in results if not row['date']]
+	if since is not None and missing:
+		logging.info(f"(query_bq) {len(missing)} symbols have no rows since {since}; searching their full history")
+		found = {row['symbol']: row for row in query_last_dates(client, table_id, missing)}
+		results = [row if row['date'] else found.get(row['symbol'], row) for row in results]
 
 	return results
 
 def create_api_lookup(query_results):
 	# Generate a temporary list to hold the final parameters for the API calls:
 	# i.e. [['GOOG', '2024-01-01'], ['AAPL', '2024-03-31']]
+	# Symbols already holding the last completed session are skipped; the others are requested
+	# from the session after their last date, so weekends and market holidays cost no API calls.
 	api_lookup = []
 	default_date = '2024-11-19'
-	today = datetime.now().strftime(format='%Y-%m-%d')
+	session = last_completed_session()
 
 	for row in query_results:
 
 		if row['date']:
 
-			if str(row['date']) == today:
-				r = [
-					row['symbol'],
-					today
-				]
+			if row['date'] >= session:
+				logging.info(f"(create_api_lookup) {row['symbol']} is up to date as of {session}.")
+				continue
 			
 			else:
-				date_plus_1 = row['date'] + timedelta(days=1)
 				r = [
 					row['symbol'],
-					datetime.strftime(date_plus_1, format='%Y-%m-%d')
+					datetime.strftime(next_session(row['date']), format='%Y-%m-%d')
 				]
 
 		else:
@@ -73,7 +224,7 @@ def create_api_lookup(query_results):
 
 
 # Functions to generate the API url, retrieve and process the data.
-def historical_url(apikey, ticker, from_date=None):
+def historical_url(apikey, ticker, from_date=None, base_url=FMP_BASE_URL):
 	"""
 	Constructs a URL to retrieve historical stock price data from the Financial Modeling Prep API.
 
@@ -82,6 +233,7 @@ def historical_url(apikey, ticker, from_date=None):
 		ticker (str): The stock ticker symbol for which historical data is requested (e.g., 'AAPL').
 		from_date (str, optional): The start date for the historical data in 'YYYY-MM-DD' format. 
 								   Defaults to None, in which case the API will return all available data.
+		base_url (str, optional): The root of the API. Override it to point at a local stub server.
 
 	Returns:
 		str: A complete URL string to query the Financial Modeling Prep API for the specified stock and date range.
@@ -91,7 +243,7 @@ def historical_url(apikey, ticker, from_date=None):
 		'https://financialmodelingprep.com/api/v3/historical-price-full/AAPL?apikey=your_api_key&from=2020-01-01'
 	"""
 
-	url = 'https://financialmodelingprep.com/api/v3/historical-price-full/'
+	url = f"{base_url}/historical-price-full/"
 
 	query_params = {
 		'apikey': apikey
@@ -107,7 +259,17 @@ def historical_url(apikey, ticker, from_date=None):
 	return full_url
 
 
-def retrieve_data(apikey, symbol, from_date, max_retries=3, delay=2):
+def create_session(pool_size=FMP_MAX_WORKERS):
+	# A keep-alive session whose connection pool is large enough for every fetch worker,
+	# so concurrent requests reuse connections instead of opening a new one per symbol.
+	session = requests.Session()
+	adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+	session.mount('https://', adapter)
+	session.mount('http://', adapter)
+	return session
+
+
+def retrieve_data(apikey, symbol, from_date, max_retries=3, delay=2, session=None, rate_limiter=None, base_url=FMP_BASE_URL):
 	"""
 	Retrieves historical stock price data from the Financial Modeling Prep API for a specific stock symbol and date range.
 
@@ -115,65 +277,226 @@ def retrieve_data(apikey, symbol, from_date, max_retries=3, delay=2):
 		apikey (str): Your API key for authenticating with the Financial Modeling Prep API.
 		symbol (str): The stock ticker symbol for which historical data is requested (e.g., 'AAPL').
 		from_date (str): The start date for the historical data in 'YYYY-MM-DD' format.
+		max_retries (int, optional): The number of attempts before giving up. Defaults to 3.
+		delay (float, optional): The base delay in seconds for the exponential backoff between attempts. Defaults to 2.
+		session (requests.Session, optional): The session to send the request with. Defaults to a new session.
+		rate_limiter (RateLimiter, optional): A limiter shared by all callers; a token is taken before every attempt.
+		base_url (str, optional): The root of the API. Override it to point at a local stub server.
 
 	Returns:
 		dict: A dictionary containing the parsed JSON response from the API, which includes the historical stock price data.
 
-	Side Effects:
-		- Prints the constructed URL used for the API call.
-		- Prints the data retrieved from the API for debugging purposes.
-
 	Example:
 		>>> retrieve_data('your_api_key', 'AAPL', '2020-01-01')
-		The URL is: https://financialmodelingprep.com/api/v3/historical-price-full/AAPL?apikey=your_api_key&from=2020-01-01
-		The data is: {...}
 		{...}
 
 	Notes:
 		- This function uses the `historical_url` function to construct the API URL.
-		- Make sure the API key, ticker symbol, and date format are valid to avoid runtime errors.
-		- This function reads the API response and parses it as JSON. Ensure that the API endpoint is reachable, and the response format matches expectations.
+		- Connection errors, 429 and 5xx responses are retried with jittered exponential backoff.
+		  A 429 response waits for at least its Retry-After header.
+		- Other 4xx responses (e.g. an invalid API key) are raised immediately.
 	"""
-	url = historical_url(apikey, symbol, from_date)
+	url = historical_url(apikey, symbol, from_date, base_url=base_url)
+	session = session or create_session(pool_size=1)
+
 	for attempt in range(max_retries):
-		
+
+		if rate_limiter is not None:
+			rate_limiter.acquire()
+
+		wait = backoff_delay(attempt, base=delay)
+
 		try:
-			response = urllib.request.urlopen(url)
-			data = json.loads(response.read())
-			logging.info(f"Successfully retrieved data for {symbol} from {url}")
+			response = session.get(url, timeout=FMP_TIMEOUT)
+
+			if response.status_code == 429 or response.status_code >= 500:
+				retry_after = parse_retry_after(response.headers.get('Retry-After'))
+				if retry_after is not None:
+					wait = max(wait, retry_after)
+				response.raise_for_status()
+
+			elif response.status_code >= 400:
+				logging.error(f"Request for {symbol} failed with error: {response.status_code} {response.reason}")
+				response.raise_for_status()
+
+			data = response.json()
+			logging.info(f"Successfully retrieved data for {symbol}")
 			return data
-		
-		except urllib.error.URLError as e:
-			logging.warning(f"Attempt {attempt + 1} failed with reason: {e.reason}")
-			logging.warning(f"URL: {url}")
-			if attempt < max_retries - 1:
-				time.sleep(delay)
-			else:
-				logging.error(f"Max retries reached for URL: {url}")
-				raise # Re-raise the exception if retries are exhausted
 
-		except urllib.error.HTTPError as e:
-			logging.warning(f"Attempt {attempt + 1} failed with error: {e.code} {e.reason}")
+		except requests.exceptions.HTTPError as e:
+			if e.response is not None and e.response.status_code < 500 and e.response.status_code != 429:
+				raise
+
+			logging.warning(f"Attempt {attempt + 1} for {symbol} failed with error: {e}")
 			if attempt < max_retries - 1:
-				time.sleep(delay)
+				time.sleep(wait)
 			else:
-				logging.error(f"Max retries reached for HTTP error: {e.code} {e.reason}")
+				logging.error(f"Max retries reached for HTTP error: {e}")
 				raise
 
-		except Exception as e:
-			logging.error(f"Attempt {attempt + 1} failed with unexpected error: {e}")
+		except requests.exceptions.RequestException as e:
+			logging.warning(f"Attempt {attempt + 1} for {symbol} failed with reason: {e}")
 			if attempt < max_retries - 1:
-				time.sleep(delay)
+				time.sleep(wait)
 			else:
-				logging.error(f"Max retries reached for unexpected error: {e}")
-				raise
+				logging.error(f"Max retries reached for {symbol}")
+				raise # Re-raise the exception if retries are exhausted
+
+
+def fetch_all(apikey, api_lookup, max_workers=FMP_MAX_WORKERS, requests_per_minute=FMP_REQUESTS_PER_MINUTE, base_url=FMP_BASE_URL, telemetry=None):
+	"""
+	Retrieves the historical data of every symbol in api_lookup concurrently.
+
+	All workers share one keep-alive session and one token bucket, so the total request rate never
+	exceeds requests_per_minute and wall-clock time is bound by the rate limit rather than the sum
+	of round trips.
+
+	Args:
+		apikey (str): Your API key for authenticating with the Financial Modeling Prep API.
+		api_lookup (list): Pairs of [symbol, from_date] as returned by create_api_lookup.
+		max_workers (int, optional): The number of concurrent requests.
+		requests_per_minute (int, optional): The request budget of the FMP plan.
+		base_url (str, optional): The root of the API. Override it to point at a local stub server.
+		telemetry (Telemetry, optional): Receives a 'fetch' span per symbol, including the rate limiter wait.
+
+	Returns:
+		dict: Maps each symbol to its parsed response, or to the exception raised while retrieving it.
+	"""
+	rate_limiter = RateLimiter(requests_per_minute)
+	telemetry = telemetry or Telemetry(enabled=False)
+	results = {}
+
+	def fetch(symbol, from_date):
+		with telemetry.span('fetch', symbol, from_date=from_date):
+			return retrieve_data(
+				apikey, symbol, from_date,
+				session=session, rate_limiter=rate_limiter, base_url=base_url
+			)
+
+	with create_session(pool_size=max_workers) as session:
+		with ThreadPoolExecutor(max_workers=max_workers) as executor:
+			futures = {executor.submit(fetch, symbol, from_date): symbol for symbol, from_date in api_lookup}
+
+			for future in as_completed(futures):
+				symbol = futures[future]
+				try:
+					results[symbol] = future.result()
+				except Exception as e:
+					results[symbol] = e
+
+	return results
+
+
+def raw_load_job_config(source_format=None):
+	job_config = bigquery.LoadJobConfig(
+		schema=RAW_STOCK_SCHEMA,
+		write_disposition='WRITE_TRUNCATE'
+	)
 
+	if source_format is not None:
+		job_config.source_format = source_format
+
+	return job_config
+
+
+def raw_arrow_schema():
+	# The Arrow equivalent of RAW_STOCK_SCHEMA, so both load paths produce the same column types.
+	return arrow_schema(RAW_STOCK_SCHEMA)
+
+
+def build_arrow_table(responses, timestamp):
+	"""
+	Builds a typed Arrow table straight from parsed historical-price-full responses.
+
+	Each column is converted once for the whole batch instead of mutating every row dict, and the
+	symbol and ingestion timestamp are broadcast per response rather than written into each row.
+
+	Args:
+		responses (list): Parsed API responses, each with a 'symbol' and a 'historical' list.
+		timestamp (datetime): The ingestion timestamp stamped on every row.
+
+	Returns:
+		pyarrow.Table: The rows of all responses with the raw_arrow_schema columns.
+	"""
+	schema = raw_arrow_schema()
+	rows = [row for response in responses for row in response['historical']]
+
+	columns = []
+	for field in schema:
+		if field.name == 'symbol':
+			column = pa.chunked_array(
+				[pa.repeat(response['symbol'], len(response['historical'])) for response in responses],
+				type=field.type
+			)
+		elif field.name == 'timestamp':
+			column = pa.repeat(pa.scalar(timestamp, type=field.type), len(rows))
+		elif field.name == 'date':
+			column = pa.array([row.get('date') for row in rows], type=pa.string()).cast(field.type)
+		else:
+			column = pa.array([row.get(field.name) for row in rows], type=field.type)
+		columns.append(column)
+
+	return pa.Table.from_arrays(columns, schema=schema)
+
+
+def dedupe_historical(stock_data):
+	# One row per date, the last one returned, so the MERGE never matches two source rows to a target row.
+	rows = {row.get('date'): row for row in stock_data['historical']}
+	if len(rows) < len(stock_data['historical']):
+		logging.warning(f"Dropped {len(stock_data['historical']) - len(rows)} duplicate dates for {stock_data['symbol']}.")
+		stock_data['historical'] = list(rows.values())
+	return stock_data
+
+
+def stage_json(client, responses, temp_table_ref, timestamp):
+	# Add symbol and timestamp to each row and load them as newline-delimited JSON.
+	rows = []
+	for response in responses:
+		for data in response['historical']:
+			data['symbol'] = response['symbol']
+			data['timestamp'] = timestamp.isoformat()
+		rows.extend(response['historical'])
+
+	job = client.load_table_from_json(rows, temp_table_ref, job_config=raw_load_job_config())
+	job.result()
+	return job
+
+
+def stage_parquet(client, table, temp_table_ref):
+	# Upload a table built by build_arrow_table as a single Parquet file.
+	buffer = io.BytesIO()
+	pq.write_table(table, buffer, compression='snappy')
+	buffer.seek(0)
+
+	job_config = raw_load_job_config(source_format=bigquery.SourceFormat.PARQUET)
+	job = client.load_table_from_file(buffer, temp_table_ref, job_config=job_config)
+	job.result()
+	return job
+
+
+def staged_date_range(responses):
+	# The first and last date of the rows in the responses.
+	dates = [row['date'] for response in responses for row in response['historical']]
+	return min(dates), max(dates)
+
+
+def merge_table(client, target_table_ref, temp_table_ref, symbols=None, date_range=None):
+	# Upsert the staged rows by symbol and date. Given the staged symbols and date_range, the target
+	# is filtered on them too, so only their partitions and clustered blocks are read.
+	pruning = ''
+	query_parameters = []
+	if symbols:
+		pruning += ' AND target.symbol IN UNNEST(@symbols)'
+		query_parameters.append(bigquery.ArrayQueryParameter('symbols', 'STRING', list(symbols)))
+	if date_range:
+		pruning += ' AND target.date BETWEEN @start_date AND @end_date'
+		query_parameters.append(bigquery.ScalarQueryParameter('start_date', 'DATE', date_range[0]))
+		query_parameters.append(bigquery.ScalarQueryParameter('end_date', 'DATE', date_range[1]))
 
-def merge_table(client, target_table_ref, temp_table_ref):
 	merge_query = f"""
 	MERGE INTO `{target_table_ref}` AS target
 	USING `{temp_table_ref}` AS source
-	ON target.symbol = source.symbol AND target.date = source.date
+	ON target.symbol = source.symbol AND target.date = source.date{pruning}
 	WHEN MATCHED THEN
 	UPDATE SET
 		symbol = source.symbol,
@@ -228,94 +551,343 @@ def merge_table(client, target_table_ref, temp_table_ref):
 	)
 	"""
 
-	# Execute the query
-	query_job = client.query(merge_query)
-	query_job.result() 
-
-
-def process_data(apikey, api_lookup, client, project_id, target_table_ref):
-	dataset_id = 'stock_data'
-
-	for item in api_lookup:
-		symbol = item[0]
-		from_date = item[1]
-		logging.info(f"(process_data) Processing data for {symbol} from {from_date}")
-
-		stock_data = retrieve_data(apikey, symbol, from_date)
-		if stock_data:
-			# Add symbol and timestamp to each row
-			for data in stock_data['historical']:
-				data['symbol'] = stock_data['symbol']
-				data['timestamp'] = datetime.now().isoformat()
-
-			# Create a unique temporary table
-			temp_table_id = f"temp_table_{symbol}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-			temp_table_ref = f"{project_id}.{dataset_id}.{temp_table_id}"
-
-			job_config = bigquery.LoadJobConfig(
-				schema=[
-					bigquery.SchemaField('symbol', 'STRING'),
-					bigquery.SchemaField('date', 'DATE'),
-					bigquery.SchemaField('open', 'FLOAT'),
-					bigquery.SchemaField('high', 'FLOAT'),
-					bigquery.SchemaField('low', 'FLOAT'),
-					bigquery.SchemaField('close', 'FLOAT'),
-					bigquery.SchemaField('adjClose', 'FLOAT'),
-					bigquery.SchemaField('volume', 'INTEGER'),
-					bigquery.SchemaField('unadjustedVolume', 'INTEGER'),
-					bigquery.SchemaField('change', 'FLOAT'),
-					bigquery.SchemaField('changePercent', 'FLOAT'),
-					bigquery.SchemaField('vwap', 'FLOAT'),
-					bigquery.SchemaField('label', 'STRING'),
-					bigquery.SchemaField('changeOverTime', 'FLOAT'),
-					bigquery.SchemaField('timestamp', 'TIMESTAMP'),
-				],
-				write_disposition='WRITE_TRUNCATE'
-			)
+	# Execute the query, retrying if another shard is merging into the table at the same time.
+	return run_dml(client, merge_query, bigquery.QueryJobConfig(query_parameters=query_parameters))
 
-			try:
-				# Insert data into BigQuery
-				logging.info(f"Loading data for {symbol} into temporary table: {temp_table_ref}")
-				client.load_table_from_json(stock_data['historical'], temp_table_ref, job_config=job_config).result()
-				merge_table(client, target_table_ref, temp_table_ref)
-				logging.info(f"Data successfully loaded for {symbol}.")
 
-			except Exception as e:
-				logging.error(f"Error inserting data for {symbol}: {e}")
+def process_data_batch(apikey, api_lookup, client, project_id, target_table_ref, base_url=FMP_BASE_URL, load_format=LOAD_FORMAT, requests_per_minute=FMP_REQUESTS_PER_MINUTE, journal=None, run_id=None, telemetry=None):
+	"""
+	Retrieves every symbol in api_lookup and ingests them with a single staging load and a single MERGE.
 
-			finally:
-				# Cleanup the temporary table
-				logging.info(f"Deleting temporary table: {temp_table_ref}")
-				client.delete_table(temp_table_ref, not_found_ok=True)
+	Rather than running a load job, a MERGE and a delete per symbol, this collects the rows of
+	all symbols into one staging table, so a run costs a fixed number of BigQuery jobs regardless of the
+	size of the watchlist. Symbols are retrieved concurrently with fetch_all. Each symbol's rows are
+	de-duplicated by date and converted to Arrow on their own, so a symbol that fails to retrieve or
+	returns a malformed payload is logged and left out of the batch without affecting the others.
 
-		else:
+	Args:
+		apikey (str): Your API key for authenticating with the Financial Modeling Prep API.
+		api_lookup (list): Pairs of [symbol, from_date] as returned by create_api_lookup.
+		client (bigquery.Client): The client used to run the BigQuery jobs.
+		project_id (str): The GCP project containing the stock_data dataset.
+		target_table_ref (str): The fully qualified reference of the table to merge into.
+		base_url (str, optional): The root of the FMP API.
+		load_format (str, optional): 'parquet' to upload typed Arrow columns, or 'json' to use load_table_from_json.
+		requests_per_minute (int, optional): The FMP rate limit for this process.
+		journal (RunJournal, optional): Records each symbol's fetch, load and merge status under run_id.
+		run_id (str, optional): The journal run the symbols belong to.
+		telemetry (Telemetry, optional): Receives a 'fetch' span per symbol, 'load', 'merge' and 'delete'
+										 spans for the batch, and the statistics of the load and MERGE jobs.
+
+	Returns:
+		dict: 'loaded' lists the symbols merged into the target table, 'empty' lists the symbols for which
+			  the API returned no rows, and 'failed' maps each failed symbol to its error message.
+	"""
+	summary = {'loaded': [], 'empty': [], 'failed': {}}
+	batch = []
+	tables = []
+	timestamp = datetime.now(timezone.utc)
+	session = last_completed_session()
+	telemetry = telemetry or Telemetry(enabled=False)
+
+	def record(symbols, status, error=None):
+		if journal is not None:
+			journal.record(run_id, symbols, status, error)
+
+	logging.info(f"(process_data_batch) Retrieving data for {len(api_lookup)} symbols")
+	responses = fetch_all(apikey, api_lookup, requests_per_minute=requests_per_minute, base_url=base_url, telemetry=telemetry)
+
+	for symbol, from_date in api_lookup:
+		stock_data = responses.get(symbol)
+
+		if isinstance(stock_data, Exception):
+			logging.error(f"Error retrieving data for {symbol}: {stock_data}")
+			summary['failed'][symbol] = str(stock_data)
+			record([symbol], FAILED, str(stock_data))
+			continue
+
+		# A bar of a session that hasn't closed yet is partial; it is fetched again after the close.
+		# Rows without a date are kept so the validation below fails the symbol instead of hiding them.
+		if stock_data and stock_data.get('historical'):
+			stock_data['historical'] = [
+				row for row in stock_data['historical']
+				if not row.get('date') or str(row['date'])[:10] <= str(session)
+			]
+
+		if not stock_data or not stock_data.get('historical'):
 			logging.warning(f"No data retrieved for {symbol} from {from_date}.")
+			summary['empty'].append(symbol)
+			record([symbol], EMPTY)
+			continue
 
+		expected = session_count(from_date, session)
+		if len(stock_data['historical']) < expected:
+			logging.warning(f"Retrieved {len(stock_data['historical'])} of {expected} expected sessions for {symbol} from {from_date}.")
 
+		# Built per symbol, so a malformed payload (e.g. a number sent as a string) only fails its own symbol.
+		stock_data = dedupe_historical(stock_data)
+		try:
+			table = build_arrow_table([stock_data], timestamp)
+			if table.column('date').null_count:
+				raise ValueError(f"{table.column('date').null_count} rows have no date")
+		except (pa.ArrowException, ValueError, TypeError) as e:
+			logging.error(f"Invalid data for {symbol}: {e}")
+			summary['failed'][symbol] = str(e)
+			record([symbol], FAILED, str(e))
+			continue
+
+		batch.append(stock_data)
+		tables.append(table)
+		summary['loaded'].append(symbol)
+
+	record(summary['loaded'], FETCHED)
+
+	if not batch:
+		logging.info("(process_data_batch) Nothing to load.")
+		return summary
+
+	# Unique per run, so shards started in the same second don't share a staging table.
+	temp_table_id = f"temp_table_batch_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+	temp_table_ref = f"{project_id}.{DATASET_ID}.{temp_table_id}"
+
+	try:
+		logging.info(f"Loading {len(summary['loaded'])} symbols as {load_format} into temporary table: {temp_table_ref}")
+		rows = sum(len(stock_data['historical']) for stock_data in batch)
+		with telemetry.span('load', symbols=len(batch), rows=rows, load_format=load_format):
+			if load_format == 'parquet':
+				job = stage_parquet(client, pa.concat_tables(tables), temp_table_ref)
+			else:
+				job = stage_json(client, batch, temp_table_ref, timestamp)
+		telemetry.record_job('load', job)
+		record(summary['loaded'], LOADED)
+		with telemetry.span('merge', symbols=len(batch), rows=rows):
+			job = merge_table(client, target_table_ref, temp_table_ref, summary['loaded'], staged_date_range(batch))
+		telemetry.record_job('merge', job)
+		record(summary['loaded'], MERGED)
+		logging.info(f"Data successfully loaded for {', '.join(summary['loaded'])}.")
+
+	except Exception as e:
+		# The load and the MERGE are all-or-nothing, so every symbol in the batch failed.
+		logging.error(f"Error inserting batch data: {e}")
+		for symbol in summary['loaded']:
+			summary['failed'][symbol] = str(e)
+		record(summary['loaded'], FAILED, str(e))
+		summary['loaded'] = []
+
+	finally:
+		logging.info(f"Deleting temporary table: {temp_table_ref}")
+		with telemetry.span('delete'):
+			client.delete_table(temp_table_ref, not_found_ok=True)
+
+	return summary
+
+
+def load_universe(path=SYMBOLS_FILE):
+	# One symbol per line; blank lines, '#' comments and repeated symbols are ignored.
+	symbols = []
+	seen = set()
+	with open(path) as f:
+		for line in f:
+			symbol = line.split('#', 1)[0].strip().upper()
+			if symbol and symbol not in seen:
+				seen.add(symbol)
+				symbols.append(symbol)
+	return symbols
+
+
+def shard_symbols(symbols, shard_index, shard_count):
+	# crc32 assigns every symbol to the same shard in every process, unlike the salted built-in hash().
+	return [symbol for symbol in symbols if zlib.crc32(symbol.encode()) % shard_count == shard_index]
+
+
+def parse_args(argv=None):
+	parser = argparse.ArgumentParser(description='Ingest daily prices into raw_stock_data.')
+	parser.add_argument('--symbols-file', default=SYMBOLS_FILE, help='File listing the symbols to ingest.')
+	parser.add_argument(
+		'--shard-index', type=int, default=int(os.getenv('CLOUD_RUN_TASK_INDEX', 0)),
+		help='The shard of the universe this process ingests. Defaults to CLOUD_RUN_TASK_INDEX.'
+	)
+	parser.add_argument(
+		'--shard-count', type=int, default=int(os.getenv('CLOUD_RUN_TASK_COUNT', 1)),
+		help='The number of shards the universe is split into. Defaults to CLOUD_RUN_TASK_COUNT.'
+	)
+	parser.add_argument(
+		'--resume', action='store_true',
+		help='Continue the latest unfinished run of the shard from the run journal instead of starting a new one.'
+	)
+	parser.add_argument('--journal', default=JOURNAL_PATH, help='The SQLite file of the run journal.')
+	parser.add_argument(
+		'--processes', type=int, default=1,
+		help='Ingest every shard locally, one process per shard. Overrides --shard-index and --shard-count.'
+	)
+	parser.add_argument(
+		'--migrate', action='store_true',
+		help='Only partition and cluster raw_stock_data, migrating an existing table, then exit.'
+	)
+	parser.add_argument(
+		'--enrich-all', action='store_true',
+		help="Enrich every symbol of the shard from its first raw date, ignoring the persisted indicator state."
+	)
+	args = parser.parse_args(argv)
 
-def main():
-	# Load the environment variables from the .env file (development only).
-	# Use environment variables set on the system in production.
-	load_dotenv()
+	if args.shard_count < 1 or not 0 <= args.shard_index < args.shard_count:
+		parser.error(f"--shard-index must be between 0 and {args.shard_count - 1}.")
 
-	logging.basicConfig(level=logging.DEBUG)
+	return args
+
+
+def run_shard(symbols_file, shard_index=0, shard_count=1, resume=False, journal_path=JOURNAL_PATH, enrich_all=False, benchmarks=True):
+	"""
+	Ingests one shard of the symbol universe and refreshes its derived data.
+
+	Shards can run at the same time in separate processes or job tasks: each stages into its own
+	temporary table and the MERGEs retry when they conflict. The FMP rate limit is split evenly
+	between the shards, and only shard 0 ingests the benchmark series, unless the caller ingested
+	them before starting the shards as main does. A shard that enriches before the benchmark has
+	caught up leaves the newer rows for the next run (see run_preprocessing). raw_stock_data is created
+	partitioned and clustered when missing; an existing unpartitioned table is only migrated by a
+	single-shard run, since the migration would lose rows merged by other shards meanwhile.
 
+	Every symbol's progress is recorded in the run journal. With resume, the latest unfinished run
+	of this shard is continued: symbols that were merged are only enriched, the others are fetched
+	again from their original from_date, and finished symbols are left alone. Stage timings and
+	BigQuery job statistics are written by Telemetry under TELEMETRY_DIR.
+
+	Args:
+		symbols_file (str): The file listing the symbol universe.
+		shard_index (int, optional): The shard to ingest.
+		shard_count (int, optional): The number of shards the universe is split into.
+		resume (bool, optional): Continue the latest unfinished run instead of starting a new one.
+		journal_path (str, optional): The SQLite file of the run journal.
+		enrich_all (bool, optional): Enrich every symbol of the shard from its first raw date, not only the
+									 ones ingested, e.g. to backfill enriched_stock_data.
+		benchmarks (bool, optional): Whether shard 0 ingests the benchmark series. False when the caller
+									 ingested them before starting the shards.
+
+	Returns:
+		dict: The summary returned by process_data_batch.
+	"""
 	# Retrieve the environment variables for the function.
 	apikey = os.getenv('FMP_API_KEY')
 	project_id = os.getenv('GCP_PROJECT_ID')
 
 	# Create the client to interface with BigQuery.
 	client = bigquery.Client(project=project_id)
-	dataset_id = 'stock_data'
 	target_table_id = 'raw_stock_data'
-	target_table_ref = f"{project_id}.{dataset_id}.{target_table_id}"
+	target_table_ref = f"{project_id}.{DATASET_ID}.{target_table_id}"
+
+	journal = RunJournal(journal_path)
+	run_id = journal.latest_unfinished_run(shard_index, shard_count) if resume else None
+	telemetry = Telemetry(labels={'shard': shard_index}, name=f"ingestion_shard_{shard_index}_of_{shard_count}")
+
+	try:
+		ensure_raw_table(client, target_table_ref, migrate=shard_count == 1)
+
+		# Append the missing days of the reference series (^GSPC, ^VIX) before the shards enrich against them.
+		if benchmarks and shard_index == 0:
+			try:
+				with telemetry.span('benchmarks'):
+					ingest_benchmarks(client, project_id)
+			except Exception as e:
+				# This does not stop the shard; it enriches against the stored benchmark rows.
+				logging.error(f"(run_shard) Benchmark ingestion failed: {e}")
+
+		if run_id is not None:
+			unfinished = journal.unfinished(run_id)
+			symbols = list(unfinished)
+			merged = {symbol: from_date for symbol, (from_date, status) in unfinished.items() if status == MERGED}
+			api_lookup = [[symbol, from_date] for symbol, (from_date, status) in unfinished.items() if status != MERGED]
+			logging.info(f"(run_shard) Resuming run {run_id}: {len(api_lookup)} symbols to fetch, {len(merged)} to enrich")
+		else:
+			# List the stock symbols for which data is to be retrieved.
+			symbols = shard_symbols(load_universe(symbols_file), shard_index, shard_count)
+			logging.info(f"(run_shard) Shard {shard_index + 1} of {shard_count}: {len(symbols)} symbols")
+			merged = {}
+			with telemetry.span('watermarks', symbols=len(symbols)):
+				api_lookup = create_api_lookup(query_bq(client, target_table_ref, symbols)) if symbols else []
+			run_id = journal.start_run(api_lookup, shard_index, shard_count)
+
+		telemetry.run_id = run_id
+
+		summary = {'loaded': [], 'empty': [], 'failed': {}}
+		if api_lookup:
+			requests_per_minute = max(1, FMP_REQUESTS_PER_MINUTE // shard_count)
+			summary = process_data_batch(
+				apikey, api_lookup, client, project_id, target_table_ref,
+				requests_per_minute=requests_per_minute, journal=journal, run_id=run_id, telemetry=telemetry
+			)
+
+		if summary['failed']:
+			logging.error(f"Ingestion failed for: {summary['failed']}")
+
+		# Snapshot the ticker info and analyst recommendations the dashboard displays.
+		if symbols:
+			try:
+				with telemetry.span('snapshots', symbols=len(symbols)):
+					snapshots = ingest_snapshots(client, project_id, symbols)
+				if snapshots['failed']:
+					logging.error(f"Snapshots failed for: {snapshots['failed']}")
+			except Exception as e:
+				# Snapshots are only displayed; the shard still enriches and finishes its run.
+				logging.error(f"(run_shard) Snapshot ingestion failed: {e}")
+
+		# Recompute the derived columns for the symbols and dates that changed.
+		affected = dict(merged)
+		affected.update({symbol: from_date for symbol, from_date in api_lookup if symbol in summary['loaded']})
+		if enrich_all:
+			affected.update({symbol: None for symbol in symbols if symbol not in affected})
+		with telemetry.span('preprocessing', symbols=len(affected)):
+			run_preprocessing(client, project_id, affected, enrich_all=enrich_all)
+		journal.record(run_id, list(affected), ENRICHED)
 
-	# List the stock symbols for which data is to be retrieved.
-	symbols = ['AAPL', 'TTD', 'GOOG', 'DDOG', 'PANW']
+		status = journal.finish_run(run_id)
+		logging.info(f"(run_shard) Run {run_id} is {status}.")
+
+	finally:
+		journal.close()
+		# Written even when a stage fails, so the failed span is kept.
+		telemetry.write()
+
+	return summary
+
+
+def main(argv=None):
+	# Load the environment variables from the .env file (development only).
+	# Use environment variables set on the system in production.
+	load_dotenv()
+
+	logging.basicConfig(level=logging.DEBUG)
+
+	args = parse_args(argv)
+
+	if args.migrate or args.processes > 1:
+		# Migrated once, before any shard writes to the table.
+		project_id = os.getenv('GCP_PROJECT_ID')
+		status = ensure_raw_table(bigquery.Client(project=project_id), f"{project_id}.{DATASET_ID}.raw_stock_data")
+		logging.info(f"(main) raw_stock_data is {status}.")
+		if args.migrate:
+			return "Process complete"
+
+	if args.processes > 1:
+		# Ingested once, before any shard enriches against them.
+		project_id = os.getenv('GCP_PROJECT_ID')
+		try:
+			ingest_benchmarks(bigquery.Client(project=project_id), project_id)
+		except Exception as e:
+			logging.error(f"(main) Benchmark ingestion failed: {e}")
+
+		with ProcessPoolExecutor(max_workers=args.processes) as executor:
+			futures = [
+				executor.submit(run_shard, args.symbols_file, shard_index, args.processes, args.resume, args.journal, args.enrich_all, False)
+				for shard_index in range(args.processes)
+			]
+			summaries = [future.result() for future in futures]
+	else:
+		summaries = [run_shard(args.symbols_file, args.shard_index, args.shard_count, args.resume, args.journal, args.enrich_all)]
 
-	results = query_bq(client, target_table_ref, symbols)
-	api_lookup = create_api_lookup(results)
-	process_data(apikey, api_lookup, client, project_id, target_table_ref)
+	loaded = sum(len(summary['loaded']) for summary in summaries)
+	failed = sum(len(summary['failed']) for summary in summaries)
+	logging.info(f"(main) Loaded {loaded} symbols, {failed} failed.")
 	
 	return "Process complete"
 
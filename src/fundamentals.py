@@ -0,0 +1,213 @@
+from google.cloud import bigquery
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import yfinance as yf
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import io
+import logging
+
+from src.utils import arrow_schema, query_to_dataframe
+
+TICKER_INFO_TABLE_ID = 'ticker_info_snapshot'
+RECOMMENDATIONS_TABLE_ID = 'recommendation_snapshot'
+
+# The ticker.info fields shown on the dashboard.
+SUMMARY_COLUMNS = [
+	'symbol', 'shortName', 'beta', 'trailingPE', 'forwardPE', 'fiftyTwoWeekLow', 'fiftyTwoWeekHigh', 'priceToSalesTrailing12Months', 'profitMargins',
+	'trailingEps', 'forwardEps', 'currentPrice', 'targetHighPrice', 'targetLowPrice', 'targetMeanPrice', 'targetMedianPrice',
+	'recommendationKey', 'earningsGrowth', 'revenueGrowth'
+]
+
+SUMMARY_STRING_COLUMNS = ['symbol', 'shortName', 'recommendationKey']
+
+TICKER_INFO_SCHEMA = [bigquery.SchemaField('snapshot_date', 'DATE')] + [
+	bigquery.SchemaField(column, 'STRING' if column in SUMMARY_STRING_COLUMNS else 'FLOAT') for column in SUMMARY_COLUMNS
+] + [bigquery.SchemaField('timestamp', 'TIMESTAMP')]
+
+RECOMMENDATION_COLUMNS = ['period', 'strongBuy', 'buy', 'hold', 'sell', 'strongSell']
+
+RECOMMENDATIONS_SCHEMA = [
+	bigquery.SchemaField('snapshot_date', 'DATE'),
+	bigquery.SchemaField('symbol', 'STRING'),
+	bigquery.SchemaField('period', 'STRING'),
+	bigquery.SchemaField('strongBuy', 'INTEGER'),
+	bigquery.SchemaField('buy', 'INTEGER'),
+	bigquery.SchemaField('hold', 'INTEGER'),
+	bigquery.SchemaField('sell', 'INTEGER'),
+	bigquery.SchemaField('strongSell', 'INTEGER'),
+	bigquery.SchemaField('timestamp', 'TIMESTAMP'),
+]
+
+SNAPSHOT_WORKERS = 8
+
+
+def fetch_fundamentals(symbol):
+	"""
+	Retrieves the summary fields and the analyst recommendation trend of one symbol.
+
+	Returns:
+		tuple: The SUMMARY_COLUMNS subset of ticker.info, and the recommendations DataFrame.
+	"""
+	ticker = yf.Ticker(symbol)
+	info = ticker.info
+	summary = {column: info.get(column) for column in SUMMARY_COLUMNS}
+	summary['symbol'] = symbol
+
+	recommendations = pd.DataFrame(ticker.recommendations).reindex(columns=RECOMMENDATION_COLUMNS)
+	recommendations['symbol'] = symbol
+
+	return summary, recommendations
+
+
+def snapshotted_symbols(client, table_ref, snapshot_date):
+	# Symbols that already have a snapshot for snapshot_date, so a re-run only fetches the rest.
+	query_string = f"SELECT DISTINCT symbol FROM `{table_ref}` WHERE snapshot_date = @snapshot_date"
+	job_config = bigquery.QueryJobConfig(
+		query_parameters=[bigquery.ScalarQueryParameter('snapshot_date', 'DATE', snapshot_date)]
+	)
+	return {row['symbol'] for row in client.query(query_string, job_config=job_config).result()}
+
+
+def coerce_numeric(df, columns):
+	# ticker.info and the recommendation trend are loosely typed, e.g. trailingPE='Infinity'; one bad
+	# value would fail the whole load, so anything that is not a finite number becomes null.
+	for column in df.columns.intersection(columns):
+		df[column] = pd.to_numeric(df[column], errors='coerce').replace([np.inf, -np.inf], np.nan)
+	return df
+
+
+def append_snapshot(client, table_ref, schema, df):
+	table = pa.Table.from_pandas(df.reindex(columns=[field.name for field in schema]), schema=arrow_schema(schema), preserve_index=False, safe=False)
+	buffer = io.BytesIO()
+	pq.write_table(table, buffer)
+	buffer.seek(0)
+
+	job_config = bigquery.LoadJobConfig(
+		schema=schema,
+		source_format=bigquery.SourceFormat.PARQUET,
+		write_disposition='WRITE_APPEND'
+	)
+	client.load_table_from_file(buffer, table_ref, job_config=job_config).result()
+
+
+def create_snapshot_table(client, table_ref, schema):
+	# Partitioned by snapshot_date so reading the latest snapshot only scans recent partitions.
+	table = bigquery.Table(table_ref, schema=schema)
+	table.time_partitioning = bigquery.TimePartitioning(type_=bigquery.TimePartitioningType.DAY, field='snapshot_date')
+	table.clustering_fields = ['symbol']
+	client.create_table(table, exists_ok=True)
+
+
+def ingest_snapshots(client, project_id, symbols, dataset_id='stock_data'):
+	"""
+	Snapshots the ticker info fields and recommendation trends of every symbol once per day.
+
+	All symbols are fetched in parallel and each table receives a single load job. Symbols that
+	already have today's snapshot are skipped, so the job can be re-run safely.
+
+	Args:
+		client (bigquery.Client): The client used to run the BigQuery jobs.
+		project_id (str): The GCP project containing the dataset.
+		symbols (list): The symbols to snapshot.
+		dataset_id (str, optional): The dataset holding the snapshot tables.
+
+	Returns:
+		dict: 'snapshotted' lists the symbols written and 'failed' maps each failed symbol to its error message.
+	"""
+	info_table_ref = f"{project_id}.{dataset_id}.{TICKER_INFO_TABLE_ID}"
+	recommendations_table_ref = f"{project_id}.{dataset_id}.{RECOMMENDATIONS_TABLE_ID}"
+	create_snapshot_table(client, info_table_ref, TICKER_INFO_SCHEMA)
+	create_snapshot_table(client, recommendations_table_ref, RECOMMENDATIONS_SCHEMA)
+
+	timestamp = datetime.now(timezone.utc)
+	snapshot_date = timestamp.date()
+	done = snapshotted_symbols(client, info_table_ref, snapshot_date)
+	pending = [symbol for symbol in symbols if symbol not in done]
+	summary = {'snapshotted': [], 'failed': {}}
+
+	if not pending:
+		logging.info("(ingest_snapshots) Today's snapshots already exist.")
+		return summary
+
+	def fetch(symbol):
+		try:
+			return symbol, fetch_fundamentals(symbol), None
+		except Exception as e:
+			return symbol, None, e
+
+	infos = []
+	recommendations = []
+	with ThreadPoolExecutor(max_workers=SNAPSHOT_WORKERS) as executor:
+		for symbol, result, error in executor.map(fetch, pending):
+			if error is not None:
+				logging.error(f"Error retrieving fundamentals for {symbol}: {error}")
+				summary['failed'][symbol] = str(error)
+				continue
+			infos.append(result[0])
+			recommendations.append(result[1])
+			summary['snapshotted'].append(symbol)
+
+	if not infos:
+		return summary
+
+	info_df = coerce_numeric(pd.DataFrame(infos), [column for column in SUMMARY_COLUMNS if column not in SUMMARY_STRING_COLUMNS])
+	recommendations_df = coerce_numeric(pd.concat(recommendations, ignore_index=True), RECOMMENDATION_COLUMNS[1:])
+
+	# Recommendations first: a symbol only counts as snapshotted once its info row exists.
+	for df, table_ref, schema in [
+		(recommendations_df, recommendations_table_ref, RECOMMENDATIONS_SCHEMA),
+		(info_df, info_table_ref, TICKER_INFO_SCHEMA),
+	]:
+		df['snapshot_date'] = snapshot_date
+		df['timestamp'] = timestamp
+		append_snapshot(client, table_ref, schema, df)
+
+	logging.info(f"(ingest_snapshots) Snapshotted {len(infos)} symbols for {snapshot_date}.")
+
+	return summary
+
+
+def read_latest_snapshots(client, project_id, dataset_id='stock_data', lookback_days=7):
+	"""
+	Reads the latest info snapshot of every symbol together with its recommendation trend in one query.
+
+	Args:
+		client (bigquery.Client): The client used to run the query.
+		project_id (str): The GCP project containing the dataset.
+		dataset_id (str, optional): The dataset holding the snapshot tables.
+		lookback_days (int, optional): How many days of partitions to search for the latest snapshot.
+
+	Returns:
+		pd.DataFrame: One row per symbol with the SUMMARY_COLUMNS, snapshot_date and a 'recommendations'
+					  column holding a list of {period, strongBuy, buy, hold, sell, strongSell} dicts.
+	"""
+	info_table_ref = f"{project_id}.{dataset_id}.{TICKER_INFO_TABLE_ID}"
+	recommendations_table_ref = f"{project_id}.{dataset_id}.{RECOMMENDATIONS_TABLE_ID}"
+	periods = ', '.join(f"r.`{column}`" for column in RECOMMENDATION_COLUMNS)
+
+	query_string = f"""
+		WITH latest AS (
+			SELECT * EXCEPT (`timestamp`)
+			FROM `{info_table_ref}`
+			WHERE snapshot_date >= DATE_SUB(CURRENT_DATE(), INTERVAL @lookback_days DAY)
+			QUALIFY ROW_NUMBER() OVER (PARTITION BY symbol ORDER BY snapshot_date DESC) = 1
+		),
+		trends AS (
+			SELECT r.symbol, ARRAY_AGG(STRUCT({periods}) ORDER BY r.period DESC) AS recommendations
+			FROM `{recommendations_table_ref}` AS r
+			JOIN latest USING (symbol, snapshot_date)
+			WHERE r.snapshot_date >= DATE_SUB(CURRENT_DATE(), INTERVAL @lookback_days DAY)
+			GROUP BY r.symbol
+		)
+		SELECT latest.*, trends.recommendations
+		FROM latest
+		LEFT JOIN trends USING (symbol)
+	"""
+	job_config = bigquery.QueryJobConfig(
+		query_parameters=[bigquery.ScalarQueryParameter('lookback_days', 'INT64', lookback_days)]
+	)
+
+	return query_to_dataframe(client, query_string, job_config=job_config)
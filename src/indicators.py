@@ -0,0 +1,303 @@
+import numpy as np
+import pandas as pd
+
+# EMA spans of the indicators.
+RSI_SPAN = 14
+MACD_FAST_SPAN = 12
+MACD_SLOW_SPAN = 26
+MACD_SIGNAL_SPAN = 9
+
+# Rolling beta windows, in rows, and the columns they are written to.
+BETA_WINDOWS = {
+	7: 'sevenDayBeta',
+	30: 'thirtyDayBeta',
+	90: 'ninetyDayBeta',
+	252: 'oneYearBeta',
+}
+BENCHMARK_SYMBOL = '^GSPC'
+
+
+def calculate_gain_loss(df):
+	df['gain'] = np.where(df['change'] > 0, df['change'], 0)
+	df['loss'] = np.abs(np.where(df['change'] < 0, df['change'], 0))
+	df['changePercent'] = df['close'].pct_change().fillna(0)
+	return df
+
+def calculate_rsi(df):
+
+	average_gain = df['gain'].ewm(span=RSI_SPAN, adjust=False).mean()
+	average_loss = df['loss'].ewm(span=RSI_SPAN, adjust=False).mean()
+	rs = average_gain / (average_loss + 1e-10)
+	rsi = 100 - (100 / (1 + rs))
+	df['rsi'] = rsi
+	return df
+
+def calculate_macd(df):
+
+	fast = df['close'].ewm(span=MACD_FAST_SPAN, adjust=False).mean()
+	slow = df['close'].ewm(span=MACD_SLOW_SPAN, adjust=False).mean()
+	df['macd'] = fast - slow
+	df['signal'] = df['macd'].ewm(span=MACD_SIGNAL_SPAN, adjust=False).mean()
+	df['macdHist'] = df['macd'] - df['signal']
+	return df
+
+def date_key(dates):
+	# A sortable datetime64 version of a date column that may mix date objects and strings.
+	if pd.api.types.is_datetime64_any_dtype(dates):
+		return dates.to_numpy()
+	try:
+		return pd.to_datetime(dates).to_numpy()
+	except (TypeError, ValueError):
+		return pd.to_datetime(dates.astype(str)).to_numpy()
+
+def sort_by_symbol_date(df):
+	# Sort by symbol then date and return the frame with a positional index plus the original index.
+	codes = pd.factorize(df['symbol'], sort=True)[0]
+	order = np.lexsort((date_key(df['date']), codes))
+	df = df.iloc[order]
+	return df.reset_index(drop=True), df.index
+
+def grouped_ewm(grouped, column, span):
+	# One Cython pass over every group; drop the symbol level so the result aligns with the frame.
+	return grouped[column].ewm(span=span, adjust=False).mean().droplevel(0)
+
+def ema_alpha(span):
+	return 2 / (span + 1)
+
+def rsi_from_averages(average_gain, average_loss):
+	rs = average_gain / (average_loss + 1e-10)
+	return 100 - (100 / (1 + rs))
+
+def add_gain_loss(df):
+	df['gain'] = np.where(df['change'] > 0, df['change'], 0)
+	df['loss'] = np.abs(np.where(df['change'] < 0, df['change'], 0))
+	return df
+
+def ema_columns(df):
+	# The EMA states behind RSI and MACD for a frame sorted by symbol and date with gain and loss.
+	grouped = df.groupby('symbol', sort=False)
+	fast = grouped_ewm(grouped, 'close', MACD_FAST_SPAN)
+	slow = grouped_ewm(grouped, 'close', MACD_SLOW_SPAN)
+	macd = fast - slow
+
+	return pd.DataFrame({
+		'averageGain': grouped_ewm(grouped, 'gain', RSI_SPAN),
+		'averageLoss': grouped_ewm(grouped, 'loss', RSI_SPAN),
+		'emaFast': fast,
+		'emaSlow': slow,
+		'signal': macd.groupby(df['symbol'], sort=False).ewm(span=MACD_SIGNAL_SPAN, adjust=False).mean().droplevel(0),
+	})
+
+def add_metrics(df):
+	"""
+	Adds gain, loss, changePercent, RSI and MACD columns for every symbol in a single pass.
+
+	Rather than looping over df.groupby('symbol') and running calculate_gain_loss, calculate_rsi and
+	calculate_macd on each group, the frame is sorted by symbol and date once and every indicator is
+	computed with grouped, vectorised operations. The values match the per-symbol functions.
+
+	Args:
+		df (pd.DataFrame): Daily prices with at least symbol, date, close and change columns.
+
+	Returns:
+		pd.DataFrame: The input rows sorted by symbol and date, with the indicator columns added.
+	"""
+	df, original_index = sort_by_symbol_date(df)
+	df = add_gain_loss(df)
+
+	grouped = df.groupby('symbol', sort=False)
+	df['changePercent'] = (df['close'] / grouped['close'].shift(1) - 1).fillna(0)
+
+	emas = ema_columns(df)
+	df['rsi'] = rsi_from_averages(emas['averageGain'], emas['averageLoss'])
+	df['macd'] = emas['emaFast'] - emas['emaSlow']
+	df['signal'] = emas['signal']
+	df['macdHist'] = df['macd'] - df['signal']
+
+	df.index = original_index
+	return df
+
+# Per-symbol state needed to advance the indicators by one day.
+STATE_COLUMNS = ['symbol', 'date', 'close', 'averageGain', 'averageLoss', 'emaFast', 'emaSlow', 'signal']
+
+def indicator_state(df):
+	"""
+	Computes the EMA state of every symbol as of its last row.
+
+	Args:
+		df (pd.DataFrame): Daily prices with at least symbol, date, close and change columns.
+
+	Returns:
+		pd.DataFrame: One row per symbol with the STATE_COLUMNS. Persist it, e.g. with
+					  src.local_store.write_replica, and pass it to advance_metrics on the next refresh.
+	"""
+	df, _ = sort_by_symbol_date(df)
+	df = add_gain_loss(df)
+	state = pd.concat([df[['symbol', 'close']], ema_columns(df)], axis=1)
+	state['date'] = date_key(df['date'])
+	state = state.drop_duplicates(subset='symbol', keep='last')
+
+	return state[STATE_COLUMNS].reset_index(drop=True)
+
+def advance_metrics(df, state):
+	"""
+	Computes the indicator columns of newly ingested rows from the previous EMA state.
+
+	RSI and MACD are recursive EMAs (adjust=False), so each new day only needs yesterday's state:
+	ema = alpha * value + (1 - alpha) * previous_ema. The new rows are advanced one day at a time,
+	vectorised across symbols, so the cost depends on the number of new rows and not on the length
+	of the history. Symbols missing from the state start from their first new row, as add_metrics does.
+
+	Args:
+		df (pd.DataFrame): The new rows, with at least symbol, date, close and change columns.
+						   Rows on or before a symbol's state date are ignored.
+		state (pd.DataFrame): The output of indicator_state or of a previous advance_metrics call.
+
+	Returns:
+		tuple: The new rows with the add_metrics columns, and the updated state.
+	"""
+	df, _ = sort_by_symbol_date(df)
+	state = state if state is not None else pd.DataFrame(columns=STATE_COLUMNS)
+
+	# Skip rows that are already part of the state.
+	last_dates = pd.Series(state['date'].to_numpy(), index=state['symbol'])
+	known = pd.to_datetime(df['symbol'].map(last_dates)).to_numpy(dtype='datetime64[us]')
+	dates = date_key(df['date'])
+	df = df.loc[np.isnat(known) | (dates > known)].reset_index(drop=True)
+	df = add_gain_loss(df)
+	dates = date_key(df['date'])
+
+	symbols = pd.Index(state['symbol']).union(pd.Index(df['symbol'].unique()))
+	codes = symbols.get_indexer(df['symbol'])
+	current = state.set_index('symbol').reindex(symbols)
+	values = {column: current[column].to_numpy(dtype=float, copy=True) for column in STATE_COLUMNS[2:]}
+	last_date = pd.to_datetime(current['date']).to_numpy(dtype='datetime64[us]', copy=True)
+
+	step = df.groupby('symbol', sort=False).cumcount().to_numpy()
+	close = df['close'].to_numpy(dtype=float)
+	gain = df['gain'].to_numpy(dtype=float)
+	loss = df['loss'].to_numpy(dtype=float)
+	out = {column: np.empty(len(df)) for column in ['changePercent', 'averageGain', 'averageLoss', 'emaFast', 'emaSlow', 'signal']}
+
+	for k in range(step.max() + 1 if len(df) else 0):
+		rows = np.flatnonzero(step == k)
+		code = codes[rows]
+		previous = {column: values[column][code] for column in values}
+		start = np.isnan(previous['close'])
+
+		def ema(column, value, span):
+			alpha = ema_alpha(span)
+			return np.where(start, value, alpha * value + (1 - alpha) * previous[column])
+
+		out['changePercent'][rows] = np.where(start, 0, close[rows] / previous['close'] - 1)
+		out['averageGain'][rows] = ema('averageGain', gain[rows], RSI_SPAN)
+		out['averageLoss'][rows] = ema('averageLoss', loss[rows], RSI_SPAN)
+		out['emaFast'][rows] = ema('emaFast', close[rows], MACD_FAST_SPAN)
+		out['emaSlow'][rows] = ema('emaSlow', close[rows], MACD_SLOW_SPAN)
+		out['signal'][rows] = ema('signal', out['emaFast'][rows] - out['emaSlow'][rows], MACD_SIGNAL_SPAN)
+
+		values['close'][code] = close[rows]
+		for column in ['averageGain', 'averageLoss', 'emaFast', 'emaSlow', 'signal']:
+			values[column][code] = out[column][rows]
+		last_date[code] = dates[rows]
+
+	df['changePercent'] = np.nan_to_num(out['changePercent'])
+	df['rsi'] = rsi_from_averages(out['averageGain'], out['averageLoss'])
+	df['macd'] = out['emaFast'] - out['emaSlow']
+	df['signal'] = out['signal']
+	df['macdHist'] = df['macd'] - df['signal']
+
+	new_state = pd.DataFrame({'symbol': symbols, 'date': last_date, **values})
+	new_state = new_state.dropna(subset=['close'])
+
+	return df, new_state[STATE_COLUMNS].reset_index(drop=True)
+
+def check_incremental(df, split_date, atol=1e-8):
+	"""
+	Compares advance_metrics against a full add_metrics recompute.
+
+	The rows up to split_date seed the state and the rows after it are advanced incrementally.
+
+	Args:
+		df (pd.DataFrame): Daily prices with at least symbol, date, close and change columns.
+		split_date (str or datetime): The last date included in the seed state.
+		atol (float, optional): The largest absolute difference accepted.
+
+	Returns:
+		tuple: Whether every column is within atol, and the largest absolute difference per column.
+	"""
+	columns = ['changePercent', 'rsi', 'macd', 'signal', 'macdHist']
+	split = np.datetime64(pd.Timestamp(split_date))
+	history = df.loc[date_key(df['date']) <= split]
+
+	full = add_metrics(df.copy())
+	full = full.loc[date_key(full['date']) > split]
+	incremental, _ = advance_metrics(df.copy(), indicator_state(history))
+
+	key = ['symbol', 'date']
+	full = full.assign(date=date_key(full['date'])).set_index(key)[columns].sort_index()
+	incremental = incremental.assign(date=date_key(incremental['date'])).set_index(key)[columns].sort_index()
+	differences = (full - incremental).abs().max()
+
+	return bool((differences <= atol).all()), differences
+
+def window_sums(values, window, position):
+	# Sum of the last `window` values within each group, from one cumulative sum; NaN until the window is full.
+	cumulative = np.concatenate([[0.0], np.cumsum(values)])
+	end = np.arange(1, len(values) + 1)
+	sums = cumulative[end] - cumulative[np.maximum(end - window, 0)]
+	return np.where(position >= window - 1, sums, np.nan)
+
+def calculate_beta(df, windows=BETA_WINDOWS, benchmark=BENCHMARK_SYMBOL):
+	"""
+	Adds rolling betas against the benchmark for several windows at once.
+
+	Every symbol is aligned with the benchmark's changePercent by date in one lookup. The rolling
+	covariance and variance of every window then come from cumulative sums over the whole frame,
+	so adding a window or a symbol costs a few vector operations, not another rolling pass per symbol.
+	As before, a window is computed over a symbol's own rows, needs all of them to have a benchmark
+	value, and the leading gap is back-filled.
+
+	Args:
+		df (pd.DataFrame): Prices with symbol, date and changePercent columns, including the benchmark rows.
+		windows (dict, optional): Maps each window length in rows to the name of its column.
+		benchmark (str, optional): The symbol the betas are measured against.
+
+	Returns:
+		pd.DataFrame: The rows sorted by symbol and date, with one beta column per window.
+	"""
+	df['date'] = pd.to_datetime(df['date'])
+	df, original_index = sort_by_symbol_date(df)
+
+	benchmark_returns = df.loc[df['symbol'] == benchmark].drop_duplicates(subset='date').set_index('date')['changePercent']
+	x = df['changePercent'].to_numpy(dtype=float)
+	y = df['date'].map(benchmark_returns).to_numpy(dtype=float)
+
+	codes = pd.factorize(df['symbol'])[0]
+	group_start = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+	position = np.arange(len(df)) - group_start[codes]
+
+	# Centre each symbol's series first; covariance is unaffected and the cumulative sums stay small.
+	valid = ~(np.isnan(x) | np.isnan(y))
+	x = np.where(valid, x, 0.0)
+	y = np.where(valid, y, 0.0)
+	counts = np.bincount(codes, weights=valid)
+	x = np.where(valid, x - (np.bincount(codes, weights=x) / np.maximum(counts, 1))[codes], 0.0)
+	y = np.where(valid, y - (np.bincount(codes, weights=y) / np.maximum(counts, 1))[codes], 0.0)
+
+	for window, column in windows.items():
+		n = window_sums(valid.astype(float), window, position)
+		sum_x = window_sums(x, window, position)
+		sum_y = window_sums(y, window, position)
+		sum_xy = window_sums(x * y, window, position)
+		sum_yy = window_sums(y * y, window, position)
+
+		with np.errstate(divide='ignore', invalid='ignore'):
+			covariance = (sum_xy - sum_x * sum_y / window) / (window - 1)
+			variance = (sum_yy - sum_y * sum_y / window) / (window - 1)
+			beta = np.where(n == window, covariance / variance, np.nan)
+
+		df[column] = pd.Series(beta).groupby(codes).bfill().to_numpy()
+
+	df.index = original_index
+	return df
@@ -0,0 +1,197 @@
+import os
+import json
+import logging
+import tempfile
+import time
+from datetime import timedelta
+
+import pandas as pd
+from google.cloud import bigquery
+
+from src.utils import query_to_dataframe
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Directory holding the local Parquet replicas of the BigQuery tables.
+CACHE_DIR = os.getenv('LOCAL_CACHE_DIR', os.path.join(project_root, 'data', 'cache'))
+
+# Days before the newest local date that an incremental sync_replica always reads. Rows rewritten
+# further back, e.g. by a recompute of the enriched table, widen the window to their earliest date.
+SYNC_LOOKBACK_DAYS = int(os.getenv('REPLICA_SYNC_LOOKBACK_DAYS', 7))
+# Rows are stamped when their batch starts but committed when its MERGE finishes, so concurrent
+# shards can commit rows older than the newest local watermark. Each sync re-reads this window.
+SYNC_OVERLAP_MINUTES = int(os.getenv('REPLICA_SYNC_OVERLAP_MINUTES', 120))
+
+
+def replica_path(name):
+	return os.path.join(CACHE_DIR, f"{name}.parquet")
+
+
+def read_replica(name, columns=None, filters=None):
+	"""
+	Reads a local replica.
+
+	Args:
+		name (str): The name of the replica, e.g. 'raw_stock_data'.
+		columns (list, optional): The columns to read. Defaults to all columns.
+		filters (list, optional): pyarrow filters pushed down into the Parquet scan.
+
+	Returns:
+		pd.DataFrame: The replica, or None if it does not exist yet.
+	"""
+	path = replica_path(name)
+	if not os.path.exists(path):
+		return None
+	return pd.read_parquet(path, columns=columns, filters=filters)
+
+
+def write_replica(name, df):
+	# Write to a temporary file first so concurrent readers never see a partial file.
+	os.makedirs(CACHE_DIR, exist_ok=True)
+	fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR, suffix='.parquet.tmp')
+	os.close(fd)
+	try:
+		df.to_parquet(tmp_path, index=False)
+		os.replace(tmp_path, replica_path(name))
+	finally:
+		if os.path.exists(tmp_path):
+			os.remove(tmp_path)
+
+
+def read_cached_json(name, ttl=None):
+	"""
+	Reads a JSON document from the local cache.
+
+	Args:
+		name (str): The name of the entry, e.g. 'ticker_info/AAPL'.
+		ttl (datetime.timedelta, optional): The maximum age of the entry. None accepts any age.
+
+	Returns:
+		The cached document, or None if it is missing or older than ttl.
+	"""
+	path = os.path.join(CACHE_DIR, f"{name}.json")
+	if not os.path.exists(path):
+		return None
+	if ttl is not None and time.time() - os.path.getmtime(path) > ttl.total_seconds():
+		return None
+	with open(path) as f:
+		return json.load(f)
+
+
+def write_cached_json(name, data):
+	path = os.path.join(CACHE_DIR, f"{name}.json")
+	os.makedirs(os.path.dirname(path), exist_ok=True)
+	fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.json.tmp')
+	with os.fdopen(fd, 'w') as f:
+		json.dump(data, f, default=str)
+	os.replace(tmp_path, path)
+
+
+def query_rows(client, table_ref, columns, where=None, query_parameters=None):
+	select = ', '.join(f"`{column}`" for column in columns)
+	query_string = f"SELECT {select} FROM `{table_ref}`"
+	if where:
+		query_string += f" WHERE {where}"
+	return query_to_dataframe(client, query_string, job_config=bigquery.QueryJobConfig(query_parameters=query_parameters or []))
+
+
+def earliest_change(client, table_ref, since, watermark_column='timestamp', date_column='date'):
+	# Only the watermark and date columns are scanned, so this is far cheaper than reading the rows.
+	query_string = f"SELECT MIN(`{date_column}`) AS earliest FROM `{table_ref}` WHERE `{watermark_column}` > @since"
+	job_config = bigquery.QueryJobConfig(query_parameters=[bigquery.ScalarQueryParameter('since', 'TIMESTAMP', since)])
+	earliest = query_to_dataframe(client, query_string, job_config=job_config)['earliest'].iloc[0]
+	return None if pd.isna(earliest) else pd.Timestamp(earliest).date()
+
+
+def sync_replica(client, table_ref, name, columns, keys=('symbol', 'date'), watermark_column='timestamp', date_column='date', lookback_days=SYNC_LOOKBACK_DAYS, overlap_minutes=SYNC_OVERLAP_MINUTES):
+	"""
+	Brings a local replica of a BigQuery table up to date.
+
+	The table's metadata is read first, which is free: when its modification time is the one recorded
+	by the previous sync, no query runs. Otherwise only rows dated at most lookback_days before the
+	newest local date are requested, and of those the ones whose date_column is newer than the replica's
+	or whose watermark_column is at most overlap_minutes older than the replica's newest. The overlap
+	catches rows of a batch that committed after a later-stamped one; rows read again are harmless. The date predicate lets BigQuery prune the partitions of raw_stock_data,
+	so a warm sync is billed for that window rather than the whole table. Updated rows replace their
+	local copy by keys. If the replica then holds a different number of rows than the table, e.g.
+	because a new symbol's history was backfilled, the whole table is read again. Read the result
+	with read_replica, which can push a date filter into the Parquet scan.
+
+	Args:
+		client (bigquery.Client): The client used to query the table.
+		table_ref (str): The fully qualified reference of the table.
+		name (str): The name of the local replica.
+		columns (list): The columns to replicate; must include keys, watermark_column and date_column.
+		keys (tuple, optional): The columns identifying a row.
+		watermark_column (str, optional): The ingestion timestamp column.
+		date_column (str, optional): The business date column.
+		lookback_days (int, optional): How far before the newest local date an incremental sync reads.
+		overlap_minutes (int, optional): How far before the newest local watermark an incremental sync reads.
+
+	Returns:
+		int: The number of rows fetched from BigQuery.
+	"""
+	# Only the watermark columns are needed to build the incremental query.
+	marks = read_replica(name, columns=[watermark_column, date_column])
+	state_name = f"replica_state/{name}"
+	state = read_cached_json(state_name) or {}
+
+	try:
+		table = client.get_table(table_ref)
+		modified = table.modified.isoformat() if table.modified else None
+		if marks is not None and modified is not None and modified == state.get('modified'):
+			return 0
+
+		if marks is None or marks.empty:
+			new = query_rows(client, table_ref, columns)
+		else:
+			max_date = pd.Timestamp(marks[date_column].max()).date()
+			watermark = marks[watermark_column].max()
+			since = max_date - timedelta(days=lookback_days)
+			earliest = earliest_change(client, table_ref, watermark - timedelta(minutes=overlap_minutes), watermark_column, date_column)
+			if earliest is not None and earliest < since:
+				logging.info(f"Rows of {table_ref} were rewritten back to {earliest}; widening the {name} sync window.")
+				since = earliest
+			new = query_rows(
+				client, table_ref, columns,
+				f"`{date_column}` >= @since AND (`{watermark_column}` > TIMESTAMP_SUB(@watermark, INTERVAL @overlap MINUTE) OR `{date_column}` > @max_date)",
+				[
+					bigquery.ScalarQueryParameter('since', 'DATE', since),
+					bigquery.ScalarQueryParameter('watermark', 'TIMESTAMP', watermark),
+					bigquery.ScalarQueryParameter('overlap', 'INT64', overlap_minutes),
+					bigquery.ScalarQueryParameter('max_date', 'DATE', max_date),
+				]
+			)
+	except Exception as e:
+		if marks is None:
+			raise
+		logging.warning(f"Could not sync {name}, using the local replica: {e}")
+		return 0
+
+	logging.info(f"Synced {len(new)} new or updated rows into the {name} replica.")
+
+	local = read_replica(name)
+	if local is None or local.empty:
+		replica = new
+	elif new.empty:
+		replica = local
+	else:
+		replica = pd.concat([local, new], ignore_index=True)
+		replica = replica.sort_values(watermark_column, kind='stable')
+		replica = replica.drop_duplicates(subset=list(keys), keep='last')
+
+	if table.num_rows is not None and len(replica) != table.num_rows:
+		logging.warning(f"The {name} replica has {len(replica)} rows but {table_ref} has {table.num_rows}; reading the whole table.")
+		try:
+			replica = query_rows(client, table_ref, columns)
+		except Exception as e:
+			logging.warning(f"Could not resync {name}: {e}")
+			modified = None
+
+	if replica is not local:
+		replica = replica.sort_values(list(keys), kind='stable').reset_index(drop=True)
+		write_replica(name, replica)
+	# A failed resync records no modification time, so the next sync tries again.
+	write_cached_json(state_name, {'modified': modified})
+
+	return len(new)
@@ -0,0 +1,197 @@
+from google.cloud import bigquery
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import yfinance as yf
+from datetime import datetime, timezone
+import io
+import uuid
+import logging
+
+from src.local_store import read_replica
+from src.trading_calendar import last_completed_session, next_session
+from src.utils import arrow_schema, query_to_dataframe, run_dml
+
+
+# Reference series stored next to raw_stock_data so the dashboard never downloads them itself.
+BENCHMARK_TABLE_ID = 'benchmark_data'
+BENCHMARK_SYMBOLS = ['^GSPC', '^VIX']
+BENCHMARK_DEFAULT_START = '2023-01-01'
+
+BENCHMARK_SCHEMA = [
+	bigquery.SchemaField('symbol', 'STRING'),
+	bigquery.SchemaField('date', 'DATE'),
+	bigquery.SchemaField('open', 'FLOAT'),
+	bigquery.SchemaField('high', 'FLOAT'),
+	bigquery.SchemaField('low', 'FLOAT'),
+	bigquery.SchemaField('close', 'FLOAT'),
+	bigquery.SchemaField('adjClose', 'FLOAT'),
+	bigquery.SchemaField('volume', 'INTEGER'),
+	bigquery.SchemaField('change', 'FLOAT'),
+	bigquery.SchemaField('timestamp', 'TIMESTAMP'),
+]
+
+BENCHMARK_COLUMNS = [field.name for field in BENCHMARK_SCHEMA]
+
+
+def download_benchmark(symbol, start_date, previous_close=None):
+	"""
+	Downloads the daily prices of completed sessions for a benchmark symbol in the benchmark_data layout.
+
+	Args:
+		symbol (str): The yfinance ticker, e.g. '^GSPC'.
+		start_date (str or date): The first date to download.
+		previous_close (float, optional): The close before start_date, used for the first row's change.
+										  Without it the first change is back-filled.
+
+	Returns:
+		pd.DataFrame: One row per day with the BENCHMARK_COLUMNS except timestamp.
+	"""
+	# Only completed sessions: during market hours yfinance would add a partial bar for today.
+	last_date = last_completed_session()
+	data = yf.download(symbol, start=start_date, end=next_session(last_date), auto_adjust=False, progress=False)
+
+	if isinstance(data.columns, pd.MultiIndex):
+		data.columns = data.columns.get_level_values(0)
+
+	data = data.reset_index()
+	data.columns = data.columns.str.lower()
+	data = data.rename(columns={'adj close': 'adjClose'})
+	data['symbol'] = symbol
+	data['date'] = pd.to_datetime(data['date']).dt.date
+	data = data.loc[(data['date'] >= pd.Timestamp(start_date).date()) & (data['date'] <= last_date)]
+
+	if previous_close is not None:
+		data['change'] = data['close'].diff()
+		if not data.empty:
+			data.loc[data.index[0], 'change'] = data['close'].iloc[0] - previous_close
+	else:
+		data['change'] = data['close'].diff().bfill()
+
+	return data.reindex(columns=BENCHMARK_COLUMNS[:-1])
+
+
+def merge_benchmarks(client, table_ref, temp_table_ref):
+	# Upsert the staged rows by symbol and date, so a re-fetched day replaces the stored one.
+	columns = BENCHMARK_COLUMNS
+	merge_query = f"""
+	MERGE INTO `{table_ref}` AS target
+	USING `{temp_table_ref}` AS source
+	ON target.`symbol` = source.`symbol` AND target.`date` = source.`date`
+	WHEN MATCHED THEN
+	UPDATE SET
+		{', '.join(f"`{column}` = source.`{column}`" for column in columns[2:])}
+	WHEN NOT MATCHED THEN
+	INSERT ({', '.join(f"`{column}`" for column in columns)})
+	VALUES ({', '.join(f"source.`{column}`" for column in columns)})
+	"""
+	return run_dml(client, merge_query)
+
+
+def ingest_benchmarks(client, project_id, symbols=BENCHMARK_SYMBOLS, dataset_id='stock_data'):
+	"""
+	Refreshes benchmark_data for each benchmark symbol from its last stored date.
+
+	The last stored day is downloaded again, since it may have been stored before the session closed,
+	and the rows are merged by symbol and date, so running twice on the same day never duplicates a row.
+
+	Args:
+		client (bigquery.Client): The client used to run the BigQuery jobs.
+		project_id (str): The GCP project containing the dataset.
+		symbols (list, optional): The benchmark tickers to keep up to date.
+		dataset_id (str, optional): The dataset holding benchmark_data.
+
+	Returns:
+		int: The number of rows merged.
+	"""
+	table_ref = f"{project_id}.{dataset_id}.{BENCHMARK_TABLE_ID}"
+	client.create_table(bigquery.Table(table_ref, schema=BENCHMARK_SCHEMA), exists_ok=True)
+
+	# The last two rows of each symbol: the day to re-fetch and the close before it.
+	query_string = f"""
+		SELECT symbol, ARRAY_AGG(STRUCT(`date`, `close`) ORDER BY `date` DESC LIMIT 2) AS last_rows
+		FROM `{table_ref}`
+		WHERE symbol IN UNNEST(@symbols)
+		GROUP BY symbol
+	"""
+	job_config = bigquery.QueryJobConfig(
+		query_parameters=[bigquery.ArrayQueryParameter('symbols', 'STRING', symbols)]
+	)
+	last_rows = {row['symbol']: row['last_rows'] for row in client.query(query_string, job_config=job_config).result()}
+
+	frames = []
+	for symbol in symbols:
+		last = last_rows.get(symbol)
+		if last:
+			previous_close = last[1]['close'] if len(last) > 1 else None
+			frames.append(download_benchmark(symbol, last[0]['date'], previous_close=previous_close))
+		else:
+			frames.append(download_benchmark(symbol, BENCHMARK_DEFAULT_START))
+
+	df = pd.concat(frames, ignore_index=True)
+	if df.empty:
+		logging.info("(ingest_benchmarks) Benchmarks are up to date.")
+		return 0
+
+	df['timestamp'] = datetime.now(timezone.utc)
+	table = pa.Table.from_pandas(df, schema=arrow_schema(BENCHMARK_SCHEMA), preserve_index=False, safe=False)
+	buffer = io.BytesIO()
+	pq.write_table(table, buffer)
+	buffer.seek(0)
+
+	temp_table_ref = f"{project_id}.{dataset_id}.temp_table_benchmarks_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+	job_config = bigquery.LoadJobConfig(
+		schema=BENCHMARK_SCHEMA,
+		source_format=bigquery.SourceFormat.PARQUET,
+		write_disposition='WRITE_TRUNCATE'
+	)
+
+	try:
+		client.load_table_from_file(buffer, temp_table_ref, job_config=job_config).result()
+		merge_benchmarks(client, table_ref, temp_table_ref)
+	finally:
+		client.delete_table(temp_table_ref, not_found_ok=True)
+	logging.info(f"(ingest_benchmarks) Merged {len(df)} rows into {table_ref}.")
+
+	return len(df)
+
+
+def read_benchmark_history(client, table_ref, symbol, start_date):
+	# Benchmark rows from BigQuery, for jobs that do not keep a local replica.
+	query_string = f"""
+		SELECT {', '.join(f'`{column}`' for column in BENCHMARK_COLUMNS[:-1])}
+		FROM `{table_ref}`
+		WHERE `symbol` = @symbol AND `date` >= @start_date
+	"""
+	job_config = bigquery.QueryJobConfig(
+		query_parameters=[
+			bigquery.ScalarQueryParameter('symbol', 'STRING', symbol),
+			bigquery.ScalarQueryParameter('start_date', 'DATE', start_date),
+		]
+	)
+	return query_to_dataframe(client, query_string, job_config=job_config)
+
+
+def read_benchmark(symbol, start_date=None, end_date=None):
+	"""
+	Reads a benchmark series from the local benchmark_data replica.
+
+	Args:
+		symbol (str): The benchmark ticker, e.g. '^GSPC' or '^VIX'.
+		start_date (date, optional): The first date to read.
+		end_date (date, optional): The day after the last date to read.
+
+	Returns:
+		pd.DataFrame: The series sorted by date, in the benchmark_data layout without timestamp.
+	"""
+	filters = [('symbol', '=', symbol)]
+	if start_date is not None:
+		filters.append(('date', '>=', pd.Timestamp(start_date).date()))
+	if end_date is not None:
+		filters.append(('date', '<', pd.Timestamp(end_date).date()))
+
+	df = read_replica(BENCHMARK_TABLE_ID, columns=BENCHMARK_COLUMNS[:-1], filters=filters)
+	if df is None:
+		return pd.DataFrame(columns=BENCHMARK_COLUMNS[:-1])
+
+	return df.sort_values('date').reset_index(drop=True)
@@ -0,0 +1,344 @@
+from google.cloud import bigquery
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pandas as pd
+from datetime import datetime, timedelta, timezone
+import io
+import uuid
+import logging
+
+from google.api_core.exceptions import NotFound
+from src.indicators import add_metrics, calculate_beta, indicator_state, advance_metrics, BETA_WINDOWS, BENCHMARK_SYMBOL, STATE_COLUMNS
+from src.market_data import read_benchmark_history, BENCHMARK_TABLE_ID
+from src.utils import arrow_schema, query_to_dataframe, run_dml
+
+DATASET_ID = 'stock_data'
+RAW_TABLE_ID = 'raw_stock_data'
+ENRICHED_TABLE_ID = 'enriched_stock_data'
+STATE_TABLE_ID = 'indicator_state'
+
+# Calendar days of history read before the first affected date so the indicators have warmed up.
+# The recursive EMAs (adjust=False) weight their starting value by (1 - 2 / (span + 1)) ** n after n rows.
+# For the slowest one, the 26-day EMA behind MACD, ~185 trading days bring that weight below 1e-6, so
+# RSI, MACD and signal match a full-history computation to within 1e-6 of the price scale. The rolling
+# betas are exact once their longest window (252 rows) fits in the warm-up, which 380 calendar days guarantee.
+WARMUP_DAYS = 380
+
+# Schema of enriched_stock_data: the prices load_data displays plus every derived column.
+ENRICHED_SCHEMA = [
+	bigquery.SchemaField('symbol', 'STRING'),
+	bigquery.SchemaField('date', 'DATE'),
+	bigquery.SchemaField('open', 'FLOAT'),
+	bigquery.SchemaField('high', 'FLOAT'),
+	bigquery.SchemaField('low', 'FLOAT'),
+	bigquery.SchemaField('close', 'FLOAT'),
+	bigquery.SchemaField('adjClose', 'FLOAT'),
+	bigquery.SchemaField('volume', 'INTEGER'),
+	bigquery.SchemaField('change', 'FLOAT'),
+	bigquery.SchemaField('changePercent', 'FLOAT'),
+	bigquery.SchemaField('gain', 'FLOAT'),
+	bigquery.SchemaField('loss', 'FLOAT'),
+	bigquery.SchemaField('rsi', 'FLOAT'),
+	bigquery.SchemaField('macd', 'FLOAT'),
+	bigquery.SchemaField('signal', 'FLOAT'),
+	bigquery.SchemaField('macdHist', 'FLOAT'),
+] + [bigquery.SchemaField(column, 'FLOAT') for column in BETA_WINDOWS.values()] + [
+	bigquery.SchemaField('timestamp', 'TIMESTAMP'),
+]
+
+ENRICHED_COLUMNS = [field.name for field in ENRICHED_SCHEMA]
+
+# Schema of indicator_state: each symbol's EMA state as of its last enriched row, see advance_metrics.
+STATE_SCHEMA = [
+	bigquery.SchemaField('symbol', 'STRING'),
+	bigquery.SchemaField('date', 'DATE'),
+] + [bigquery.SchemaField(column, 'FLOAT') for column in STATE_COLUMNS[2:]] + [
+	bigquery.SchemaField('timestamp', 'TIMESTAMP'),
+]
+
+
+def read_raw_history(client, raw_table_ref, symbols, start_date=None):
+	# Raw prices of the affected symbols from start_date onwards, or their whole history without one.
+	query_parameters = [bigquery.ArrayQueryParameter('symbols', 'STRING', symbols)]
+	where = "`symbol` IN UNNEST(@symbols)"
+	if start_date is not None:
+		query_parameters.append(bigquery.ScalarQueryParameter('start_date', 'DATE', start_date))
+		where += " AND `date` >= @start_date"
+
+	query_string = f"""
+		SELECT `adjClose`, `change`, `changePercent`, `close`, `date`, `high`, `low`, `open`, `symbol`, `volume`
+		FROM `{raw_table_ref}`
+		WHERE {where}
+	"""
+
+	job_config = bigquery.QueryJobConfig(query_parameters=query_parameters)
+
+	return query_to_dataframe(client, query_string, job_config=job_config)
+
+
+def read_indicator_state(client, state_table_ref, symbols):
+	# The persisted EMA state of the symbols; empty before the state table exists.
+	query_string = f"""
+		SELECT {', '.join(f'`{column}`' for column in STATE_COLUMNS)}
+		FROM `{state_table_ref}`
+		WHERE `symbol` IN UNNEST(@symbols)
+	"""
+	job_config = bigquery.QueryJobConfig(
+		query_parameters=[bigquery.ArrayQueryParameter('symbols', 'STRING', symbols)]
+	)
+
+	try:
+		state = query_to_dataframe(client, query_string, job_config=job_config)
+	except NotFound:
+		return pd.DataFrame(columns=STATE_COLUMNS)
+
+	state['date'] = pd.to_datetime(state['date'])
+	return state
+
+
+def read_enriched_returns(client, enriched_table_ref, symbols, start_date):
+	# The stored changePercent of the symbols from start_date, the history the betas of new rows need.
+	query_string = f"""
+		SELECT `symbol`, `date`, `changePercent`
+		FROM `{enriched_table_ref}`
+		WHERE `symbol` IN UNNEST(@symbols) AND `date` >= @start_date
+	"""
+	job_config = bigquery.QueryJobConfig(
+		query_parameters=[
+			bigquery.ArrayQueryParameter('symbols', 'STRING', symbols),
+			bigquery.ScalarQueryParameter('start_date', 'DATE', start_date),
+		]
+	)
+	return query_to_dataframe(client, query_string, job_config=job_config)
+
+
+def through_date(prices, end_date):
+	# Holds back the rows after the benchmark's last date: their betas would be NaN. They are after the
+	# state date, which stays before them, so the next run enriches them once the benchmark has caught up.
+	kept = prices.loc[pd.to_datetime(prices['date']) <= end_date] if not prices.empty else prices
+	if len(kept) < len(prices):
+		logging.warning(f"(run_preprocessing) Holding back {len(prices) - len(kept)} rows after the benchmark's last date, {end_date}.")
+	return kept
+
+
+def finish_rows(df):
+	# The ENRICHED_COLUMNS in the table's types, stamped with the enrichment time.
+	df = df.reindex(columns=ENRICHED_COLUMNS)
+	df['date'] = pd.to_datetime(df['date']).dt.date
+	df['timestamp'] = datetime.now(timezone.utc)
+	return df.reset_index(drop=True)
+
+
+def enrich(prices, benchmark, first_dates):
+	"""
+	Computes the indicator and beta columns from the full warm-up history and keeps the changed rows.
+
+	Args:
+		prices (pd.DataFrame): Raw prices of the symbols, including the warm-up history.
+		benchmark (pd.DataFrame): Benchmark prices covering the same dates.
+		first_dates (dict): Maps each symbol to write, the benchmark included, to its first changed date.
+
+	Returns:
+		pd.DataFrame: The rows of those symbols from their first date, with the ENRICHED_COLUMNS.
+	"""
+	df = pd.concat([prices, benchmark])
+	df = add_metrics(df)
+	df = calculate_beta(df)
+
+	df = df.loc[df['date'] >= pd.to_datetime(df['symbol'].map(first_dates))]
+
+	return finish_rows(df)
+
+
+def enrich_incremental(prices, state, history, benchmark):
+	"""
+	Computes the indicator and beta columns of new rows from the persisted EMA state.
+
+	RSI and MACD are advanced from each symbol's state with advance_metrics, so no warm-up history
+	is read for them. The betas only need changePercent, which comes from the rows already in
+	enriched_stock_data.
+
+	Args:
+		prices (pd.DataFrame): Raw prices of the symbols after their state date.
+		state (pd.DataFrame): The symbols' rows of indicator_state.
+		history (pd.DataFrame): symbol, date and changePercent of the enriched rows up to each state date,
+								covering the longest beta window.
+		benchmark (pd.DataFrame): Benchmark prices covering the history and the new rows.
+
+	Returns:
+		tuple: The new rows with the ENRICHED_COLUMNS, and the advanced state.
+	"""
+	df, new_state = advance_metrics(prices, state)
+	df['date'] = pd.to_datetime(df['date'])
+
+	benchmark_returns = add_metrics(benchmark.copy())
+	returns = pd.concat([
+		history[['symbol', 'date', 'changePercent']],
+		df[['symbol', 'date', 'changePercent']],
+		benchmark_returns[['symbol', 'date', 'changePercent']],
+	])
+	returns['date'] = pd.to_datetime(returns['date'])
+	betas = calculate_beta(returns.reset_index(drop=True))
+
+	df = df.merge(betas[['symbol', 'date', *BETA_WINDOWS.values()]], on=['symbol', 'date'], how='left')
+
+	return finish_rows(df), new_state
+
+
+def merge_rows(client, target_table_ref, temp_table_ref, columns, keys):
+	# Upsert the staged rows by keys, updating every column.
+	condition = ' AND '.join(f"target.`{key}` = source.`{key}`" for key in keys)
+	update = ',\n\t\t'.join(f"`{column}` = source.`{column}`" for column in columns)
+	insert = ', '.join(f"`{column}`" for column in columns)
+	values = ', '.join(f"source.`{column}`" for column in columns)
+
+	merge_query = f"""
+	MERGE INTO `{target_table_ref}` AS target
+	USING `{temp_table_ref}` AS source
+	ON {condition}
+	WHEN MATCHED THEN
+	UPDATE SET
+		{update}
+	WHEN NOT MATCHED THEN
+	INSERT ({insert})
+	VALUES ({values})
+	"""
+
+	# Shards enriching at the same time all update the benchmark rows.
+	run_dml(client, merge_query)
+
+
+def write_rows(client, df, project_id, target_table_ref, schema, keys):
+	# Stage the rows as Parquet, merge them into the target table by keys, then drop the staging table.
+	client.create_table(bigquery.Table(target_table_ref, schema=schema), exists_ok=True)
+
+	table = pa.Table.from_pandas(df, schema=arrow_schema(schema), preserve_index=False, safe=False)
+	buffer = io.BytesIO()
+	pq.write_table(table, buffer)
+	buffer.seek(0)
+
+	temp_table_id = f"temp_table_{target_table_ref.rsplit('.', 1)[-1]}_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+	temp_table_ref = f"{project_id}.{DATASET_ID}.{temp_table_id}"
+
+	job_config = bigquery.LoadJobConfig(
+		schema=schema,
+		source_format=bigquery.SourceFormat.PARQUET,
+		write_disposition='WRITE_TRUNCATE'
+	)
+
+	try:
+		logging.info(f"Loading {len(df)} rows into temporary table: {temp_table_ref}")
+		client.load_table_from_file(buffer, temp_table_ref, job_config=job_config).result()
+		merge_rows(client, target_table_ref, temp_table_ref, [field.name for field in schema], keys)
+
+	finally:
+		logging.info(f"Deleting temporary table: {temp_table_ref}")
+		client.delete_table(temp_table_ref, not_found_ok=True)
+
+
+def write_enriched(client, df, project_id, target_table_ref):
+	write_rows(client, df, project_id, target_table_ref, ENRICHED_SCHEMA, ('symbol', 'date'))
+
+
+def write_indicator_state(client, state, project_id, state_table_ref):
+	state = state.assign(date=pd.to_datetime(state['date']).dt.date, timestamp=datetime.now(timezone.utc))
+	write_rows(client, state, project_id, state_table_ref, STATE_SCHEMA, ('symbol',))
+
+
+def run_preprocessing(client, project_id, affected, enrich_all=False):
+	"""
+	Refreshes enriched_stock_data for the symbols and dates an ingestion run changed.
+
+	Each symbol's EMA state is persisted in indicator_state after its rows are written. A symbol whose
+	new rows all come after its state date is advanced incrementally: only those raw rows and the
+	enriched changePercent the betas need are read. A symbol re-ingested on or before its state date
+	is recomputed from WARMUP_DAYS before its first changed date. A symbol without state has never
+	been enriched, so all of its raw rows are, from its first raw date. Only the changed rows are
+	written back, plus the benchmark's from the earliest of them. Rows after the benchmark's last
+	date are left for a later run, so none is stored without its betas.
+
+	Args:
+		client (bigquery.Client): The client used to run the BigQuery jobs.
+		project_id (str): The GCP project containing the stock_data dataset.
+		affected (dict): Maps each ingested symbol to the first date it was ingested from ('YYYY-MM-DD').
+		enrich_all (bool, optional): Ignore the state and enrich every symbol from its first raw date.
+
+	Returns:
+		int: The number of enriched rows written.
+	"""
+	if not affected:
+		logging.info("(run_preprocessing) Nothing to enrich.")
+		return 0
+
+	raw_table_ref = f"{project_id}.{DATASET_ID}.{RAW_TABLE_ID}"
+	enriched_table_ref = f"{project_id}.{DATASET_ID}.{ENRICHED_TABLE_ID}"
+	state_table_ref = f"{project_id}.{DATASET_ID}.{STATE_TABLE_ID}"
+	warmup = timedelta(days=WARMUP_DAYS)
+
+	affected = {symbol: pd.Timestamp(from_date) for symbol, from_date in affected.items() if symbol != BENCHMARK_SYMBOL}
+	if enrich_all:
+		state = pd.DataFrame(columns=STATE_COLUMNS)
+	else:
+		state = read_indicator_state(client, state_table_ref, list(affected))
+	state_dates = dict(zip(state['symbol'], state['date']))
+
+	incremental = {symbol: state_dates[symbol] for symbol, from_date in affected.items() if symbol in state_dates and from_date > state_dates[symbol]}
+	recompute = {symbol: from_date for symbol, from_date in affected.items() if symbol in state_dates and symbol not in incremental}
+	backfill = [symbol for symbol in affected if symbol not in state_dates]
+
+	frames = []
+	states = []
+	prices = []
+
+	# The first date written for each symbol; the benchmark's rows are refreshed from the earliest.
+	first_dates = {symbol: state_date + timedelta(days=1) for symbol, state_date in incremental.items()}
+	first_dates.update(recompute)
+	if recompute:
+		prices.append(read_raw_history(client, raw_table_ref, list(recompute), (min(recompute.values()) - warmup).date()))
+	if backfill:
+		history = read_raw_history(client, raw_table_ref, backfill)
+		first_dates.update(pd.to_datetime(history['date']).groupby(history['symbol']).min().to_dict())
+		prices.append(history)
+	prices = pd.concat(prices, ignore_index=True) if prices else pd.DataFrame()
+
+	if not first_dates:
+		logging.warning("(run_preprocessing) No raw rows found for the affected symbols.")
+		return 0
+	first_date = min(first_dates.values())
+
+	benchmark_table_ref = f"{project_id}.{DATASET_ID}.{BENCHMARK_TABLE_ID}"
+	benchmark = read_benchmark_history(client, benchmark_table_ref, BENCHMARK_SYMBOL, (first_date - warmup).date())
+	benchmark_end = pd.to_datetime(benchmark['date']).max()
+	prices = through_date(prices, benchmark_end)
+
+	if not prices.empty:
+		states.append(indicator_state(prices))
+	full_dates = {symbol: first_dates[symbol] for symbol in first_dates if symbol not in incremental}
+	frames.append(enrich(prices, benchmark, {**full_dates, BENCHMARK_SYMBOL: first_date}))
+
+	if incremental:
+		prices = read_raw_history(client, raw_table_ref, list(incremental), min(first_dates[symbol] for symbol in incremental).date())
+		prices = prices.loc[pd.to_datetime(prices['date']) > pd.to_datetime(prices['symbol'].map(incremental))]
+		prices = through_date(prices, benchmark_end)
+		if not prices.empty:
+			history = read_enriched_returns(client, enriched_table_ref, list(prices['symbol'].unique()), (first_date - warmup).date())
+			history = history.loc[pd.to_datetime(history['date']) <= pd.to_datetime(history['symbol'].map(incremental))]
+			rows, advanced = enrich_incremental(prices, state.loc[state['symbol'].isin(incremental)], history, benchmark)
+			frames.append(rows)
+			states.append(advanced)
+
+	df = pd.concat(frames, ignore_index=True)
+	if df.empty:
+		logging.warning("(run_preprocessing) No raw rows found for the affected symbols.")
+		return 0
+
+	write_enriched(client, df, project_id, enriched_table_ref)
+	# Written after the rows, so a failed run leaves an older state and the next run recomputes from it.
+	if states:
+		write_indicator_state(client, pd.concat(states, ignore_index=True), project_id, state_table_ref)
+	logging.info(
+		f"(run_preprocessing) Enriched {len(df)} rows for {len(affected)} symbols: "
+		f"{len(incremental)} incrementally, {len(backfill)} from their first raw date."
+	)
+
+	return len(df)
@@ -0,0 +1,123 @@
+import numpy as np
+import pandas as pd
+
+# How OHLC bars are combined into coarser periods. Any other column keeps its last value in the
+# period, which is what the end-of-day indicators (rsi, macd, signal, betas) mean for that bar.
+# changePercent is summed so its cumulative sum still matches the daily one at every period end.
+OHLC_AGGREGATIONS = {
+	'open': 'first',
+	'high': 'max',
+	'low': 'min',
+	'close': 'last',
+	'adjClose': 'last',
+	'volume': 'sum',
+	'change': 'sum',
+	'changePercent': 'sum',
+}
+
+# Candle resolutions from finest to coarsest, as (period frequency, trading days per bar). None is daily.
+RESOLUTIONS = [(None, 1), ('W-FRI', 5), ('M', 21)]
+
+
+def choose_resolution(rows, budget):
+	# The finest resolution that draws at most budget bars, or the coarsest one if none does.
+	for rule, days_per_bar in RESOLUTIONS:
+		if rows / days_per_bar <= budget:
+			return rule
+	return RESOLUTIONS[-1][0]
+
+
+def resample_ohlc(df, rule, date_column='date'):
+	"""
+	Aggregates the daily rows of one symbol into weekly or monthly bars.
+
+	Args:
+		df (pd.DataFrame): Daily rows of a single symbol with a datetime date column.
+		rule (str): A pandas period frequency such as 'W-FRI' or 'M'. None returns df unchanged.
+		date_column (str, optional): The name of the date column.
+
+	Returns:
+		pd.DataFrame: One row per period, dated by the last trading day in it.
+	"""
+	if rule is None or df.empty:
+		return df
+
+	aggregations = {column: OHLC_AGGREGATIONS.get(column, 'last') for column in df.columns}
+	periods = df[date_column].dt.to_period(rule).to_numpy()
+
+	return df.groupby(periods, sort=True).agg(aggregations).reset_index(drop=True)
+
+
+def lttb_indices(x, y, threshold):
+	"""
+	Picks the points of a line to keep with the Largest-Triangle-Three-Buckets algorithm.
+
+	The first and last points are always kept. The points in between are split into threshold - 2
+	buckets, and each bucket keeps the point forming the largest triangle with the previously kept
+	point and the average of the next bucket, which preserves peaks and troughs.
+
+	Args:
+		x (array-like): Numeric x values in ascending order.
+		y (array-like): The y values. NaNs are only kept when a bucket has nothing else.
+		threshold (int): The number of points to keep.
+
+	Returns:
+		np.ndarray: The positions of the kept points, in ascending order.
+	"""
+	x = np.asarray(x, dtype='float64')
+	y = np.asarray(y, dtype='float64')
+	n = len(x)
+
+	if threshold >= n or threshold < 3:
+		return np.arange(n)
+
+	edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+	indices = np.empty(threshold, dtype=np.int64)
+	indices[0] = 0
+	indices[-1] = n - 1
+
+	# The triangles are anchored on the last kept point with a value, so an all-NaN bucket doesn't
+	# leave the next bucket's triangles without an area.
+	anchor = 0
+	for bucket in range(threshold - 2):
+		start, end = edges[bucket], edges[bucket + 1]
+		next_end = edges[bucket + 2] if bucket + 2 < len(edges) else n
+
+		next_x = x[end:next_end]
+		next_y = y[end:next_end]
+		valid = ~np.isnan(next_y)
+		avg_x = next_x.mean()
+		avg_y = next_y[valid].mean() if valid.any() else y[anchor]
+
+		area = np.abs((x[anchor] - avg_x) * (y[start:end] - y[anchor]) - (x[anchor] - x[start:end]) * (avg_y - y[anchor]))
+		area = np.where(np.isnan(area), -np.inf, area)
+
+		kept = start + int(np.argmax(area))
+		indices[bucket + 1] = kept
+		if not np.isnan(y[kept]):
+			anchor = kept
+
+	return indices
+
+
+def downsample(df, y_column, budget, x_column='date'):
+	"""
+	Reduces a line or area series to at most budget points with LTTB.
+
+	Args:
+		df (pd.DataFrame): The series, sorted by x_column.
+		y_column (str): The column plotted on the y axis.
+		budget (int): The maximum number of points to keep.
+		x_column (str, optional): The column plotted on the x axis; dates are compared as timestamps.
+
+	Returns:
+		pd.DataFrame: The kept rows of df, or df itself when it is already within budget.
+	"""
+	if len(df) <= budget:
+		return df
+
+	x = df[x_column]
+	if pd.api.types.is_datetime64_any_dtype(x):
+		x = x.to_numpy('datetime64[ns]').astype(np.int64)
+
+	return df.iloc[lttb_indices(x, df[y_column], budget)]
@@ -0,0 +1,128 @@
+import os
+import sqlite3
+import uuid
+from datetime import datetime, timezone
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+JOURNAL_PATH = os.getenv('RUN_JOURNAL_PATH', os.path.join(project_root, 'data', 'journal', 'runs.sqlite'))
+
+# Per-symbol statuses, in the order an ingestion run moves through them. 'empty' (the API had
+# no new rows) and 'enriched' (merged and preprocessed) are final; 'failed' is retried on resume.
+PENDING = 'pending'
+FETCHED = 'fetched'
+LOADED = 'loaded'
+MERGED = 'merged'
+ENRICHED = 'enriched'
+EMPTY = 'empty'
+FAILED = 'failed'
+
+FINAL_STATUSES = (ENRICHED, EMPTY)
+
+SCHEMA = """
+	CREATE TABLE IF NOT EXISTS runs (
+		run_id TEXT PRIMARY KEY,
+		shard_index INTEGER NOT NULL,
+		shard_count INTEGER NOT NULL,
+		status TEXT NOT NULL,
+		started_at TEXT NOT NULL,
+		finished_at TEXT
+	);
+	CREATE TABLE IF NOT EXISTS symbols (
+		run_id TEXT NOT NULL REFERENCES runs (run_id),
+		symbol TEXT NOT NULL,
+		from_date TEXT NOT NULL,
+		status TEXT NOT NULL,
+		error TEXT,
+		updated_at TEXT NOT NULL,
+		PRIMARY KEY (run_id, symbol)
+	);
+"""
+
+
+def now():
+	return datetime.now(timezone.utc).isoformat()
+
+
+class RunJournal:
+	"""
+	Records the progress of every ingestion run and symbol in a local SQLite file.
+
+	A run that stops partway (rate limit, network error, failed load) leaves its unfinished
+	symbols in the journal, so a later run can resume them instead of starting over.
+	Shards running in separate processes can share the file.
+
+	Args:
+		path (str, optional): The SQLite file. Defaults to RUN_JOURNAL_PATH or data/journal/runs.sqlite.
+	"""
+
+	def __init__(self, path=JOURNAL_PATH):
+		os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+		self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+		self.connection.execute('PRAGMA journal_mode=WAL')
+		self.connection.executescript(SCHEMA)
+
+	def start_run(self, api_lookup, shard_index=0, shard_count=1):
+		# Registers a run and its [symbol, from_date] pairs as pending; returns the new run_id.
+		run_id = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+		with self.connection:
+			self.connection.execute(
+				'INSERT INTO runs (run_id, shard_index, shard_count, status, started_at) VALUES (?, ?, ?, ?, ?)',
+				(run_id, shard_index, shard_count, 'running', now())
+			)
+			self.connection.executemany(
+				'INSERT INTO symbols (run_id, symbol, from_date, status, updated_at) VALUES (?, ?, ?, ?, ?)',
+				[(run_id, symbol, str(from_date), PENDING, now()) for symbol, from_date in api_lookup]
+			)
+		return run_id
+
+	def record(self, run_id, symbols, status, error=None):
+		# Moves the symbols to status, keeping the error message of failures.
+		with self.connection:
+			self.connection.executemany(
+				'UPDATE symbols SET status = ?, error = ?, updated_at = ? WHERE run_id = ? AND symbol = ?',
+				[(status, error, now(), run_id, symbol) for symbol in symbols]
+			)
+
+	def finish_run(self, run_id):
+		# A run is complete once every symbol reached a final status; otherwise it can be resumed.
+		status = 'complete' if not self.unfinished(run_id) else 'incomplete'
+		with self.connection:
+			self.connection.execute(
+				'UPDATE runs SET status = ?, finished_at = ? WHERE run_id = ?',
+				(status, now(), run_id)
+			)
+		return status
+
+	def latest_unfinished_run(self, shard_index=0, shard_count=1):
+		# The most recent run of this shard that didn't complete, or None.
+		row = self.connection.execute(
+			"""
+			SELECT run_id FROM runs
+			WHERE shard_index = ? AND shard_count = ? AND status != 'complete'
+			ORDER BY started_at DESC
+			LIMIT 1
+			""",
+			(shard_index, shard_count)
+		).fetchone()
+		return row[0] if row else None
+
+	def unfinished(self, run_id):
+		"""
+		Lists the symbols of a run that haven't reached a final status.
+
+		Args:
+			run_id (str): The run to inspect.
+
+		Returns:
+			dict: Maps each unfinished symbol to its (from_date, status).
+		"""
+		placeholders = ', '.join('?' for _ in FINAL_STATUSES)
+		rows = self.connection.execute(
+			f"SELECT symbol, from_date, status FROM symbols WHERE run_id = ? AND status NOT IN ({placeholders})",
+			(run_id, *FINAL_STATUSES)
+		).fetchall()
+		return {symbol: (from_date, status) for symbol, from_date, status in rows}
+
+	def close(self):
+		self.connection.close()
@@ -0,0 +1,54 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+# The dtype of the price and indicator columns of the dashboard's cached frames. float32 halves
+# their memory and keeps ~7 significant digits, well within what the charts and metrics show.
+# Set PRICE_FLOAT_DTYPE=float64 to keep full precision.
+FLOAT_DTYPE = os.getenv('PRICE_FLOAT_DTYPE', 'float32')
+
+CATEGORY_COLUMNS = ['symbol']
+DATE_COLUMNS = ['date']
+INTEGER_COLUMNS = ['volume']
+
+# Rows per symbol-year, for memory reports.
+SESSIONS_PER_YEAR = 252
+
+
+def compact_dtypes(df, float_dtype=FLOAT_DTYPE):
+	"""
+	Converts a price frame to the compact dtypes the dashboard keeps in memory.
+
+	symbol becomes a categorical, date a datetime64, volume an integer (nullable Int64 when it has
+	gaps) and every other float column float_dtype. Columns that are missing are skipped. Apply it
+	once, after the indicators and betas are computed, since they are calculated in float64.
+
+	Args:
+		df (pd.DataFrame): The frame to convert in place.
+		float_dtype (str, optional): The dtype of the float columns. Defaults to PRICE_FLOAT_DTYPE.
+
+	Returns:
+		pd.DataFrame: df, converted.
+	"""
+	for column in df.columns.intersection(CATEGORY_COLUMNS):
+		df[column] = df[column].astype('category')
+
+	for column in df.columns.intersection(DATE_COLUMNS):
+		df[column] = pd.to_datetime(df[column])
+
+	for column in df.columns.intersection(INTEGER_COLUMNS):
+		values = pd.to_numeric(df[column])
+		df[column] = values.astype('Int64' if values.isna().any() else np.int64)
+
+	for column in df.select_dtypes('float').columns:
+		df[column] = df[column].astype(float_dtype)
+
+	return df
+
+
+def memory_per_symbol_year(df):
+	# Bytes held per SESSIONS_PER_YEAR rows of one symbol, counting the contents of object columns.
+	if df.empty:
+		return 0.0
+	return df.memory_usage(deep=True).sum() / len(df) * SESSIONS_PER_YEAR
@@ -0,0 +1,202 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import numpy as np
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+TELEMETRY_DIR = os.getenv('TELEMETRY_DIR', os.path.join(project_root, 'data', 'telemetry'))
+
+METRIC_PREFIX = 'stocks_ingestion'
+
+# BigQuery job attributes recorded by record_job, by the name they are saved under.
+JOB_STATISTICS = {
+	'bytes_processed': 'total_bytes_processed',
+	'bytes_billed': 'total_bytes_billed',
+	'slot_millis': 'slot_millis',
+	'dml_affected_rows': 'num_dml_affected_rows',
+	'output_rows': 'output_rows',
+}
+
+
+class Telemetry:
+	"""
+	Collects timing spans and BigQuery job statistics for one ingestion run.
+
+	Spans are recorded per stage and, where it applies, per symbol. write() appends every span and
+	job plus a run summary to a JSON-lines file and rewrites a Prometheus textfile with the
+	per-stage totals, for node_exporter's textfile collector. Safe to use from several threads.
+
+	Args:
+		run_id (str, optional): Identifies the run in every record written. Can be set after spans were recorded.
+		labels (dict, optional): Extra Prometheus labels for every metric, e.g. {'shard': '0'}.
+		directory (str, optional): Where the files are written. Defaults to TELEMETRY_DIR.
+		name (str, optional): The base name of the files: <name>.jsonl and <name>.prom.
+		enabled (bool, optional): False turns every call into a no-op.
+	"""
+
+	def __init__(self, run_id=None, labels=None, directory=TELEMETRY_DIR, name='ingestion', enabled=True):
+		self.run_id = run_id or datetime.now().strftime('%Y%m%d_%H%M%S')
+		self.labels = labels or {}
+		self.directory = directory
+		self.name = name
+		self.enabled = enabled
+		self.spans = []
+		self.jobs = []
+		self.started = time.perf_counter()
+		self.lock = threading.Lock()
+
+	@contextmanager
+	def span(self, stage, symbol=None, **attributes):
+		# Times the block and records it under stage; exceptions are recorded and re-raised.
+		if not self.enabled:
+			yield
+			return
+
+		started_at = datetime.now(timezone.utc).isoformat()
+		start = time.perf_counter()
+		status, error = 'ok', None
+		try:
+			yield
+		except Exception as e:
+			status, error = 'error', str(e)
+			raise
+		finally:
+			record = {
+				'type': 'span', 'stage': stage, 'symbol': symbol,
+				'started_at': started_at, 'seconds': time.perf_counter() - start, 'status': status,
+			}
+			if error is not None:
+				record['error'] = error
+			record.update(attributes)
+			with self.lock:
+				self.spans.append(record)
+
+	def record_job(self, stage, job, symbol=None):
+		# Saves the statistics of a finished BigQuery query or load job.
+		if not self.enabled or job is None:
+			return
+
+		record = {'type': 'job', 'stage': stage, 'symbol': symbol, 'job_id': getattr(job, 'job_id', None)}
+		for name, attribute in JOB_STATISTICS.items():
+			value = getattr(job, attribute, None)
+			record[name] = int(value) if value is not None else None
+		with self.lock:
+			self.jobs.append(record)
+
+	def summary(self):
+		"""
+		Aggregates the spans and jobs recorded so far.
+
+		Returns:
+			dict: The run duration and, per stage, the span count, error count, total, p50, p95 and
+				  max seconds, and the sum of every job statistic.
+		"""
+		with self.lock:
+			spans = list(self.spans)
+			jobs = list(self.jobs)
+
+		stages = {}
+		seconds = defaultdict(list)
+		errors = defaultdict(int)
+		for span in spans:
+			seconds[span['stage']].append(span['seconds'])
+			errors[span['stage']] += span['status'] == 'error'
+
+		for stage, values in seconds.items():
+			stages[stage] = {
+				'count': len(values),
+				'errors': errors[stage],
+				'seconds_total': float(np.sum(values)),
+				'seconds_p50': float(np.percentile(values, 50)),
+				'seconds_p95': float(np.percentile(values, 95)),
+				'seconds_max': float(np.max(values)),
+			}
+
+		for job in jobs:
+			totals = stages.setdefault(job['stage'], {})
+			totals['jobs'] = totals.get('jobs', 0) + 1
+			for name in JOB_STATISTICS:
+				if job[name] is not None:
+					totals[name] = totals.get(name, 0) + job[name]
+
+		return {
+			'type': 'summary',
+			'run_id': self.run_id,
+			'labels': self.labels,
+			'finished_at': datetime.now(timezone.utc).isoformat(),
+			'seconds': time.perf_counter() - self.started,
+			'stages': stages,
+		}
+
+	def prometheus(self, summary):
+		# The summary in the Prometheus text exposition format.
+		def labels(**extra):
+			pairs = {**self.labels, **extra}
+			return '{' + ','.join(f'{key}="{value}"' for key, value in pairs.items()) + '}' if pairs else ''
+
+		metrics = [
+			('run_seconds', 'Duration of the last ingestion run.', [(labels(), summary['seconds'])]),
+			('last_run_timestamp_seconds', 'Unix time the last ingestion run finished.', [(labels(), time.time())]),
+		]
+
+		stage_metrics = [
+			('stage_seconds_total', 'Time spent in each stage of the last run.', 'seconds_total'),
+			('stage_seconds_p95', '95th percentile span duration of each stage in the last run.', 'seconds_p95'),
+			('stage_spans', 'Spans recorded for each stage in the last run.', 'count'),
+			('stage_errors', 'Failed spans of each stage in the last run.', 'errors'),
+			('bigquery_jobs', 'BigQuery jobs run by each stage in the last run.', 'jobs'),
+			('bigquery_bytes_processed', 'Bytes processed by the BigQuery jobs of each stage in the last run.', 'bytes_processed'),
+			('bigquery_bytes_billed', 'Bytes billed for the BigQuery jobs of each stage in the last run.', 'bytes_billed'),
+			('bigquery_slot_milliseconds', 'Slot milliseconds used by the BigQuery jobs of each stage in the last run.', 'slot_millis'),
+			('bigquery_dml_affected_rows', 'Rows changed by the DML statements of each stage in the last run.', 'dml_affected_rows'),
+			('bigquery_output_rows', 'Rows written by the load jobs of each stage in the last run.', 'output_rows'),
+		]
+		for metric, help_text, key in stage_metrics:
+			samples = [(labels(stage=stage), totals[key]) for stage, totals in summary['stages'].items() if key in totals]
+			if samples:
+				metrics.append((metric, help_text, samples))
+
+		lines = []
+		for metric, help_text, samples in metrics:
+			lines.append(f"# HELP {METRIC_PREFIX}_{metric} {help_text}")
+			lines.append(f"# TYPE {METRIC_PREFIX}_{metric} gauge")
+			lines.extend(f"{METRIC_PREFIX}_{metric}{label} {value}" for label, value in samples)
+		return '\n'.join(lines) + '\n'
+
+	def write(self):
+		"""
+		Appends the spans, jobs and run summary to <name>.jsonl and replaces <name>.prom.
+
+		Returns:
+			dict: The run summary.
+		"""
+		summary = self.summary()
+		if not self.enabled:
+			return summary
+
+		os.makedirs(self.directory, exist_ok=True)
+		with self.lock:
+			records = self.spans + self.jobs + [summary]
+
+		with open(os.path.join(self.directory, f"{self.name}.jsonl"), 'a') as f:
+			for record in records:
+				f.write(json.dumps({'run_id': self.run_id, **record}, default=str) + '\n')
+
+		# Written to a temporary file and renamed so the collector never reads a partial file.
+		fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.prom.tmp')
+		with os.fdopen(fd, 'w') as f:
+			f.write(self.prometheus(summary))
+		os.replace(tmp_path, os.path.join(self.directory, f"{self.name}.prom"))
+
+		logging.info(f"(Telemetry.write) Run {self.run_id}: " + ', '.join(
+			f"{stage} {totals.get('seconds_total', 0):.2f}s" for stage, totals in summary['stages'].items()
+		))
+		return summary
@@ -0,0 +1,170 @@
+# NYSE trading calendar, derived from the exchange's holiday rules without any network access.
+# Full-day closures only: early closes (e.g. the day after Thanksgiving) are regular sessions here.
+import pandas as pd
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+from zoneinfo import ZoneInfo
+
+EXCHANGE_TIMEZONE = ZoneInfo('America/New_York')
+# Regular close; a session's daily bar is final after it.
+SESSION_CLOSE = time(16, 0)
+
+# Unscheduled full-day closures that the holiday rules can't produce.
+SPECIAL_CLOSURES = [
+	date(2001, 9, 11), date(2001, 9, 12), date(2001, 9, 13), date(2001, 9, 14),  # September 11
+	date(2004, 6, 11),  # President Reagan's funeral
+	date(2007, 1, 2),  # President Ford's funeral
+	date(2012, 10, 29), date(2012, 10, 30),  # Hurricane Sandy
+	date(2018, 12, 5),  # President George H. W. Bush's funeral
+	date(2025, 1, 9),  # President Carter's funeral
+]
+
+
+def easter(year):
+	# Gregorian Easter Sunday (anonymous Gregorian algorithm).
+	a = year % 19
+	b, c = divmod(year, 100)
+	d, e = divmod(b, 4)
+	f = (b + 8) // 25
+	g = (b - f + 1) // 3
+	h = (19 * a + b - d - g + 15) % 30
+	i, k = divmod(c, 4)
+	l = (32 + 2 * e + 2 * i - h - k) % 7
+	m = (a + 11 * h + 22 * l) // 451
+	month, day = divmod(h + l - 7 * m + 114, 31)
+	return date(year, month, day + 1)
+
+
+def nth_weekday(year, month, weekday, n):
+	# The nth given weekday (Monday=0) of a month; n=-1 is the last one.
+	if n > 0:
+		first = date(year, month, 1)
+		return first + timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+	last = date(year, month + 1, 1) - timedelta(days=1) if month < 12 else date(year, 12, 31)
+	return last - timedelta(days=(last.weekday() - weekday) % 7)
+
+
+def observed(day):
+	# Saturday holidays are observed on the Friday before, Sunday holidays on the Monday after.
+	if day.weekday() == 5:
+		return day - timedelta(days=1)
+	if day.weekday() == 6:
+		return day + timedelta(days=1)
+	return day
+
+
+def year_holidays(year):
+	"""
+	Lists the NYSE holidays of one year.
+
+	Args:
+		year (int): The calendar year.
+
+	Returns:
+		list: The weekday dates on which the exchange is closed for a scheduled holiday.
+	"""
+	holidays = [
+		nth_weekday(year, 2, 0, 3),  # Washington's Birthday
+		easter(year) - timedelta(days=2),  # Good Friday
+		nth_weekday(year, 5, 0, -1),  # Memorial Day
+		observed(date(year, 7, 4)),  # Independence Day
+		nth_weekday(year, 9, 0, 1),  # Labor Day
+		nth_weekday(year, 11, 3, 4),  # Thanksgiving
+		observed(date(year, 12, 25)),  # Christmas
+	]
+
+	# A Saturday New Year's Day is not observed on the Friday before, which belongs to the previous year.
+	new_year = date(year, 1, 1)
+	if new_year.weekday() != 5:
+		holidays.append(observed(new_year))
+
+	if year >= 1998:
+		holidays.append(nth_weekday(year, 1, 0, 3))  # Martin Luther King Jr. Day
+
+	if year >= 2022:
+		holidays.append(observed(date(year, 6, 19)))  # Juneteenth
+
+	return sorted(holidays)
+
+
+@lru_cache(maxsize=None)
+def _closures(start_year, end_year):
+	closures = [day for year in range(start_year, end_year + 1) for day in year_holidays(year)]
+	closures += [day for day in SPECIAL_CLOSURES if start_year <= day.year <= end_year]
+	return tuple(sorted(closures))
+
+
+def as_date(value):
+	# Accepts date, datetime, pd.Timestamp or 'YYYY-MM-DD'.
+	if isinstance(value, str):
+		return datetime.strptime(value[:10], '%Y-%m-%d').date()
+	if isinstance(value, datetime):
+		return value.date()
+	return value
+
+
+def closures_between(start, end):
+	"""
+	Lists the weekdays between start and end (inclusive) on which the exchange is closed.
+
+	Args:
+		start: The first date.
+		end: The last date.
+
+	Returns:
+		list: The closed weekdays, in ascending order.
+	"""
+	start, end = as_date(start), as_date(end)
+	return [day for day in _closures(start.year, end.year) if start <= day <= end]
+
+
+def trading_days(start, end):
+	"""
+	Lists the NYSE sessions between start and end, inclusive.
+
+	Args:
+		start: The first date.
+		end: The last date.
+
+	Returns:
+		pd.DatetimeIndex: The session dates.
+	"""
+	start, end = as_date(start), as_date(end)
+	if start > end:
+		return pd.DatetimeIndex([])
+	return pd.bdate_range(start, end, freq='C', holidays=closures_between(start, end))
+
+
+def is_trading_day(day):
+	day = as_date(day)
+	return day.weekday() < 5 and day not in closures_between(day, day)
+
+
+def last_session(as_of=None):
+	# The most recent session on or before as_of (today by default).
+	day = as_date(as_of) if as_of is not None else date.today()
+	while not is_trading_day(day):
+		day -= timedelta(days=1)
+	return day
+
+
+def last_completed_session(now=None):
+	# The most recent session whose close has passed, in New York time (now by default).
+	now = datetime.now(EXCHANGE_TIMEZONE) if now is None else now.astimezone(EXCHANGE_TIMEZONE)
+	day = now.date()
+	if not is_trading_day(day) or now.time() < SESSION_CLOSE:
+		day -= timedelta(days=1)
+	return last_session(day)
+
+
+def next_session(day):
+	# The first session after day.
+	day = as_date(day) + timedelta(days=1)
+	while not is_trading_day(day):
+		day += timedelta(days=1)
+	return day
+
+
+def session_count(start, end):
+	# The number of sessions between start and end, inclusive: the rows a complete daily history has.
+	return len(trading_days(start, end))
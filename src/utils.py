@@ -0,0 +1,150 @@
+import logging
+import pyarrow as pa
+import threading
+import time
+import random
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+
+
+# Arrow types matching the BigQuery column types used by the load jobs.
+ARROW_TYPES = {
+	'STRING': pa.string(),
+	'DATE': pa.date32(),
+	'FLOAT': pa.float64(),
+	'INTEGER': pa.int64(),
+	'TIMESTAMP': pa.timestamp('us', tz='UTC'),
+}
+
+
+def arrow_schema(bigquery_schema):
+	# The Arrow equivalent of a list of bigquery.SchemaField.
+	return pa.schema([pa.field(field.name, ARROW_TYPES[field.field_type]) for field in bigquery_schema])
+
+
+class RateLimiter:
+	"""
+	Thread-safe token bucket that limits calls to a fixed number per minute.
+
+	Args:
+		requests_per_minute (int): The sustained number of calls allowed per minute.
+		burst (int, optional): The maximum number of calls that can be made back to back.
+							   Defaults to requests_per_minute / 60, i.e. one second's worth of calls.
+	"""
+
+	def __init__(self, requests_per_minute, burst=None):
+		self.rate = requests_per_minute / 60.0
+		self.capacity = max(1.0, burst if burst is not None else self.rate)
+		self.tokens = self.capacity
+		self.updated = time.monotonic()
+		self.lock = threading.Lock()
+
+	def acquire(self):
+		# Block until a token is available, then consume it.
+		while True:
+			with self.lock:
+				now = time.monotonic()
+				self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+				self.updated = now
+
+				if self.tokens >= 1:
+					self.tokens -= 1
+					return
+
+				wait = (1 - self.tokens) / self.rate
+
+			time.sleep(wait)
+
+
+def backoff_delay(attempt, base=2, cap=60):
+	# Exponential backoff with full jitter: a random delay between 0 and base * 2^attempt seconds.
+	return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def parse_retry_after(value):
+	"""
+	Parses a Retry-After header into a number of seconds.
+
+	Args:
+		value (str): The header value, either a number of seconds or an HTTP date.
+
+	Returns:
+		float: The number of seconds to wait, or None if the header is missing or malformed.
+	"""
+	if not value:
+		return None
+
+	try:
+		return max(0.0, float(value))
+	except ValueError:
+		pass
+
+	try:
+		retry_at = parsedate_to_datetime(value)
+	except (TypeError, ValueError):
+		return None
+
+	if retry_at.tzinfo is None:
+		retry_at = retry_at.replace(tzinfo=timezone.utc)
+
+	return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+def query_to_dataframe(client, query_string, job_config=None):
+	"""
+	Runs a BigQuery query and materialises the result through Arrow.
+
+	Large results are downloaded with the BigQuery Storage Read API when the
+	google-cloud-bigquery-storage package is installed and the caller has access to it.
+	Otherwise the REST API is used. Either way the rows arrive as typed Arrow columns
+	instead of one Python dict per row.
+
+	Args:
+		client (bigquery.Client): The client used to run the query.
+		query_string (str): The SQL to run.
+		job_config (bigquery.QueryJobConfig, optional): Parameters and options for the query.
+
+	Returns:
+		pd.DataFrame: The query result. DATE columns hold datetime.date objects.
+	"""
+	query_job = client.query(query_string, job_config=job_config)
+
+	try:
+		table = query_job.result().to_arrow(create_bqstorage_client=True)
+	except Exception as e:
+		logging.warning(f"BigQuery Storage Read API unavailable, falling back to REST: {e}")
+		table = query_job.result().to_arrow(create_bqstorage_client=False)
+
+	return table.to_pandas()
+
+
+def is_concurrent_update(error):
+	# BigQuery aborts one of two DML statements that modify the same table at the same time.
+	message = str(error)
+	return 'concurrent update' in message or 'Could not serialize access' in message
+
+
+def run_dml(client, query_string, job_config=None, max_retries=5):
+	"""
+	Runs a DML statement, retrying it when it conflicts with a concurrent MERGE on the same table.
+
+	Args:
+		client (bigquery.Client): The client used to run the statement.
+		query_string (str): The DML to run.
+		job_config (bigquery.QueryJobConfig, optional): Parameters and options for the statement.
+		max_retries (int, optional): The number of retries after a conflict.
+
+	Returns:
+		bigquery.QueryJob: The finished job, with its statistics (num_dml_affected_rows, slot_millis, ...).
+	"""
+	for attempt in range(max_retries + 1):
+		try:
+			job = client.query(query_string, job_config=job_config)
+			job.result()
+			return job
+		except Exception as e:
+			if attempt == max_retries or not is_concurrent_update(e):
+				raise
+			delay = backoff_delay(attempt)
+			logging.warning(f"DML conflicted with a concurrent update, retrying in {delay:.1f} seconds: {e}")
+			time.sleep(delay)
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# Add the project root to the system path
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+if project_root not in sys.path:
+	sys.path.append(project_root)
@@ -0,0 +1,42 @@
+import time
+
+import pytest
+import requests
+
+from benchmarks.stub_fmp_server import StubFMPServer
+from src.data_ingestion import fetch_all, retrieve_data
+
+
+def test_429_is_retried_after_retry_after():
+	with StubFMPServer(throttle_every=2, retry_after=1, days=5) as server:
+		retrieve_data('stub', 'AAA', '2024-01-02', delay=0, base_url=server.base_url)
+
+		# The second request is throttled; with no backoff of its own, the retry waits for Retry-After.
+		start = time.perf_counter()
+		data = retrieve_data('stub', 'BBB', '2024-01-02', delay=0, base_url=server.base_url)
+		elapsed = time.perf_counter() - start
+
+	assert data['symbol'] == 'BBB'
+	assert server.request_count == 3
+	assert elapsed >= 1
+
+
+def test_other_4xx_is_raised_without_retrying():
+	with StubFMPServer(errors={'BAD': 401}) as server:
+		with pytest.raises(requests.exceptions.HTTPError):
+			retrieve_data('stub', 'BAD', '2024-01-02', delay=0, base_url=server.base_url)
+
+	assert server.request_count == 1
+
+
+def test_fetch_all_is_bound_by_the_rate_limit():
+	# 1,200 requests per minute is 20 per second with a burst of 20, so 40 symbols take at least a second.
+	api_lookup = [[f"SYM{i}", '2024-01-02'] for i in range(40)]
+	with StubFMPServer(days=5) as server:
+		start = time.perf_counter()
+		results = fetch_all('stub', api_lookup, max_workers=8, requests_per_minute=1200, base_url=server.base_url)
+		elapsed = time.perf_counter() - start
+
+	assert all(isinstance(result, dict) for result in results.values())
+	assert len(results) == 40
+	assert 0.95 <= elapsed < 5
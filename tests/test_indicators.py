@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+
+from benchmarks.bench_indicators import INDICATOR_COLUMNS, add_metrics_loop, price_frame
+from src.indicators import BENCHMARK_SYMBOL, BETA_WINDOWS, add_metrics, advance_metrics, calculate_beta, check_incremental, indicator_state
+
+
+def test_advance_metrics_matches_a_full_recompute():
+	df = price_frame(3, 300)
+	split_date = sorted(df['date'].unique())[249]
+
+	consistent, differences = check_incremental(df, split_date)
+
+	assert consistent, differences
+
+
+def test_advance_metrics_state_chains_across_refreshes():
+	# Advancing one day at a time from the persisted state ends where indicator_state of the full history does.
+	df = price_frame(2, 120)
+	dates = sorted(df['date'].unique())
+	state = indicator_state(df.loc[df['date'] <= dates[99]])
+	for day in dates[100:]:
+		rows, state = advance_metrics(df.loc[df['date'] == day], state)
+		assert len(rows) == 2
+
+	expected = indicator_state(df)
+	columns = ['close', 'averageGain', 'averageLoss', 'emaFast', 'emaSlow', 'signal']
+	np.testing.assert_allclose(state.sort_values('symbol')[columns], expected.sort_values('symbol')[columns], atol=1e-8)
+	assert (pd.to_datetime(state['date']) == pd.Timestamp(dates[-1])).all()
+
+
+def test_advance_metrics_starts_new_symbols_like_add_metrics():
+	df = price_frame(2, 60)
+	state = indicator_state(df.loc[df['symbol'] == 'SYM0'])
+	rows, _ = advance_metrics(df.loc[df['symbol'] == 'SYM1'], state)
+
+	expected = add_metrics(df.loc[df['symbol'] == 'SYM1'].copy())
+	np.testing.assert_allclose(rows['rsi'], expected['rsi'].to_numpy(), equal_nan=True)
+	np.testing.assert_allclose(rows['macdHist'], expected['macdHist'].to_numpy(), atol=1e-10)
+
+
+def test_add_metrics_matches_the_per_symbol_loop():
+	# Shuffled, so the vectorised pass has to sort by symbol and date itself.
+	df = price_frame(4, 80).sample(frac=1, random_state=0)
+
+	pd.testing.assert_frame_equal(
+		add_metrics_loop(df.copy()).sort_index()[INDICATOR_COLUMNS],
+		add_metrics(df.copy()).sort_index()[INDICATOR_COLUMNS],
+	)
+
+
+def rolling_beta_loop(df):
+	# The previous implementation, for every window: a rolling cov / var per symbol, back-filled.
+	benchmark = df.loc[df['symbol'] == BENCHMARK_SYMBOL].set_index('date')['changePercent']
+	results = []
+	for _, group in df.groupby('symbol'):
+		group = group.sort_values('date')
+		joined = group[['date', 'changePercent']].set_index('date').join(benchmark, rsuffix='_sp')
+		for window, column in BETA_WINDOWS.items():
+			beta = joined['changePercent'].rolling(window).cov(joined['changePercent_sp']) / joined['changePercent_sp'].rolling(window).var()
+			group[column] = beta.bfill().to_numpy()
+		results.append(group)
+	return pd.concat(results)
+
+
+def test_calculate_beta_matches_the_rolling_loop():
+	df = price_frame(3, 300)
+	benchmark = price_frame(1, 300)
+	benchmark['symbol'] = BENCHMARK_SYMBOL
+	df = add_metrics(pd.concat([df, benchmark], ignore_index=True))
+	df['date'] = pd.to_datetime(df['date'])
+	# A missing benchmark day: the windows covering it take the next full window's beta.
+	df = df.drop(df.loc[df['symbol'] == BENCHMARK_SYMBOL].index[150])
+
+	expected = rolling_beta_loop(df.copy()).sort_index()
+	actual = calculate_beta(df.copy()).sort_index()
+
+	for column in BETA_WINDOWS.values():
+		np.testing.assert_allclose(actual[column], expected[column], rtol=1e-7, atol=1e-10, equal_nan=True, err_msg=column)
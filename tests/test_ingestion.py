@@ -0,0 +1,89 @@
+from datetime import date
+
+import pandas as pd
+
+from benchmarks.fake_bigquery import FakeBigQueryClient
+from benchmarks.stub_fmp_server import StubFMPServer
+from benchmarks.synthetic import historical_payload, historical_rows
+from src.data_ingestion import merge_table, process_data_batch
+
+TARGET_TABLE_REF = 'test.stock_data.raw_stock_data'
+
+
+class RecordingClient(FakeBigQueryClient):
+	# Keeps every statement and its parameters.
+	def __init__(self, tables=None):
+		super().__init__(tables)
+		self.statements = []
+
+	def query(self, query_string, job_config=None):
+		parameters = {parameter.name: getattr(parameter, 'values', None) or getattr(parameter, 'value', None)
+					  for parameter in getattr(job_config, 'query_parameters', None) or []}
+		self.statements.append((query_string, parameters))
+		return super().query(query_string, job_config)
+
+
+def ingest(payloads, client=None):
+	client = client or FakeBigQueryClient()
+	api_lookup = [[symbol, '2024-01-02'] for symbol in payloads]
+	with StubFMPServer(payloads=payloads) as server:
+		summary = process_data_batch('stub', api_lookup, client, 'test', TARGET_TABLE_REF, base_url=server.base_url)
+	return summary, client.tables.get(TARGET_TABLE_REF)
+
+
+def test_malformed_symbols_fail_alone():
+	good = historical_payload('GOOD', days=5)
+	string_price = historical_payload('TEXT', days=5)
+	string_price['historical'][0]['close'] = 'n/a'
+	no_date = historical_payload('NODATE', days=5)
+	no_date['historical'][0]['date'] = None
+
+	summary, table = ingest({'GOOD': good, 'TEXT': string_price, 'NODATE': no_date})
+
+	assert summary['loaded'] == ['GOOD']
+	assert set(summary['failed']) == {'TEXT', 'NODATE'}
+	assert set(table['symbol']) == {'GOOD'}
+	assert len(table) == 5
+
+
+def test_duplicate_dates_keep_the_last_row():
+	payload = historical_payload('DUP', days=5)
+	duplicate = dict(payload['historical'][0], close=123.0)
+	payload['historical'].append(duplicate)
+
+	summary, table = ingest({'DUP': payload})
+
+	assert summary['loaded'] == ['DUP']
+	assert len(table) == 5
+	assert table.loc[table['date'].astype(str) == duplicate['date'], 'close'].tolist() == [123.0]
+
+
+def test_merge_is_pruned_to_the_staged_symbols_and_dates():
+	payloads = {symbol: historical_payload(symbol, start='2024-03-04', days=10) for symbol in ['AAA', 'BBB']}
+	client = RecordingClient()
+
+	summary, _ = ingest(payloads, client)
+
+	merges = [(query, parameters) for query, parameters in client.statements if query.lstrip().startswith('MERGE')]
+	assert summary['loaded'] == ['AAA', 'BBB']
+	assert len(merges) == 1
+	query, parameters = merges[0]
+	assert 'target.symbol IN UNNEST(@symbols)' in query
+	assert 'target.date BETWEEN @start_date AND @end_date' in query
+	assert parameters == {'symbols': ['AAA', 'BBB'], 'start_date': date(2024, 3, 4), 'end_date': date(2024, 3, 15)}
+
+
+def historical_rows_frame():
+	df = pd.DataFrame(historical_rows('AAA', days=3))
+	df['symbol'] = 'AAA'
+	return df
+
+
+def test_merge_without_pruning_parameters():
+	client = RecordingClient({'source': historical_rows_frame()})
+
+	merge_table(client, 'target', 'source')
+
+	query, parameters = client.statements[0]
+	assert '@symbols' not in query and '@start_date' not in query
+	assert parameters == {}
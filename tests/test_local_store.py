@@ -0,0 +1,62 @@
+from datetime import date, datetime, timedelta
+from types import SimpleNamespace
+
+import pandas as pd
+
+import src.local_store as local_store
+
+COLUMNS = ['symbol', 'date', 'timestamp', 'value']
+
+
+def stamp(day, hour):
+	return pd.Timestamp(f'2024-03-{day:02d} {hour:02d}:00', tz='UTC')
+
+
+class TableDouble:
+	"""Answers sync_replica's metadata lookups and queries from an in-memory table."""
+
+	def __init__(self, rows):
+		self.rows = rows
+		self.version = 0
+
+	def get_table(self, table_ref):
+		return SimpleNamespace(modified=datetime(2024, 1, 1) + timedelta(minutes=self.version), num_rows=len(self.rows))
+
+	def changed(self, since):
+		return self.rows[self.rows['timestamp'] > pd.Timestamp(since)]
+
+	def earliest_change(self, client, table_ref, since, watermark_column='timestamp', date_column='date'):
+		changed = self.changed(since)
+		return None if changed.empty else changed['date'].min()
+
+	def query_rows(self, client, table_ref, columns, where=None, query_parameters=None):
+		if where is None:
+			return self.rows.copy()
+		params = {p.name: p.value for p in query_parameters}
+		recent = self.changed(pd.Timestamp(params['watermark']) - timedelta(minutes=params['overlap']))
+		rows = self.rows[self.rows.index.isin(recent.index) | (self.rows['date'] > params['max_date'])]
+		return rows[rows['date'] >= params['since']].copy()
+
+
+def test_sync_replica_picks_up_rows_rewritten_before_the_lookback(tmp_path, monkeypatch):
+	days = [date(2024, 1, 2) + timedelta(days=i) for i in range(60)]
+	table = TableDouble(pd.DataFrame({
+		'symbol': 'AAPL',
+		'date': days,
+		'timestamp': stamp(1, 12),
+		'value': 1.0,
+	}))
+	monkeypatch.setattr(local_store, 'CACHE_DIR', str(tmp_path))
+	monkeypatch.setattr(local_store, 'query_rows', table.query_rows)
+	monkeypatch.setattr(local_store, 'earliest_change', table.earliest_change)
+
+	assert local_store.sync_replica(table, 't', 'enriched', COLUMNS) == 60
+
+	# A recompute rewrites the oldest rows a day later without changing the row count.
+	table.rows.loc[:9, ['timestamp', 'value']] = [stamp(2, 12), 2.0]
+	table.version += 1
+
+	assert local_store.sync_replica(table, 't', 'enriched', COLUMNS, lookback_days=7, overlap_minutes=0) == 10
+	replica = local_store.read_replica('enriched')
+	assert replica['value'].tolist() == [2.0] * 10 + [1.0] * 50
+
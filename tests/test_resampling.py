@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+
+from benchmarks.bench_indicators import price_frame
+from src.resampling import choose_resolution, downsample, lttb_indices, resample_ohlc
+
+
+def daily_frame(days=120):
+	df = price_frame(1, days).sort_values('date').reset_index(drop=True)
+	df['date'] = pd.to_datetime(df['date'])
+	return df
+
+
+def test_lttb_keeps_the_ends_and_the_extremes():
+	x = np.arange(1000)
+	y = np.sin(x / 50)
+	y[437] = 10
+	y[712] = -10
+
+	indices = lttb_indices(x, y, 100)
+
+	assert len(indices) == 100
+	assert indices[0] == 0 and indices[-1] == 999
+	assert (np.diff(indices) > 0).all()
+	assert {437, 712} <= set(indices)
+
+
+def test_lttb_skips_nans_and_short_series():
+	y = np.arange(100, dtype=float)
+	y[10:20] = np.nan
+	indices = lttb_indices(np.arange(100), y, 20)
+	# Only the bucket lying entirely inside the gap, positions 11 to 16, has nothing else to keep.
+	assert np.isnan(y[indices]).sum() == 1
+
+	assert (lttb_indices(np.arange(5), np.arange(5), 10) == np.arange(5)).all()
+
+
+def test_downsample_respects_the_budget():
+	df = daily_frame(600)
+
+	assert downsample(df, 'close', 1000) is df
+	assert len(downsample(df, 'close', 100)) == 100
+
+
+def test_resample_ohlc_weekly_bars():
+	df = daily_frame()
+	weekly = resample_ohlc(df, 'W-FRI')
+	week = df.loc[df['date'].dt.to_period('W-FRI') == df['date'].dt.to_period('W-FRI').iloc[0]]
+
+	assert len(weekly) == df['date'].dt.to_period('W-FRI').nunique()
+	first = weekly.iloc[0]
+	assert first['date'] == week['date'].iloc[-1]
+	assert first['open'] == week['open'].iloc[0]
+	assert first['close'] == week['close'].iloc[-1]
+	assert first['high'] == week['high'].max()
+	assert first['low'] == week['low'].min()
+	assert first['volume'] == week['volume'].sum()
+	assert np.isclose(weekly['changePercent'].sum(), df['changePercent'].sum())
+
+
+def test_choose_resolution():
+	assert choose_resolution(250, 500) is None
+	assert choose_resolution(1250, 500) == 'W-FRI'
+	assert choose_resolution(5000, 500) == 'M'
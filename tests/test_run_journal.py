@@ -0,0 +1,39 @@
+from src.run_journal import EMPTY, ENRICHED, FAILED, MERGED, PENDING, RunJournal
+
+
+def test_start_record_unfinished_finish(tmp_path):
+	journal = RunJournal(str(tmp_path / 'runs.sqlite'))
+	run_id = journal.start_run([['AAPL', '2024-01-02'], ['MSFT', '2024-01-03'], ['GOOG', '2024-01-04']])
+
+	assert journal.unfinished(run_id) == {
+		'AAPL': ('2024-01-02', PENDING),
+		'MSFT': ('2024-01-03', PENDING),
+		'GOOG': ('2024-01-04', PENDING),
+	}
+
+	journal.record(run_id, ['AAPL'], ENRICHED)
+	journal.record(run_id, ['MSFT'], EMPTY)
+	journal.record(run_id, ['GOOG'], FAILED, 'HTTP 429')
+
+	assert journal.unfinished(run_id) == {'GOOG': ('2024-01-04', FAILED)}
+	assert journal.finish_run(run_id) == 'incomplete'
+	assert journal.latest_unfinished_run() == run_id
+
+	journal.record(run_id, ['GOOG'], MERGED)
+	journal.record(run_id, ['GOOG'], ENRICHED)
+
+	assert journal.unfinished(run_id) == {}
+	assert journal.finish_run(run_id) == 'complete'
+	assert journal.latest_unfinished_run() is None
+	journal.close()
+
+
+def test_latest_unfinished_run_is_per_shard(tmp_path):
+	journal = RunJournal(str(tmp_path / 'runs.sqlite'))
+	first = journal.start_run([['AAPL', '2024-01-02']], shard_index=0, shard_count=2)
+	second = journal.start_run([['MSFT', '2024-01-02']], shard_index=1, shard_count=2)
+
+	assert journal.latest_unfinished_run(0, 2) == first
+	assert journal.latest_unfinished_run(1, 2) == second
+	assert journal.latest_unfinished_run(0, 1) is None
+	journal.close()
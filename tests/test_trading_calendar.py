@@ -0,0 +1,52 @@
+from datetime import date, datetime, timezone
+from zoneinfo import ZoneInfo
+
+import pytest
+
+import src.data_ingestion as data_ingestion
+from src.trading_calendar import is_trading_day, last_completed_session, last_session, next_session, session_count
+
+
+@pytest.mark.parametrize('year, sessions', [(2023, 250), (2024, 252), (2025, 250)])
+def test_session_count_per_year(year, sessions):
+	assert session_count(date(year, 1, 1), date(year, 12, 31)) == sessions
+
+
+@pytest.mark.parametrize('day', [
+	date(2023, 1, 2),  # New Year's Day observed on Monday
+	date(2024, 3, 29),  # Good Friday
+	date(2024, 6, 19),  # Juneteenth
+	date(2025, 1, 9),  # President Carter's funeral
+	date(2025, 7, 4),  # Independence Day
+])
+def test_closures(day):
+	assert not is_trading_day(day)
+
+
+def test_last_and_next_session_skip_closures():
+	assert last_session(date(2024, 7, 7)) == date(2024, 7, 5)
+	assert next_session(date(2024, 7, 3)) == date(2024, 7, 5)
+
+
+def test_last_completed_session_waits_for_the_new_york_close():
+	new_york = ZoneInfo('America/New_York')
+	assert last_completed_session(datetime(2024, 7, 3, 15, 59, tzinfo=new_york)) == date(2024, 7, 2)
+	assert last_completed_session(datetime(2024, 7, 3, 16, 0, tzinfo=new_york)) == date(2024, 7, 3)
+	assert last_completed_session(datetime(2024, 7, 6, 12, 0, tzinfo=new_york)) == date(2024, 7, 5)
+
+
+def test_last_completed_session_follows_daylight_saving_time():
+	# 20:30 UTC is 16:30 in New York in summer but 15:30 in winter.
+	assert last_completed_session(datetime(2024, 3, 11, 20, 30, tzinfo=timezone.utc)) == date(2024, 3, 11)
+	assert last_completed_session(datetime(2024, 1, 8, 20, 30, tzinfo=timezone.utc)) == date(2024, 1, 5)
+
+
+def test_create_api_lookup_skips_symbols_holding_the_last_completed_session(monkeypatch):
+	monkeypatch.setattr(data_ingestion, 'last_completed_session', lambda: date(2024, 7, 5))
+	api_lookup = data_ingestion.create_api_lookup([
+		{'symbol': 'DONE', 'date': date(2024, 7, 5)},
+		{'symbol': 'BEHIND', 'date': date(2024, 7, 3)},
+		{'symbol': 'NEW', 'date': None},
+	])
+
+	assert api_lookup == [['BEHIND', '2024-07-05'], ['NEW', '2024-11-19']]